@@ -1,26 +1,58 @@
+import atexit
+import gzip
+import hashlib
 import json
+import multiprocessing
 import os
 import re
+import socket
 import threading
 import time
 import uuid
+from collections import OrderedDict
+from itertools import count
+from bisect import bisect_left
 from io import BytesIO
 from pathlib import Path
-from queue import Queue
+from typing import Callable, Iterator, Optional
 
 from flask import Flask, Response, jsonify, render_template, request, send_file
 from openpyxl import Workbook
 
 from ozon_check import (
+    AMBIGUOUS_SELLER_NAMES,
+    DEFAULT_TABS,
     CheckResult,
     check_current_page,
     check_url,
+    check_urls_in_tabs,
     collect_search_urls,
     expand_seller_aliases,
+    is_ozon_seller,
+    is_product_url,
+    normalize_block_profile,
     normalize_text,
+    product_key,
+    product_sku,
+    seller_matches_filter,
 )
+from driver_pool import DriverPool
+from http_check import CHECK_ENGINE, ENGINES, check_url_http, iter_http_checks
+from result_cache import ResultCache, normalize_max_age
+from search_cache import SEARCH_REUSE_SEC, SearchCache, SearchCrawl
+from history_writer import HistoryWriter
+from job_history import JobHistory
+from job_store import SCHEDULER_LEASE_SEC, create_job_store
+from job_state import JobExpiry, PendingUrls
+from search_pipeline import PIPELINE_ENABLED, SearchPipeline
+from worker_pool import CheckWorkers
 from ts import list_ts_configs, get_ts_config, load_ts_presets
 
+try:
+    import brotli
+except ImportError:  # необязательная зависимость: без неё отдаём gzip
+    brotli = None
+
 BASE_DIR = Path(__file__).resolve().parent
 
 app = Flask(
@@ -29,14 +61,80 @@ app = Flask(
     static_folder=str(BASE_DIR / "static"),
 )
 
-JOB_QUEUE: "Queue[str]" = Queue()
 JOB_LOCK = threading.Lock()
 JOBS: dict[str, dict] = {}
+JOB_EXPIRY = JobExpiry()
+# Задачи, которые выполняет планировщик этого процесса, — по ссылке воркера. Из JOBS
+# завершённую (или остановленную) задачу может вытеснить prune_jobs, а синхронизация
+# с хранилищем идёт до финальной записи.
+OWNED_JOBS: dict[str, dict] = {}
+# Номера изменений задач (результаты, очередь, ссылки поиска) — общие на процесс, только растут.
+JOB_CHANGES = count(1)
+# Прежний файл истории (одним JSONL): при первом обращении переносится в сегменты JobHistory.
 JOB_HISTORY_FILE = Path(os.getenv("OZON_JOB_HISTORY_FILE", str(BASE_DIR / "job_history.jsonl")))
 MAX_JOBS = int(os.getenv("OZON_MAX_JOBS", "50"))
 JOB_TTL_SEC = int(os.getenv("OZON_JOB_TTL_SEC", "21600"))
 DEFAULT_TS_ID = "ozon_tecno"
 DEBUG_WEB = os.getenv("OZON_WEB_DEBUG", "1") == "1"
+# off — не смотреть бейджи плиток, on — подтверждать по плитке, strict — ещё и пропускать плитки без бейджей.
+TILE_SCREENING = os.getenv("OZON_TILE_SCREENING", "off")
+TILE_SCREENING_MODES = ("off", "on", "strict")
+RESULTS_PAGE_LIMIT = int(os.getenv("OZON_RESULTS_PAGE_LIMIT", "500"))
+RESULTS_MAX_LIMIT = 5000
+SSE_POLL_SEC = float(os.getenv("OZON_SSE_POLL_SEC", "0.5"))
+SSE_HEARTBEAT_SEC = float(os.getenv("OZON_SSE_HEARTBEAT_SEC", "15"))
+SSE_RETRY_MS = 3000
+# Очередь ссылок в статусе и потоке отдаём только головой — целиком её приносит GET /jobs/<id>/pending.
+SSE_PENDING_LIMIT = int(os.getenv("OZON_SSE_PENDING_LIMIT", "200"))
+COMPRESS_MIN_BYTES = int(os.getenv("OZON_COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_LEVEL = int(os.getenv("OZON_COMPRESS_LEVEL", "6"))
+BROTLI_QUALITY = 5
+COMPRESS_MIMETYPES = (
+    "application/json",
+    "text/csv",
+    "text/html",
+    "text/css",
+    "text/javascript",
+    "application/javascript",
+)
+DRIVER_POOL = DriverPool()
+atexit.register(DRIVER_POOL.shutdown)
+CHECK_WORKERS = CheckWorkers()
+atexit.register(CHECK_WORKERS.shutdown)
+RESULT_CACHE = ResultCache()
+atexit.register(RESULT_CACHE.close)
+SEARCH_CACHE = SearchCache()
+atexit.register(SEARCH_CACHE.close)
+
+JOB_HISTORY = JobHistory(legacy_file=JOB_HISTORY_FILE)
+atexit.register(JOB_HISTORY.close)
+# Последние открытые задачи из истории: распакованная запись и индекс вердиктов, чтобы
+# листание страниц не распаковывало запись заново. Ключ — задача, проверка — место записи.
+HISTORY_CACHE_JOBS = int(os.getenv("OZON_HISTORY_CACHE_JOBS", "8"))
+HISTORY_CACHE: OrderedDict[str, tuple[tuple[str, int, int], dict, dict]] = OrderedDict()
+HISTORY_CACHE_LOCK = threading.Lock()
+HISTORY_WRITER = HistoryWriter(JOB_HISTORY)
+atexit.register(HISTORY_WRITER.close)
+JOB_STORE = create_job_store()
+atexit.register(JOB_STORE.close)
+# 0 — процесс только принимает запросы, задачи выполняет планировщик в другом процессе.
+SCHEDULER_ENABLED = os.getenv("OZON_SCHEDULER", "1") == "1"
+SCHEDULER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+SCHEDULER_ACTIVE = threading.Event()
+WORKER_THREAD: Optional[threading.Thread] = None
+WORKER_LOCK = threading.Lock()
+JOB_SYNC_SEC = float(os.getenv("OZON_JOB_SYNC_SEC", "1"))
+JOB_STORE_PRUNE_SEC = 60
+# Поля задачи, которых нет в записи хранилища: результаты лежат отдельно, индекс и выгрузки строятся заново.
+JOB_RUNTIME_FIELDS = ("results", "verdict_index", "exports")
+JOB_SET_FIELDS = ("tested_urls",)
+# Списки ссылок хранятся строками и дописываются по мере роста (url_changes), проверенные
+# карточки — отметками "tested"; в запись задачи не попадают, иначе она растёт со списками.
+JOB_URL_FIELDS = ("urls", "search_urls", "pending_urls")
+# Что из списков нужно копии задачи в процессе без планировщика.
+JOB_VIEW_URL_FIELDS = ("search_urls", "pending_urls")
+# Контрольные точки из воркера и из store_loop идут по очереди: позиции новых строк считаются от прошлой записи.
+JOB_CHECKPOINT_LOCK = threading.Lock()
 
 MARKETPLACES = [
     {"id": "ozon", "name": "OZON", "enabled": True},
@@ -55,6 +153,8 @@ def serialize_result(result):
         "seller_name": result.seller_name,
         "label_text": result.label_text,
         "error": result.error,
+        "cached_at": getattr(result, "cached_at", None),
+        "sku": result.sku or product_sku(result.url),
     }
 
 
@@ -131,6 +231,7 @@ def evaluate_result(result, rules: dict) -> tuple[str, str, dict]:
         "ok_conditions": ok_conditions,
         "matched_error": None,
         "matched_ok": None,
+        "webdriver_calls": getattr(result, "webdriver_calls", None),
     }
 
     for condition in error_conditions:
@@ -151,282 +252,1243 @@ def evaluate_result(result, rules: dict) -> tuple[str, str, dict]:
     return "unknown", "Нет совпадений с условиями", debug_info
 
 
+def screen_tile(label_text: str, rules: dict, strict: bool = False) -> tuple[str, Optional[CheckResult]]:
+    """
+    Предварительная проверка по бейджам плитки выдачи:
+    "confirmed" — вердикт не изменится после открытия карточки, "check" — нужна карточка,
+    "skip" — в строгом режиме плитка без бейджей.
+    """
+    if not (label_text or "").strip():
+        return ("skip" if strict else "check"), None
+    result = CheckResult(
+        url="",
+        ok=True,
+        has_label=True,
+        seller_ok=None,
+        seller_name=None,
+        label_text=label_text,
+        error=None,
+    )
+    verdict, _, _ = evaluate_result(result, rules)
+    # Условия ошибки проверяются первыми, поэтому совпадение с ними окончательно.
+    # OK по плитке окончателен, только если на карточке нечему его перебить.
+    if verdict == "nok" or (verdict == "ok" and not normalize_rules(rules.get("error_conditions"))):
+        return "confirmed", result
+    return "check", None
+
+
 def persist_job(job: dict):
-    try:
-        JOB_HISTORY_FILE.parent.mkdir(parents=True, exist_ok=True)
-        payload = {
+    # Вызывается под JOB_LOCK: только снимок задачи, на диск его пишет HISTORY_WRITER.
+    if job.get("_abandoned"):
+        # Задачу доделает планировщик, перехвативший аренду, — он и запишет историю.
+        return
+    HISTORY_WRITER.submit(
+        {
             "id": job["id"],
             "status": job["status"],
             "created_at": job["created_at"],
             "started_at": job["started_at"],
             "finished_at": job["finished_at"],
             "total": job["total"],
-            "results": job["results"],
+            "results": list(job["results"]),
         }
-        with JOB_HISTORY_FILE.open("a", encoding="utf-8") as f:
-            f.write(json.dumps(payload, ensure_ascii=False) + "\n")
-    except Exception:
-        pass
+    )
+    JOB_EXPIRY.finished(job["id"], job["finished_at"])
+
+
+def put_job(job: dict) -> None:
+    # Вызывается под JOB_LOCK: задача попадает в JOBS и в очереди вытеснения.
+    previous = JOBS.get(job["id"])
+    JOBS[job["id"]] = job
+    job.setdefault("_changes", next(JOB_CHANGES))
+    if previous is None:
+        JOB_EXPIRY.created(job["id"], job["created_at"])
+    if job.get("finished_at") and (previous is None or previous.get("finished_at") != job["finished_at"]):
+        JOB_EXPIRY.finished(job["id"], job["finished_at"])
 
 
 def prune_jobs():
+    # Вызывается на каждый запрос: смотрим только вершины куч JOB_EXPIRY, а не все задачи.
     now = time.time()
     with JOB_LOCK:
-        expired = [
-            job_id
-            for job_id, job in JOBS.items()
-            if job.get("finished_at") and now - job["finished_at"] > JOB_TTL_SEC
-        ]
-        for job_id in expired:
+        for job_id in JOB_EXPIRY.expired(JOBS, now - JOB_TTL_SEC):
             JOBS.pop(job_id, None)
 
         if len(JOBS) > MAX_JOBS:
-            items = sorted(JOBS.values(), key=lambda j: j["created_at"])
-            for job in items[: max(0, len(JOBS) - MAX_JOBS)]:
-                JOBS.pop(job["id"], None)
+            for job_id in JOB_EXPIRY.oldest(JOBS, len(JOBS) - MAX_JOBS):
+                JOBS.pop(job_id, None)
+        JOB_EXPIRY.compact(JOBS)
+
+
+def normalize_engine(value) -> str:
+    engine = str(value or "").strip().lower()
+    return engine if engine in ENGINES else CHECK_ENGINE
+
+
+def check_card(
+    url: str,
+    engine: str = CHECK_ENGINE,
+    block_profile: Optional[str] = None,
+    cache_max_age: int = 0,
+) -> CheckResult:
+    cached = RESULT_CACHE.get(url, cache_max_age)
+    if cached is not None:
+        return cached
+    result = None
+    if engine == "http":
+        result = check_url_http(url)
+    if result is None:
+        with DRIVER_POOL.lease() as driver:
+            result = check_url(url, driver=driver, block_profile=normalize_block_profile(block_profile))
+    RESULT_CACHE.put(result)
+    return result
+
+
+def new_traffic() -> dict:
+    return {"requests": 0, "bytes_loaded": 0, "blocked": 0, "bytes_saved": 0}
+
+
+def add_traffic(job: dict, delta: Optional[dict]) -> None:
+    # Вызывается под JOB_LOCK.
+    if not delta:
+        return
+    traffic = job.setdefault("traffic", new_traffic())
+    for key in traffic:
+        traffic[key] += int(delta.get(key) or 0)
+
+
+def iter_check_results(
+    urls: list[str],
+    is_cancelled: Callable[[], bool],
+    on_start: Callable[[str], None],
+    engine: str = CHECK_ENGINE,
+    block_profile: Optional[str] = None,
+    cache_max_age: int = 0,
+    on_cache: Optional[Callable[[bool], None]] = None,
+) -> Iterator[tuple[str, Optional[CheckResult], Optional[str]]]:
+    """
+    Сначала отдаёт карточки из кэша результатов, которые не старше cache_max_age,
+    остальные проверяет и складывает свежие результаты в кэш.
+    """
+    if cache_max_age > 0:
+        missed: list[str] = []
+        for url in urls:
+            if is_cancelled():
+                return
+            cached = RESULT_CACHE.get(url, cache_max_age)
+            if on_cache:
+                on_cache(cached is not None)
+            if cached is None:
+                missed.append(url)
+                continue
+            on_start(url)
+            yield url, cached, None
+        urls = missed
+    for url, result, error in iter_fresh_results(
+        urls, is_cancelled, on_start, engine=engine, block_profile=block_profile
+    ):
+        if result is not None:
+            RESULT_CACHE.put(result)
+        yield url, result, error
+
+
+def iter_fresh_results(
+    urls: list[str],
+    is_cancelled: Callable[[], bool],
+    on_start: Callable[[str], None],
+    engine: str = CHECK_ENGINE,
+    block_profile: Optional[str] = None,
+) -> Iterator[tuple[str, Optional[CheckResult], Optional[str]]]:
+    """
+    Отдаёт (url, result, error) по мере готовности. При OZON_WORKERS > 1 карточки
+    проверяются параллельно в процессах-воркерах, при OZON_TABS > 1 — во вкладках
+    одного браузера; порядок результатов в обоих случаях не гарантирован.
+    С engine="http" сначала идёт быстрый проход без браузера, в браузер уходят
+    только карточки, по которым он не дал ответа.
+    """
+    if engine == "http":
+        browser_urls: list[str] = []
+        for url, result in iter_http_checks(urls, cancel_check=is_cancelled):
+            if result is None:
+                browser_urls.append(url)
+                continue
+            on_start(url)
+            yield url, result, None
+        if is_cancelled():
+            return
+        urls = browser_urls
+    if CHECK_WORKERS.enabled:
+        yield from CHECK_WORKERS.imap(urls, is_cancelled, on_start, block_profile=block_profile)
+        return
+    if DEFAULT_TABS > 1:
+        # Один Chrome, несколько вкладок: пока читаем одну карточку, остальные грузятся.
+        with DRIVER_POOL.lease() as driver:
+            for result in check_urls_in_tabs(
+                driver,
+                urls,
+                cancel_check=is_cancelled,
+                on_start=on_start,
+                block_profile=block_profile,
+            ):
+                yield result.url, result, None
+        return
+    for url in urls:
+        if is_cancelled():
+            return
+        on_start(url)
+        try:
+            with DRIVER_POOL.lease() as driver:
+                result = check_url(url, driver=driver, block_profile=block_profile)
+        except Exception as e:
+            yield url, None, str(e)
+            continue
+        yield url, result, None
+
+
+def is_tested(job: dict, url: str) -> bool:
+    # Вызывается под JOB_LOCK. tested_urls хранит ключи карточек (артикулы), а не ссылки.
+    tested = job.get("tested_urls")
+    return isinstance(tested, set) and product_key(url) in tested
+
+
+def mark_tested(job: dict, url: str, sku: Optional[str] = None) -> None:
+    # Вызывается под JOB_LOCK. sku — артикул открытой карточки, если по ссылке его не видно (/t/).
+    tested = job.get("tested_urls")
+    if isinstance(tested, set):
+        for key in {product_key(url), sku or ""} - {""}:
+            if key not in tested:
+                tested.add(key)
+                add_mark(job, "tested", key)
+
+
+def add_mark(job: dict, kind: str, key: str, value: str = "") -> None:
+    # Вызывается под JOB_LOCK. Отметка уйдёт в хранилище с ближайшей контрольной точкой.
+    if JOB_STORE.shared and not job.get("_view"):
+        job.setdefault("_marks", []).append((kind, key, value))
+
+
+def touch_job(job: dict) -> None:
+    # Вызывается под JOB_LOCK после изменения результатов, очереди или ссылок поиска (см. job_version).
+    job["_changes"] = next(JOB_CHANGES)
+
+
+def drop_pending(job: dict, url: str) -> None:
+    # Вызывается под JOB_LOCK.
+    pending = job.get("pending_urls")
+    if pending and pending.discard(url):
+        touch_job(job)
+
+
+def append_result(job: dict, payload: dict) -> None:
+    """
+    Результаты только дописываются: позиция в job["results"] — курсор для
+    /jobs/<id>/results, verdict_index — позиции по вердиктам. Вызывать под JOB_LOCK.
+    """
+    job["results"].append(payload)
+    verdict = payload.get("verdict") or "unknown"
+    job.setdefault("verdict_index", {}).setdefault(verdict, []).append(len(job["results"]) - 1)
+    touch_job(job)
+
+
+def record_check_result(
+    job: dict,
+    url: str,
+    result: Optional[CheckResult],
+    error: Optional[str] = None,
+    source: Optional[str] = None,
+) -> None:
+    """
+    Добавляет результат проверки карточки в задачу (фильтр продавца, вердикт, счётчики).
+    """
+    payload: Optional[dict] = None
+    verdict, verdict_reason, debug_info = None, None, {}
+    if result is None:
+        payload = {
+            "url": url,
+            "verdict": "error",
+            "verdict_reason": "Ошибка проверки карточки",
+            "ok": False,
+            "has_label": False,
+            "seller_ok": None,
+            "seller_name": None,
+            "label_text": "",
+            "error": error,
+        }
+    elif job.get("seller_filter_applied") or seller_matches(
+        job.get("seller_filter") or "", result.seller_name, result.seller_ok
+    ):
+        verdict, verdict_reason, debug_info = evaluate_result(result, job.get("rules") or {})
+        payload = serialize_result(result)
+        payload["verdict"] = verdict
+        payload["verdict_reason"] = verdict_reason
+        if source:
+            payload["source"] = source
+        if DEBUG_WEB:
+            payload["debug"] = debug_info
+    with JOB_LOCK:
+        # Проверка и запись — одним участком: карточку могли закрыть раньше
+        # по плитке выдачи или параллельной стадией, дубль строки не нужен.
+        if is_tested(job, url):
+            return
+        sku = result.sku if result is not None else None
+        if result is not None:
+            add_traffic(job, result.traffic)
+            tested = job.get("tested_urls")
+            if sku and isinstance(tested, set) and sku in tested:
+                # Короткая ссылка привела на уже проверенную карточку — второй строки не будет.
+                payload = None
+                verdict = None
+        if payload is not None:
+            append_result(job, payload)
+        job["done"] += 1
+        mark_tested(job, url, sku)
+        drop_pending(job, url)
+    if DEBUG_WEB and result is not None and verdict is not None:
+        print(
+            f"[DEBUG] {url} verdict={verdict} reason={verdict_reason} "
+            f"label='{result.label_text}' ok_rules={debug_info.get('ok_conditions')} "
+            f"err_rules={debug_info.get('error_conditions')}"
+        )
 
 
-def worker_loop():
-    while True:
-        job_id = JOB_QUEUE.get()
+def run_search_pipeline(
+    job: dict,
+    run_search: Callable[..., list[str]],
+    search_kwargs: dict,
+    is_cancelled: Callable[[], bool],
+    seller_known: Optional[dict[str, bool]] = None,
+) -> list[str]:
+    """
+    Поиск, фильтр продавца и проверка карточек одновременно (см. SearchPipeline).
+    Возвращает ссылки, прошедшие фильтр продавца. seller_known — решения фильтра
+    из контрольной точки прерванной задачи.
+    """
+    seller_filter = job.get("seller_filter") or ""
+    engine = normalize_engine(job.get("engine"))
+    cache_max_age = job.get("cache_max_age") or 0
+
+    def on_found(urls: list[str]) -> None:
         with JOB_LOCK:
-            job = JOBS.get(job_id)
-            if not job:
-                continue
-            if job.get("cancelled"):
-                job["status"] = "stopped"
-                job["finished_at"] = time.time()
-                persist_job(job)
-                JOB_QUEUE.task_done()
-                continue
-            job["status"] = "running"
-            job["started_at"] = time.time()
+            job["search_urls"] = list(urls)
+            job["search_total"] = len(urls)
+            touch_job(job)
 
-        def is_cancelled() -> bool:
-            with JOB_LOCK:
-                active = JOBS.get(job_id)
-                return bool(active and active.get("cancelled"))
+    # Продавец из плиток выдачи: конвейер ведёт фильтр сам, поэтому seller_filter в поиск
+    # не передаём, а продавца забираем через tile_seller_cb — он приходит раньше ссылки.
+    tile_sellers: dict[str, str] = {}
+
+    def on_tile_seller(url: str, seller: str) -> None:
+        tile_sellers[product_key(url)] = seller
 
+    def search(emit: Callable[[list[str]], None]) -> list[str]:
         def on_progress(urls: list[str]) -> None:
+            on_found(urls)
+            emit(urls)
+
+        return run_search(
+            seller_filter="",
+            progress_cb=on_progress,
+            raw_cb=on_found,
+            tile_seller_cb=on_tile_seller if seller_filter else None,
+            **search_kwargs,
+        )
+
+    def read_card(url: str) -> CheckResult:
+        with JOB_LOCK:
+            job["current_url"] = url
+        result = check_card(url, engine, job.get("block_profile"), cache_max_age)
+        if cache_max_age > 0:
             with JOB_LOCK:
-                active = JOBS.get(job_id)
-                if not active:
-                    return
-                active["pending_urls"] = list(urls)
-                active["collected_count"] = len(urls)
-                active["total"] = len(urls)
-                active["phase_count"] = len(urls)
+                stats = job.setdefault("cache", {"hits": 0, "misses": 0})
+                stats["hits" if result.cached_at is not None else "misses"] += 1
+        return result
+
+    def resolve_seller(url: str) -> tuple[bool, Optional[CheckResult]]:
+        tile_name = (tile_sellers.get(product_key(url)) or "").strip()
+        if normalize_text(tile_name) not in AMBIGUOUS_SELLER_NAMES:
+            # Продавец известен по плитке — карточку открываем, только если он подошёл.
+            matched = seller_matches_filter(seller_filter, tile_name, is_ozon_seller(tile_name, ""), "")
+            with JOB_LOCK:
+                add_mark(job, "seller", product_key(url), "1" if matched else "0")
+            return matched, None
+        # Страница уже открыта ради продавца — лейблы читаются тем же проходом.
+        result = read_card(url)
+        matched = seller_matches(seller_filter, result.seller_name, result.seller_ok)
+        with JOB_LOCK:
+            add_mark(job, "seller", product_key(url), "1" if matched else "0")
+        return matched, result
+
+    def already_done(url: str) -> bool:
+        with JOB_LOCK:
+            return is_tested(job, url)
+
+    pipeline = SearchPipeline(
+        search,
+        resolve_seller if seller_filter else None,
+        read_card,
+        is_cancelled,
+        skip=already_done,
+    )
 
-        def on_search_raw(urls: list[str]) -> None:
+    def on_stats(stats: dict) -> None:
+        with JOB_LOCK:
+            job["pipeline"] = stats
+            job["seller_checked"] = stats["seller"]["done"]
+            job["seller_total"] = job.get("search_total") or 0
+            job["seller_kept"] = len(pipeline.kept_urls)
+            job["phase_count"] = len(pipeline.kept_urls)
+            job["total"] = len(pipeline.kept_urls)
+
+    with JOB_LOCK:
+        job["phase"] = "pipeline"
+        job["phase_started_at"] = time.time()
+        job["seller_filter_applied"] = True
+    for url, result, error in pipeline.run(on_stats=on_stats):
+        record_check_result(job, url, result, error)
+        checkpoint_job(job)
+    on_stats(pipeline.stats())
+    if pipeline.search_error:
+        raise RuntimeError(pipeline.search_error)
+    if not seller_filter:
+        return list(pipeline.search_urls or pipeline.kept_urls)
+    if not seller_known:
+        return list(pipeline.kept_urls)
+    # Карточки, прошедшие фильтр до перезапуска, конвейер пропустил как уже проверенные.
+    kept = {product_key(url) for url in pipeline.kept_urls}
+    kept.update(key for key, matched in seller_known.items() if matched)
+    return [url for url in pipeline.search_urls if product_key(url) in kept]
+
+
+def job_record(job: dict) -> dict:
+    """
+    Копия задачи для хранилища: без результатов, списков ссылок и служебных полей «_…». Под JOB_LOCK.
+    """
+    record = {}
+    for key, value in job.items():
+        if key in JOB_RUNTIME_FIELDS or key in JOB_URL_FIELDS or key in JOB_SET_FIELDS or key.startswith("_"):
+            continue
+        if isinstance(value, (set, list, PendingUrls)):
+            value = list(value)
+        elif isinstance(value, dict):
+            value = dict(value)
+        record[key] = value
+    return record
+
+
+def url_changes(job: dict) -> dict[str, tuple[int, list[str]]]:
+    """
+    Ссылки, добавленные в списки задачи с прошлой записи: {поле: (позиция, ссылки)}.
+    Списки только растут; очередь, заменённая новой (фаза продавца, возобновление),
+    переписывается с нуля. Под JOB_LOCK.
+    """
+    saved = job.setdefault("_saved_urls", {})
+    changes = {}
+    for key in JOB_URL_FIELDS:
+        value = job.get(key)
+        if value is None:
+            continue
+        source, count = saved.get(key, (None, 0))
+        if isinstance(value, PendingUrls):
+            start = count if source is value else 0
+            urls = value.added_since(start)
+            saved[key] = (value, value.added)
+        else:
+            start = count if count <= len(value) else 0
+            urls = list(value[start:])
+            saved[key] = (None, len(value))
+        if urls or start < count:
+            changes[key] = (start, urls)
+    return changes
+
+
+def restore_job(record: dict, results: list[dict]) -> dict:
+    job = dict(record)
+    for key in JOB_SET_FIELDS:
+        job[key] = set(job.get(key) or [])
+    job["pending_urls"] = PendingUrls(job.get("pending_urls") or [])
+    job["results"] = []
+    job["verdict_index"] = {}
+    for payload in results:
+        append_result(job, payload)
+    return job
+
+
+def mark_stopped(job: dict) -> None:
+    job["cancelled"] = True
+    job["status"] = "stopped"
+    job["current_url"] = None
+    job["finished_at"] = time.time()
+
+
+def submit_job(job: dict) -> None:
+    with JOB_LOCK:
+        put_job(job)
+        record = job_record(job)
+        urls = url_changes(job)
+    JOB_STORE.save(record, urls=urls)
+    JOB_STORE.enqueue(job["id"])
+
+
+def checkpoint_job(job: dict) -> None:
+    """
+    Контрольная точка задачи планировщика: новые результаты и отметки (проверенные
+    карточки, решения фильтра продавца, страницы выдачи) без перезаписи всей задачи.
+    Вызывается после каждой карточки, чтобы после падения не проверять её заново.
+    Новые ссылки списков задачи пишутся сюда же; версия записи задачи не меняется.
+    """
+    if not JOB_STORE.shared:
+        return
+    job_id = job["id"]
+    with JOB_CHECKPOINT_LOCK:
+        with JOB_LOCK:
+            if job.get("_view") or job.get("_abandoned"):
+                return
+            saved = job.get("_saved_results", 0)
+            fresh = job["results"][saved:]
+            marks = job.pop("_marks", None) or []
+            saved_urls = dict(job.get("_saved_urls") or {})
+            urls = url_changes(job)
+            if not fresh and not marks and not urls:
+                return
+            job["_saved_results"] = saved + len(fresh)
+            if fresh:
+                job["_saved_final"] = False
+        try:
+            JOB_STORE.checkpoint(job_id, saved, fresh, marks, urls)
+        except Exception as e:
+            print(f"[WARN] Не удалось сохранить прогресс задачи {job_id}: {e}")
             with JOB_LOCK:
-                active = JOBS.get(job_id)
-                if not active:
-                    return
-                active["search_urls"] = list(urls)
-                active["search_total"] = len(urls)
+                job["_saved_results"] = saved
+                job["_saved_urls"] = saved_urls
+                job["_marks"] = marks + job.get("_marks", [])
+
+
+def sync_job(job: dict) -> None:
+    """
+    Переносит изменения задачи планировщика в хранилище: контрольная точка
+    и запись задачи, если она изменилась.
+    """
+    if not JOB_STORE.shared:
+        return
+    job_id = job["id"]
+    checkpoint_job(job)
+    with JOB_LOCK:
+        if job.get("_view") or job.get("_saved_final") or job.get("_abandoned"):
+            return
+        record = job_record(job)
+    digest = hashlib.sha1(json.dumps(record, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+    if digest == job.get("_saved_digest"):
+        return
+    try:
+        JOB_STORE.save(record)
+    except Exception as e:
+        print(f"[WARN] Не удалось сохранить задачу {job_id}: {e}")
+        return
+    with JOB_LOCK:
+        job["_saved_digest"] = digest
+        job["_saved_final"] = record.get("status") in ("done", "stopped")
+        if job["_saved_final"] and OWNED_JOBS.get(job_id) is job:
+            OWNED_JOBS.pop(job_id)
+
+
+def apply_checkpoint(job: dict, marks: dict[str, dict[str, str]]) -> None:
+    """
+    Восстанавливает прогресс прерванной задачи по отметкам: проверенные карточки
+    не проверяются снова, пройденные страницы выдачи не загружаются, решения
+    по продавцу не повторяются (см. job["_resume"]).
+    """
+    tested = job.get("tested_urls")
+    if not isinstance(tested, set):
+        tested = set()
+    tested.update(marks.get("tested") or {})
+    tested.update(product_key(item.get("url", "")) for item in job["results"] if item.get("url"))
+    job["tested_urls"] = tested
+    job["done"] = max(int(job.get("done") or 0), len(tested))
+    job["pending_urls"] = PendingUrls(url for url in job.get("pending_urls") or [] if product_key(url) not in tested)
+    pages: dict[int, list[str]] = {}
+    for page, links in (marks.get("page") or {}).items():
+        try:
+            pages[int(page)] = list(json.loads(links))
+        except ValueError:
+            continue
+    sellers = {key: value == "1" for key, value in (marks.get("seller") or {}).items()}
+    job["_resume"] = {"pages": pages, "sellers": sellers}
+
+
+def refresh_job(job_id: str) -> None:
+    """
+    В процессе без планировщика задачи в JOBS — копии записей хранилища.
+    Запись задачи небольшая и перечитывается, только если выросла её версия;
+    результаты, ссылки и проверенные карточки дочитываются с прошлого раза
+    по версии прогресса. Планировщик отдаёт свои задачи из памяти,
+    а вытесненные из JOBS — так же из хранилища.
+    """
+    if not JOB_STORE.shared:
+        return
+    with JOB_LOCK:
+        cached = JOBS.get(job_id)
+        if cached is not None and not cached.get("_view") and SCHEDULER_ACTIVE.is_set():
+            return
+        view = cached if cached is not None and cached.get("_view") else None
+        known = view["_version"] if view else None
+        have = len(view["results"]) if view else 0
+        seen = dict(view["_seen"]) if view else {"urls": 0, "tested": 0}
+    try:
+        versions = JOB_STORE.versions(job_id)
+        if versions is None or versions == known:
+            return
+        record = None
+        if known is None or versions[0] != known[0]:
+            loaded = JOB_STORE.load(job_id)
+            if not loaded:
+                return
+            record = loaded[0]
+        fresh: list[dict] = []
+        url_rows: list[tuple[int, str, int, str]] = []
+        tested_rows: list[tuple[int, str]] = []
+        if known is None or versions[1] != known[1]:
+            fresh = JOB_STORE.results(job_id, have)
+            url_rows = JOB_STORE.url_rows(job_id, JOB_VIEW_URL_FIELDS, seen["urls"])
+            tested_rows = JOB_STORE.mark_rows(job_id, "tested", seen["tested"])
+    except Exception as e:
+        print(f"[WARN] Не удалось прочитать задачу {job_id}: {e}")
+        return
+    with JOB_LOCK:
+        current = JOBS.get(job_id)
+        own = current is not None and not current.get("_view")
+        if own and SCHEDULER_ACTIVE.is_set():
+            # Пока читали, задачу взял планировщик этого процесса.
+            return
+        if (not own and current is not view) or (view is not None and view["_version"] != known):
+            # Копию уже обновил или заменил параллельный запрос — перечитаем в следующий раз.
+            return
+        job = view
+        if job is None:
+            job = restore_job(record, [])
+            job["_view"] = True
+            job["_seen"] = {"urls": 0, "tested": 0}
+            job["_pending_rows"] = 0
+        elif record is not None:
+            finished_at = job.get("finished_at")
+            for key, value in record.items():
+                if key not in JOB_URL_FIELDS and key not in JOB_SET_FIELDS:
+                    job[key] = value
+            if job.get("finished_at") != finished_at:
+                JOB_EXPIRY.finished(job_id, job.get("finished_at"))
+        apply_view_rows(job, url_rows, tested_rows)
+        for payload in fresh:
+            append_result(job, payload)
+        job["_version"] = versions
+        if view is None:
+            put_job(job)
+
+
+def apply_view_rows(
+    job: dict, url_rows: list[tuple[int, str, int, str]], tested_rows: list[tuple[int, str]]
+) -> None:
+    """
+    Дописывает в копию задачи новые строки хранилища: проверенные карточки уходят
+    из очереди, ссылки встают в списки по позициям. Позиция меньше прочитанного —
+    список переписан (очередь фазы продавца), его начинаем заново. Под JOB_LOCK.
+    """
+    seen = job["_seen"]
+    tested = job["tested_urls"]
+    pending = job["pending_urls"]
+    for seq, key in tested_rows:
+        tested.add(key)
+        pending.discard(key)
+        seen["tested"] = seq
+    for seq, kind, pos, url in url_rows:
+        seen["urls"] = seq
+        if kind == "pending_urls":
+            if pos < job["_pending_rows"]:
+                pending = job["pending_urls"] = PendingUrls()
+            job["_pending_rows"] = pos + 1
+            if product_key(url) not in tested:
+                pending.add(url)
+        else:
+            urls = job.setdefault(kind, [])
+            del urls[pos:]
+            urls.append(url)
+
+
+def adopt_job(job_id: str) -> Optional[dict]:
+    """
+    Планировщик берёт задачу из очереди хранилища: своя уже в JOBS,
+    поставленную другим процессом читаем из хранилища. Дальше воркер
+    работает с этой ссылкой, задача остаётся в OWNED_JOBS до финальной записи.
+    """
+    with JOB_LOCK:
+        job = JOBS.get(job_id)
+        if job is not None and not job.get("_view"):
+            OWNED_JOBS[job_id] = job
+            return job
+    loaded = JOB_STORE.load(job_id)
+    if not loaded:
+        return None
+    record, _ = loaded
+    stored: dict[str, int] = {}
+    for key in JOB_URL_FIELDS:
+        urls = JOB_STORE.urls(job_id, key)
+        stored[key] = len(urls)
+        if urls or key not in record:
+            # Запись прежней версии хранит списки целиком — их строки появятся с первой контрольной точкой.
+            record[key] = urls
+    results = JOB_STORE.results(job_id)
+    job = restore_job(record, results)
+    job["_saved_results"] = len(results)
+    # Очередь в хранилище — журнал добавлений; после восстановления её проще переписать целиком.
+    job["_saved_urls"] = {key: (None, count) for key, count in stored.items()}
+    marks = JOB_STORE.marks(job_id)
+    if record.get("status") == "running" or marks:
+        # Процесс упал посреди задачи — продолжаем с последней контрольной точки.
+        apply_checkpoint(job, marks)
+        job["resumed_at"] = time.time()
+        print(f"[INFO] Возобновляю задачу {job_id}: проверено {len(job['tested_urls'])} карточек.")
+    with JOB_LOCK:
+        put_job(job)
+        OWNED_JOBS[job_id] = job
+    return job
+
+
+def finish_run(job: dict) -> None:
+    if job.get("_abandoned"):
+        # Аренда потеряна: в хранилище задача остаётся как была на последней контрольной
+        # точке, захват снимаем — новый планировщик продолжит её.
+        JOB_STORE.unclaim(job["id"], SCHEDULER_ID)
+        with JOB_LOCK:
+            OWNED_JOBS.pop(job["id"], None)
+            if JOBS.get(job["id"]) is job:
+                JOBS.pop(job["id"])
+        return
+    JOB_STORE.release(job["id"])
+    sync_job(job)
+    if not JOB_STORE.shared:
+        with JOB_LOCK:
+            OWNED_JOBS.pop(job["id"], None)
+
+
+def owned_jobs() -> dict[str, dict]:
+    # Вызывается под JOB_LOCK: свои задачи в JOBS и выполняемые планировщиком, даже если их вытеснили.
+    owned = {job_id: job for job_id, job in JOBS.items() if not job.get("_view")}
+    owned.update(OWNED_JOBS)
+    return owned
+
 
-        def on_seller_progress(checked: int, total: int, kept: int) -> None:
+def abandon_jobs() -> None:
+    """
+    Аренду планировщика перехватил другой процесс: задачи этого процесса
+    останавливаются без записи в хранилище, их продолжит новый владелец.
+    """
+    with JOB_LOCK:
+        for job in OWNED_JOBS.values():
+            job["_abandoned"] = True
+
+
+def ensure_worker() -> None:
+    """
+    Поток очереди задач для процесса с арендой: запускается заново, если упал
+    или завершился после потери аренды.
+    """
+    global WORKER_THREAD
+    with WORKER_LOCK:
+        if not SCHEDULER_ACTIVE.is_set() or (WORKER_THREAD is not None and WORKER_THREAD.is_alive()):
+            return
+        if WORKER_THREAD is not None:
+            print("[WARN] Поток очереди задач остановился — запускаю заново.")
+        WORKER_THREAD = threading.Thread(target=worker_loop, daemon=True)
+        WORKER_THREAD.start()
+
+
+def pull_cancelled() -> None:
+    # Остановку из другого процесса видно только по отметке в хранилище.
+    with JOB_LOCK:
+        active = {
+            job_id: job
+            for job_id, job in owned_jobs().items()
+            if not job.get("cancelled") and job["status"] in ("queued", "running")
+        }
+    for job_id in JOB_STORE.cancelled(list(active)):
+        with JOB_LOCK:
+            job = active[job_id]
+            if not job.get("cancelled"):
+                mark_stopped(job)
+                persist_job(job)
+
+
+def store_loop() -> None:
+    """
+    Аренда планировщика и синхронизация с хранилищем. Процесс, получивший
+    аренду, запускает очередь задач; остальные пробуют снова, если владелец пропал.
+    """
+    last_prune = 0.0
+    last_recover = 0.0
+    while True:
+        try:
+            if SCHEDULER_ENABLED and JOB_STORE.acquire_scheduler(SCHEDULER_ID):
+                if not SCHEDULER_ACTIVE.is_set() or time.time() - last_recover > SCHEDULER_LEASE_SEC:
+                    # Захваты прежнего владельца снимаются, только когда истекла его аренда, —
+                    # поэтому проверяем не только при получении аренды, но и периодически.
+                    recovered = JOB_STORE.recover(SCHEDULER_ID)
+                    if recovered and not SCHEDULER_ACTIVE.is_set():
+                        print(f"[INFO] В очереди после перезапуска: {len(recovered)} задач(и).")
+                    last_recover = time.time()
+                    SCHEDULER_ACTIVE.set()
+                ensure_worker()
+                if JOB_STORE.shared:
+                    pull_cancelled()
+                    with JOB_LOCK:
+                        owned = list(owned_jobs().values())
+                    for job in owned:
+                        sync_job(job)
+                    if time.time() - last_prune > JOB_STORE_PRUNE_SEC:
+                        JOB_STORE.prune(JOB_TTL_SEC, MAX_JOBS)
+                        last_prune = time.time()
+            elif SCHEDULER_ACTIVE.is_set():
+                print("[WARN] Аренда планировщика перехвачена другим процессом.")
+                SCHEDULER_ACTIVE.clear()
+                abandon_jobs()
+        except Exception as e:
+            print(f"[WARN] Ошибка синхронизации задач: {e}")
+        time.sleep(JOB_SYNC_SEC)
+
+
+def release_scheduler() -> None:
+    if SCHEDULER_ACTIVE.is_set():
+        JOB_STORE.release_scheduler(SCHEDULER_ID)
+
+
+def worker_loop() -> None:
+    """
+    Очередь задач планировщика. Ошибка одной задачи останавливает только её;
+    при потере аренды поток перестаёт брать задачи и завершается.
+    """
+    while SCHEDULER_ACTIVE.is_set():
+        try:
+            job_id = JOB_STORE.claim(SCHEDULER_ID, timeout=5)
+        except Exception as e:
+            print(f"[WARN] Не удалось взять задачу из очереди: {e}")
+            time.sleep(JOB_SYNC_SEC)
+            continue
+        if not job_id:
+            continue
+        if not SCHEDULER_ACTIVE.is_set():
+            # Аренду потеряли, пока ждали задачу, — её возьмёт новый планировщик.
+            JOB_STORE.unclaim(job_id, SCHEDULER_ID)
+            break
+        try:
+            run_job(job_id)
+        except Exception as e:
+            print(f"[WARN] Задача {job_id} прервана ошибкой: {e}")
+            fail_job(job_id, e)
+
+
+def fail_job(job_id: str, error: Exception) -> None:
+    # Задача упала посреди выполнения: останавливаем её с ошибкой и снимаем из очереди.
+    with JOB_LOCK:
+        job = OWNED_JOBS.get(job_id)
+        if job is not None and job["status"] not in ("done", "stopped"):
+            job["status"] = "stopped"
+            job["current_url"] = None
+            job["finished_at"] = time.time()
+            job["error"] = f"Ошибка выполнения: {error}"
+            persist_job(job)
+    try:
+        if job is not None:
+            finish_run(job)
+        else:
+            JOB_STORE.release(job_id)
+    except Exception as e:
+        # Запись задачи повторит store_loop: она остаётся в OWNED_JOBS.
+        print(f"[WARN] Не удалось завершить задачу {job_id}: {e}")
+
+
+def run_job(job_id: str) -> None:
+    """
+    Задача из очереди: поиск, если он нужен, затем проверка карточек.
+    """
+    job = adopt_job(job_id)
+    if job is None:
+        JOB_STORE.release(job_id)
+        return
+    with JOB_LOCK:
+        cancelled = bool(job.get("cancelled"))
+        if cancelled:
+            job["status"] = "stopped"
+            job["finished_at"] = time.time()
+            persist_job(job)
+        else:
+            job["status"] = "running"
+            job["started_at"] = job.get("started_at") or time.time()
+        resume = job.pop("_resume", None) or {}
+    if cancelled:
+        finish_run(job)
+        return
+
+    def is_cancelled() -> bool:
+        with JOB_LOCK:
+            return bool(job.get("cancelled") or job.get("_abandoned"))
+
+    # Сколько ссылок из списка on_progress уже в очереди: список только растёт в пределах фазы,
+    # поэтому добавляем лишь новые, а не пересобираем очередь целиком.
+    progress = {"added": 0}
+
+    def on_progress(urls: list[str]) -> None:
+        with JOB_LOCK:
+            pending = job.get("pending_urls")
+            if not isinstance(pending, PendingUrls):
+                pending = job["pending_urls"] = PendingUrls()
+            for url in urls[progress["added"] :]:
+                pending.add(url)
+            progress["added"] = len(urls)
+            touch_job(job)
+            job["collected_count"] = len(urls)
+            job["total"] = len(urls)
+            job["phase_count"] = len(urls)
+
+    def on_search_raw(urls: list[str]) -> None:
+        with JOB_LOCK:
+            job["search_urls"] = list(urls)
+            job["search_total"] = len(urls)
+            touch_job(job)
+
+    def on_seller_progress(checked: int, total: int, kept: int) -> None:
+        with JOB_LOCK:
+            job["seller_checked"] = checked
+            job["seller_total"] = total
+            job["seller_kept"] = kept
+            job["phase_count"] = kept
+
+    def on_phase(phase: str) -> None:
+        with JOB_LOCK:
+            job["phase"] = phase
+            job["phase_count"] = 0
+            job["phase_started_at"] = time.time()
+            if phase == "search":
+                job["search_eta_sec"] = None
+            if phase == "seller":
+                job["seller_checked"] = 0
+                job["seller_total"] = 0
+                job["seller_kept"] = 0
+                # Дальше on_progress приносит только прошедшие фильтр продавца.
+                job["pending_urls"] = PendingUrls()
+                progress["added"] = 0
+                touch_job(job)
+
+    def on_eta(phase: str, eta_sec: float) -> None:
+        with JOB_LOCK:
+            if phase == "search":
+                job["search_eta_sec"] = eta_sec
+
+    # Поиск прерванной задачи уже завершён — сразу к проверке карточек.
+    if job.get("auto_search") and not job.get("search_done"):
+        with JOB_LOCK:
+            if "tested_urls" not in job or not isinstance(job.get("tested_urls"), set):
+                job["tested_urls"] = set()
+        query = job.get("search_query") or ""
+        max_pages = job.get("search_max_pages") or 0
+        seller_filter = job.get("seller_filter") or ""
+        search_settings = job.get("search_settings") or {}
+
+        reuse_sec = search_settings.get("reuse_sec")
+        crawl = SearchCrawl(
+            SEARCH_CACHE,
+            query,
+            reuse_sec=SEARCH_REUSE_SEC if reuse_sec is None else normalize_max_age(reuse_sec),
+        )
+
+        def inline_test(driver, url):
             with JOB_LOCK:
-                active = JOBS.get(job_id)
-                if not active:
-                    return
-                active["seller_checked"] = checked
-                active["seller_total"] = total
-                active["seller_kept"] = kept
-                active["phase_count"] = kept
+                if is_tested(job, url):
+                    return None
+            return check_current_page(driver, url)
 
-        def on_phase(phase: str) -> None:
+        def on_search_page(page: int, links: list[str], reused: bool) -> None:
+            crawl.on_page(page, links, reused)
             with JOB_LOCK:
-                active = JOBS.get(job_id)
-                if not active:
-                    return
-                active["phase"] = phase
-                active["phase_count"] = 0
-                active["phase_started_at"] = time.time()
-                if phase == "search":
-                    active["search_eta_sec"] = None
-                if phase == "seller":
-                    active["seller_checked"] = 0
-                    active["seller_total"] = 0
-                    active["seller_kept"] = 0
-
-        def on_eta(phase: str, eta_sec: float) -> None:
+                add_mark(job, "page", str(page), json.dumps(links, ensure_ascii=False))
+            checkpoint_job(job)
+
+        def on_seller(url: str, matched: bool) -> None:
             with JOB_LOCK:
-                active = JOBS.get(job_id)
-                if not active:
-                    return
-                if phase == "search":
-                    active["search_eta_sec"] = eta_sec
+                add_mark(job, "seller", product_key(url), "1" if matched else "0")
+            checkpoint_job(job)
+
+        tile_mode = str(search_settings.get("tile_screening") or TILE_SCREENING).lower()
+        if tile_mode not in TILE_SCREENING_MODES:
+            tile_mode = "off"
+
+        def on_tile(url: str, label_text: str, tile_seller: Optional[str]) -> None:
+            group, result = screen_tile(label_text, job.get("rules") or {}, tile_mode == "strict")
+            if group == "confirmed" and seller_filter:
+                # Без продавца из плитки фильтр не проверить — такую карточку открываем.
+                if not tile_seller or not seller_matches(seller_filter, tile_seller, None):
+                    group, result = "check", None
+            with JOB_LOCK:
+                stats = job.setdefault("tile_screening", {"confirmed": 0, "check": 0, "skip": 0})
+                stats[group] += 1
+                if group == "skip" and not is_tested(job, url):
+                    mark_tested(job, url)
+                    job["done"] += 1
+            if result is not None:
+                result.url = url
+                result.seller_name = tile_seller
+                result.seller_ok = is_ozon_seller(tile_seller, "") if tile_seller else None
+                record_check_result(job, url, result, source="tile")
+
+        def run_search(**kwargs):
+            # Чистый профиль — отдельный временный Chrome, иначе берём сессию из пула.
+            if kwargs.get("clean_profile"):
+                return collect_search_urls(query, **kwargs)
+            with DRIVER_POOL.lease() as driver:
+                return collect_search_urls(query, driver=driver, **kwargs)
+
+        def on_search_traffic(delta: dict) -> None:
+            # Весь трафик поисковой сессии, включая карточки, проверенные на месте.
+            with JOB_LOCK:
+                add_traffic(job, delta)
 
-        if job.get("auto_search"):
+        def on_inline_result(result: CheckResult) -> None:
+            RESULT_CACHE.put(result)
             with JOB_LOCK:
-                if "tested_urls" not in job or not isinstance(job.get("tested_urls"), set):
-                    job["tested_urls"] = set()
-            query = job.get("search_query") or ""
-            max_pages = job.get("search_max_pages") or 0
-            seller_filter = job.get("seller_filter") or ""
-            search_settings = job.get("search_settings") or {}
-
-            def inline_test(driver, url):
-                return check_current_page(driver, url)
-
-            def on_inline_result(result: CheckResult) -> None:
-                with JOB_LOCK:
-                    active = JOBS.get(job_id)
-                    if not active:
-                        return
-                    payload = serialize_result(result)
-                    verdict, verdict_reason, debug_info = evaluate_result(
-                        result, active.get("rules") or {}
-                    )
-                    payload["verdict"] = verdict
-                    payload["verdict_reason"] = verdict_reason
-                    if DEBUG_WEB:
-                        payload["debug"] = debug_info
-                    active["results"].append(payload)
-                    active["done"] += 1
-                    tested_urls = active.get("tested_urls")
-                    if isinstance(tested_urls, set):
-                        tested_urls.add(result.url)
-                    if active.get("pending_urls") and result.url in active["pending_urls"]:
-                        active["pending_urls"].remove(result.url)
-
-            try:
-                urls = collect_search_urls(
-                    query,
+                payload = serialize_result(result)
+                verdict, verdict_reason, debug_info = evaluate_result(
+                    result, job.get("rules") or {}
+                )
+                payload["verdict"] = verdict
+                payload["verdict_reason"] = verdict_reason
+                if DEBUG_WEB:
+                    payload["debug"] = debug_info
+                append_result(job, payload)
+                job["done"] += 1
+                mark_tested(job, result.url, result.sku)
+                drop_pending(job, result.url)
+
+        search_kwargs = dict(
+            max_pages=max_pages,
+            scrolls=search_settings.get("scrolls"),
+            load_wait_sec=search_settings.get("load_wait_sec"),
+            scroll_wait_sec=search_settings.get("scroll_wait_sec"),
+            stable_hits=search_settings.get("stable_hits"),
+            stable_pause_sec=search_settings.get("stable_pause_sec"),
+            clean_profile=bool(search_settings.get("fresh_profile")),
+            tabs=search_settings.get("tabs"),
+            page_tabs=search_settings.get("page_tabs"),
+            tile_label_cb=None if tile_mode == "off" or job.get("search_only") else on_tile,
+            block_profile=job.get("block_profile"),
+            traffic_cb=on_search_traffic,
+            stored_pages=crawl.stored_pages,
+            page_cb=on_search_page,
+            resume_pages=resume.get("pages"),
+            eta_cb=on_eta,
+            cancel_check=is_cancelled,
+        )
+        # Конвейеру нужна своя сессия под поиск и хотя бы одна под карточки.
+        use_pipeline = (
+            not job.get("search_only")
+            and bool(search_settings.get("pipeline", PIPELINE_ENABLED))
+            and (search_kwargs["clean_profile"] or DRIVER_POOL.size > 1)
+        )
+        try:
+            if use_pipeline:
+                urls = run_search_pipeline(
+                    job, run_search, search_kwargs, is_cancelled, resume.get("sellers")
+                )
+            else:
+                urls = run_search(
                     seller_filter=seller_filter,
-                    max_pages=max_pages,
-                    scrolls=search_settings.get("scrolls"),
-                    load_wait_sec=search_settings.get("load_wait_sec"),
-                    scroll_wait_sec=search_settings.get("scroll_wait_sec"),
-                    stable_hits=search_settings.get("stable_hits"),
-                    stable_pause_sec=search_settings.get("stable_pause_sec"),
-                    clean_profile=bool(search_settings.get("fresh_profile")),
                     progress_cb=on_progress,
                     raw_cb=on_search_raw,
                     seller_progress_cb=on_seller_progress,
-                    eta_cb=on_eta,
                     match_test_cb=None if job.get("search_only") else inline_test,
                     match_result_cb=None if job.get("search_only") else on_inline_result,
                     phase_cb=on_phase,
-                    cancel_check=is_cancelled,
+                    seller_known=resume.get("sellers"),
+                    seller_cb=on_seller,
+                    **search_kwargs,
                 )
-            except Exception as e:
-                with JOB_LOCK:
-                    job["status"] = "stopped"
-                    job["finished_at"] = time.time()
-                    job["error"] = f"Ошибка поиска: {e}"
-                    persist_job(job)
-                JOB_QUEUE.task_done()
-                continue
+        except Exception as e:
             with JOB_LOCK:
-                job["urls"] = urls
-                job["total"] = len(urls)
-                job["pending_urls"] = list(urls)
-                job["collected_count"] = len(urls)
-                job["search_done"] = True
-                job["seller_filter_applied"] = bool(seller_filter)
-                if not job.get("search_urls"):
-                    job["search_urls"] = list(urls)
-                    job["search_total"] = len(urls)
-                if seller_filter:
-                    job["seller_kept"] = len(urls)
-
-        if job.get("search_only"):
-            with JOB_LOCK:
-                job["done"] = job.get("total", 0)
-                job["status"] = "done"
-                job["current_url"] = None
+                job["status"] = "stopped"
                 job["finished_at"] = time.time()
+                job["error"] = f"Ошибка поиска: {e}"
                 persist_job(job)
-            JOB_QUEUE.task_done()
-            continue
+            finish_run(job)
+            return
+        with JOB_LOCK:
+            job["urls"] = urls
+            job["total"] = len(urls)
+            pending = job.get("pending_urls")
+            if not isinstance(pending, PendingUrls):
+                pending = job["pending_urls"] = PendingUrls()
+            # Почти все ссылки уже пришли через on_progress — добавляем только недостающие.
+            for url in urls:
+                pending.add(url)
+            touch_job(job)
+            job["collected_count"] = len(urls)
+            job["search_done"] = True
+            job["seller_filter_applied"] = bool(seller_filter)
+            if not job.get("search_urls"):
+                job["search_urls"] = list(urls)
+                job["search_total"] = len(urls)
+            if seller_filter:
+                job["seller_kept"] = len(urls)
+            search_urls = list(job.get("search_urls") or urls)
+        job_search_diff = crawl.finish(search_urls, complete=not is_cancelled(), max_pages=max_pages)
+        with JOB_LOCK:
+            job["search_diff"] = job_search_diff
 
+    if job.get("search_only"):
         with JOB_LOCK:
-            job["phase"] = "testing"
-            tested_urls = job.get("tested_urls")
-            if isinstance(tested_urls, set) and len(tested_urls) >= len(job["urls"]):
-                job["done"] = len(job["urls"])
-                job["status"] = "done"
-                job["current_url"] = None
-                job["finished_at"] = time.time()
-                persist_job(job)
-                JOB_QUEUE.task_done()
-                continue
+            job["done"] = job.get("total", 0)
+            job["status"] = "done"
+            job["current_url"] = None
+            job["finished_at"] = time.time()
+            persist_job(job)
+        finish_run(job)
+        return
 
+    with JOB_LOCK:
+        job["phase"] = "testing"
+        all_tested = isinstance(job.get("tested_urls"), set) and all(
+            is_tested(job, u) for u in job["urls"]
+        )
+        if all_tested:
+            job["done"] = len(job["urls"])
+            job["status"] = "done"
+            job["current_url"] = None
+            job["finished_at"] = time.time()
+            persist_job(job)
+    if all_tested:
+        finish_run(job)
+        return
+
+    urls_to_check: list[str] = []
+    with JOB_LOCK:
         for url in job["urls"]:
-            with JOB_LOCK:
-                tested_urls = job.get("tested_urls")
-                if isinstance(tested_urls, set) and url in tested_urls:
-                    if job.get("pending_urls") and url in job["pending_urls"]:
-                        job["pending_urls"].remove(url)
-                    continue
-            with JOB_LOCK:
-                if job.get("cancelled"):
-                    job["status"] = "stopped"
-                    job["finished_at"] = time.time()
-                    job["current_url"] = None
-                    persist_job(job)
-                    break
-            with JOB_LOCK:
-                job["current_url"] = url
-            try:
-                result = check_url(url)
-            except Exception as e:
-                with JOB_LOCK:
-                    job["done"] += 1
-                    if job.get("pending_urls") and url in job["pending_urls"]:
-                        job["pending_urls"].remove(url)
-                    job["results"].append(
-                        {
-                            "url": url,
-                            "verdict": "error",
-                            "verdict_reason": "Ошибка проверки карточки",
-                            "ok": False,
-                            "has_label": False,
-                            "seller_ok": None,
-                            "seller_name": None,
-                            "label_text": "",
-                            "error": str(e),
-                        }
-                    )
+            if is_tested(job, url):
+                drop_pending(job, url)
                 continue
-            if not job.get("seller_filter_applied"):
-                seller_filter = job.get("seller_filter") or ""
-                if not seller_matches(seller_filter, result.seller_name, result.seller_ok):
-                    with JOB_LOCK:
-                        job["done"] += 1
-                        if job.get("pending_urls") and url in job["pending_urls"]:
-                            job["pending_urls"].remove(url)
-                    continue
-            verdict, verdict_reason, debug_info = evaluate_result(result, job.get("rules") or {})
-            with JOB_LOCK:
-                payload = serialize_result(result)
-                payload["verdict"] = verdict
-                payload["verdict_reason"] = verdict_reason
-                if DEBUG_WEB:
-                    payload["debug"] = debug_info
-                job["results"].append(payload)
-                job["done"] += 1
-                if job.get("pending_urls") and url in job["pending_urls"]:
-                    job["pending_urls"].remove(url)
-            if DEBUG_WEB:
-                print(
-                    f"[DEBUG] {url} verdict={verdict} reason={verdict_reason} "
-                    f"label='{result.label_text}' ok_rules={debug_info.get('ok_conditions')} "
-                    f"err_rules={debug_info.get('error_conditions')}"
-                )
-        with JOB_LOCK:
-            if job.get("status") != "stopped":
-                job["status"] = "done"
-                job["current_url"] = None
-                job["finished_at"] = time.time()
-                persist_job(job)
-        JOB_QUEUE.task_done()
+            urls_to_check.append(url)
 
+    def on_check_start(url: str) -> None:
+        with JOB_LOCK:
+            job["current_url"] = url
 
-worker_thread = threading.Thread(target=worker_loop, daemon=True)
-worker_thread.start()
+    def on_cache(hit: bool) -> None:
+        with JOB_LOCK:
+            stats = job.setdefault("cache", {"hits": 0, "misses": 0})
+            stats["hits" if hit else "misses"] += 1
+
+    for url, result, error in iter_check_results(
+        urls_to_check,
+        is_cancelled,
+        on_check_start,
+        engine=normalize_engine(job.get("engine")),
+        block_profile=job.get("block_profile"),
+        cache_max_age=job.get("cache_max_age") or 0,
+        on_cache=on_cache,
+    ):
+        record_check_result(job, url, result, error)
+        checkpoint_job(job)
+    with JOB_LOCK:
+        if job.get("cancelled") and job.get("status") != "stopped":
+            job["status"] = "stopped"
+            job["finished_at"] = time.time()
+            job["current_url"] = None
+            persist_job(job)
+    with JOB_LOCK:
+        if job.get("status") != "stopped":
+            job["status"] = "done"
+            job["current_url"] = None
+            job["finished_at"] = time.time()
+            persist_job(job)
+    finish_run(job)
+
+
+store_thread = threading.Thread(target=store_loop, daemon=True)
+# В дочерних процессах воркеров (spawn импортирует app.py заново) очередь не запускаем.
+if multiprocessing.parent_process() is None:
+    store_thread.start()
+    atexit.register(release_scheduler)
+
+
+@app.after_request
+def compress_response(response: Response):
+    if response.mimetype not in COMPRESS_MIMETYPES:
+        return response
+    response.vary.add("Accept-Encoding")
+    if (
+        response.direct_passthrough
+        or response.is_streamed
+        or response.status_code != 200
+        or "Content-Encoding" in response.headers
+    ):
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    if brotli is not None and request.accept_encodings["br"]:
+        response.set_data(brotli.compress(data, quality=BROTLI_QUALITY))
+        response.headers["Content-Encoding"] = "br"
+    elif request.accept_encodings["gzip"]:
+        response.set_data(gzip.compress(data, compresslevel=COMPRESS_LEVEL))
+        response.headers["Content-Encoding"] = "gzip"
+    return response
+
+
+def conditional(response: Response, etag: Optional[str] = None) -> Response:
+    """
+    ETag и 304 Not Modified, если у клиента та же версия. ETag слабый:
+    тело может уйти сжатым, а версия от этого не меняется.
+    """
+    if etag:
+        response.set_etag(etag, weak=True)
+    else:
+        response.add_etag(weak=True)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+def job_version(job: dict) -> str:
+    """
+    Ключ выгрузок и их ETag. Очередь не только убывает (во время поиска растёт,
+    в фазе продавца заменяется), поэтому длины списков тут не годятся:
+    своя задача меняет номер при каждом изменении (touch_job), копия из
+    хранилища — вместе с его версиями, одинаковыми во всех процессах. Под JOB_LOCK.
+    """
+    if job.get("_view"):
+        record_version, progress = job["_version"]
+        return f"store-{record_version}-{progress}-{job['status']}"
+    return f"{SCHEDULER_ID}-{job['_changes']}-{job['status']}"
+
+
+def job_export(job_id: str, kind: str, build: Callable[[dict], bytes]) -> Optional[tuple[bytes, str]]:
+    """
+    (файл выгрузки, ETag). Готовый файл хранится в задаче и отдаётся повторно,
+    пока задача не изменилась; иначе собирается build(snapshot). None — задачи нет.
+    """
+    refresh_job(job_id)
+    with JOB_LOCK:
+        job = JOBS.get(job_id)
+        if not job:
+            return None
+        version = job_version(job)
+        etag = hashlib.sha1(f"{job_id}:{kind}:{version}".encode("utf-8")).hexdigest()
+        cached = (job.get("exports") or {}).get(kind)
+        if cached and cached[0] == version:
+            return cached[1], etag
+        snapshot = {
+            "results": list(job["results"]),
+            "pending_urls": list(job.get("pending_urls") or []),
+            "search_urls": list(job.get("search_urls") or []),
+        }
+    data = build(snapshot)
+    with JOB_LOCK:
+        job = JOBS.get(job_id)
+        if job:
+            job.setdefault("exports", {})[kind] = (version, data)
+    return data, etag
 
 
 @app.route("/")
@@ -455,7 +1517,7 @@ def index():
 @app.route("/api/presets/<ts_id>", methods=["GET"])
 def ts_presets(ts_id: str):
     presets = load_ts_presets(ts_id)
-    return jsonify({"ok": True, "presets": presets})
+    return conditional(jsonify({"ok": True, "presets": presets}))
 
 
 @app.route("/check", methods=["POST"])
@@ -464,10 +1526,15 @@ def check():
     url = (payload.get("url") or "").strip()
     if not url:
         return jsonify({"ok": False, "error": "URL не указан."}), 400
-    if "ozon.ru/product/" not in url:
+    if not is_product_url(url):
         return jsonify({"ok": False, "error": "Нужна ссылка на карточку Ozon (/product/...)."}), 400
 
-    result = check_url(url)
+    result = check_card(
+        url,
+        engine=normalize_engine(payload.get("engine")),
+        block_profile=payload.get("block_profile"),
+        cache_max_age=normalize_max_age(payload.get("cache_max_age")),
+    )
     rules = payload.get("rules") or {}
     verdict, verdict_reason, debug_info = evaluate_result(result, rules)
     return jsonify(
@@ -479,6 +1546,9 @@ def check():
             "seller_name": result.seller_name,
             "label_text": result.label_text,
             "error": result.error,
+            "sku": product_sku(result.url),
+            "traffic": result.traffic,
+            "cached_at": result.cached_at,
             "verdict": verdict,
             "verdict_reason": verdict_reason,
             "debug": debug_info if DEBUG_WEB else None,
@@ -487,15 +1557,17 @@ def check():
 
 
 def normalize_urls(raw: str) -> list[str]:
+    # Дубли ищем по артикулу: одна карточка под разными slug/параметрами проверяется один раз.
     urls = []
     seen = set()
     for line in raw.splitlines():
         candidate = line.strip()
         if not candidate:
             continue
-        if candidate in seen:
+        key = product_key(candidate)
+        if key in seen:
             continue
-        seen.add(candidate)
+        seen.add(key)
         urls.append(candidate)
     return urls
 
@@ -506,11 +1578,13 @@ def batch():
     raw = payload.get("urls") or ""
     rules = payload.get("rules") or {}
     meta = payload.get("meta") or {}
+    engine = normalize_engine(payload.get("engine"))
+    block_profile = normalize_block_profile(payload.get("block_profile"))
     urls = normalize_urls(raw)
     if not urls:
         return jsonify({"ok": False, "error": "Список ссылок пуст."}), 400
 
-    invalid = [u for u in urls if "ozon.ru/product/" not in u]
+    invalid = [u for u in urls if not is_product_url(u)]
     if invalid:
         return jsonify(
             {
@@ -522,7 +1596,7 @@ def batch():
 
     prune_jobs()
     job_id = uuid.uuid4().hex
-        job = {
+    job = {
         "id": job_id,
         "status": "queued",
         "created_at": time.time(),
@@ -532,11 +1606,17 @@ def batch():
         "done": 0,
         "current_url": None,
         "urls": urls,
-        "pending_urls": list(urls),
+        "pending_urls": PendingUrls(urls),
         "collected_count": len(urls),
         "results": [],
+        "verdict_index": {},
         "rules": rules,
         "meta": meta,
+        "engine": engine,
+        "block_profile": block_profile,
+        "traffic": new_traffic(),
+        "cache_max_age": normalize_max_age(payload.get("cache_max_age")),
+        "cache": {"hits": 0, "misses": 0},
         "cancelled": False,
         "search_done": True,
         "seller_filter_applied": False,
@@ -545,15 +1625,12 @@ def batch():
         "seller_kept": len(urls),
         "seller_checked": 0,
         "seller_total": 0,
-            "search_eta_sec": None,
-            "phase_started_at": None,
-            "tested_urls": set(),
-        }
-
-    with JOB_LOCK:
-        JOBS[job_id] = job
+        "search_eta_sec": None,
+        "phase_started_at": None,
+        "tested_urls": set(),
+    }
 
-    JOB_QUEUE.put(job_id)
+    submit_job(job)
     return jsonify({"ok": True, "job_id": job_id, "total": len(urls)})
 
 
@@ -567,10 +1644,14 @@ def auto_batch():
     meta = payload.get("meta") or {}
     seller_filter = (payload.get("seller") or "").strip()
     search_settings = payload.get("search_settings") or {}
+    engine = normalize_engine(payload.get("engine"))
+    block_profile = normalize_block_profile(
+        payload.get("block_profile") or search_settings.get("block_profile")
+    )
 
     prune_jobs()
     job_id = uuid.uuid4().hex
-        job = {
+    job = {
         "id": job_id,
         "status": "queued",
         "created_at": time.time(),
@@ -580,11 +1661,17 @@ def auto_batch():
         "done": 0,
         "current_url": None,
         "urls": [],
-        "pending_urls": [],
+        "pending_urls": PendingUrls(),
         "collected_count": 0,
         "results": [],
+        "verdict_index": {},
         "rules": rules,
         "meta": meta,
+        "engine": engine,
+        "block_profile": block_profile,
+        "traffic": new_traffic(),
+        "cache_max_age": normalize_max_age(payload.get("cache_max_age")),
+        "cache": {"hits": 0, "misses": 0},
         "auto_search": True,
         "search_query": search_query,
         "seller_filter": seller_filter,
@@ -600,15 +1687,12 @@ def auto_batch():
         "seller_kept": 0,
         "seller_checked": 0,
         "seller_total": 0,
-            "search_eta_sec": None,
-            "phase_started_at": None,
-            "tested_urls": set(),
-        }
-
-    with JOB_LOCK:
-        JOBS[job_id] = job
+        "search_eta_sec": None,
+        "phase_started_at": None,
+        "tested_urls": set(),
+    }
 
-    JOB_QUEUE.put(job_id)
+    submit_job(job)
     return jsonify({"ok": True, "job_id": job_id, "total": 0})
 
 
@@ -621,10 +1705,13 @@ def search_only():
     meta = payload.get("meta") or {}
     seller_filter = (payload.get("seller") or "").strip()
     search_settings = payload.get("search_settings") or {}
+    block_profile = normalize_block_profile(
+        payload.get("block_profile") or search_settings.get("block_profile")
+    )
 
     prune_jobs()
     job_id = uuid.uuid4().hex
-        job = {
+    job = {
         "id": job_id,
         "status": "queued",
         "created_at": time.time(),
@@ -634,11 +1721,16 @@ def search_only():
         "done": 0,
         "current_url": None,
         "urls": [],
-        "pending_urls": [],
+        "pending_urls": PendingUrls(),
         "collected_count": 0,
         "results": [],
+        "verdict_index": {},
         "rules": {},
         "meta": meta,
+        "block_profile": block_profile,
+        "traffic": new_traffic(),
+        "cache_max_age": normalize_max_age(payload.get("cache_max_age")),
+        "cache": {"hits": 0, "misses": 0},
         "auto_search": True,
         "search_query": search_query,
         "seller_filter": seller_filter,
@@ -654,21 +1746,26 @@ def search_only():
         "seller_kept": 0,
         "seller_checked": 0,
         "seller_total": 0,
-            "search_eta_sec": None,
-            "phase_started_at": None,
-            "tested_urls": set(),
-        }
-
-    with JOB_LOCK:
-        JOBS[job_id] = job
+        "search_eta_sec": None,
+        "phase_started_at": None,
+        "tested_urls": set(),
+    }
 
-    JOB_QUEUE.put(job_id)
+    submit_job(job)
     return jsonify({"ok": True, "job_id": job_id, "total": 0})
 
 
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return jsonify({"ok": True, "history_writer": HISTORY_WRITER.stats()})
+
+
 @app.route("/jobs", methods=["GET"])
 def jobs():
     prune_jobs()
+    if JOB_STORE.shared:
+        # Задачи всех процессов, а не только этого.
+        return conditional(jsonify({"ok": True, "jobs": JOB_STORE.list_jobs(20)}))
     with JOB_LOCK:
         items = [
             {
@@ -681,221 +1778,466 @@ def jobs():
             for job in JOBS.values()
         ]
     items.sort(key=lambda x: x["created_at"], reverse=True)
-    return jsonify({"ok": True, "jobs": items[:20]})
+    return conditional(jsonify({"ok": True, "jobs": items[:20]}))
+
+
+def job_summary(job: dict) -> dict:
+    """
+    Счётчики и состояние задачи без списков результатов и ссылок в очереди.
+    Вызывать под JOB_LOCK.
+    """
+    return {
+        "id": job["id"],
+        "status": job["status"],
+        "total": job["total"],
+        "done": job["done"],
+        "current_url": job.get("current_url"),
+        "collected_count": job.get("collected_count"),
+        "search_done": job.get("search_done", False),
+        "search_only": job.get("search_only", False),
+        "started_at": job.get("started_at"),
+        "phase": job.get("phase"),
+        "phase_count": job.get("phase_count"),
+        "search_total": job.get("search_total"),
+        "seller_kept": job.get("seller_kept"),
+        "search_eta_sec": job.get("search_eta_sec"),
+        "seller_checked": job.get("seller_checked"),
+        "seller_total": job.get("seller_total"),
+        "phase_started_at": job.get("phase_started_at"),
+        "error": job.get("error"),
+        "block_profile": job.get("block_profile"),
+        "traffic": dict(job.get("traffic") or new_traffic()),
+        "cache_max_age": job.get("cache_max_age"),
+        "cache": dict(job.get("cache") or {}),
+        "search_diff": job.get("search_diff"),
+        "pipeline": job.get("pipeline"),
+        "tile_screening": job.get("tile_screening"),
+        "resumed_at": job.get("resumed_at"),
+        "cursor": len(job["results"]),
+        "verdict_counts": {
+            verdict: len(positions) for verdict, positions in (job.get("verdict_index") or {}).items()
+        },
+    }
 
 
 @app.route("/jobs/<job_id>", methods=["GET"])
 def job_status(job_id: str):
     prune_jobs()
+    refresh_job(job_id)
     with JOB_LOCK:
         job = JOBS.get(job_id)
         if not job:
             return jsonify({"ok": False, "error": "Задача не найдена."}), 404
+        pending = job.get("pending_urls") or PendingUrls()
         payload = {
             "ok": True,
-            "id": job["id"],
-            "status": job["status"],
-            "total": job["total"],
-            "done": job["done"],
-            "current_url": job.get("current_url"),
-            "pending_urls": job.get("pending_urls") or [],
-            "collected_count": job.get("collected_count"),
-            "search_done": job.get("search_done", False),
-            "search_only": job.get("search_only", False),
-            "started_at": job.get("started_at"),
-            "phase": job.get("phase"),
-            "phase_count": job.get("phase_count"),
-            "search_total": job.get("search_total"),
-            "seller_kept": job.get("seller_kept"),
-            "search_eta_sec": job.get("search_eta_sec"),
-            "seller_checked": job.get("seller_checked"),
-            "seller_total": job.get("seller_total"),
-            "phase_started_at": job.get("phase_started_at"),
-            "error": job.get("error"),
-            "results": job["results"],
+            **job_summary(job),
+            "pending_count": len(pending),
+            "pending_urls": pending.head(SSE_PENDING_LIMIT),
         }
-    return jsonify(payload)
+    return conditional(jsonify(payload))
 
 
-@app.route("/jobs/<job_id>/stop", methods=["POST"])
-def job_stop(job_id: str):
-    prune_jobs()
+@app.route("/jobs/<job_id>/pending", methods=["GET"])
+def job_pending(job_id: str):
+    refresh_job(job_id)
+    try:
+        since = int(request.args.get("since") or 0)
+        limit = int(request.args.get("limit") or RESULTS_PAGE_LIMIT)
+    except ValueError:
+        return jsonify({"ok": False, "error": "since и limit должны быть числами."}), 400
+    limit = max(1, min(limit, RESULTS_MAX_LIMIT))
     with JOB_LOCK:
         job = JOBS.get(job_id)
         if not job:
             return jsonify({"ok": False, "error": "Задача не найдена."}), 404
-        job["cancelled"] = True
-        job["status"] = "stopped"
-        job["current_url"] = None
-        job["finished_at"] = time.time()
-        persist_job(job)
-    return jsonify({"ok": True})
+        pending = job.get("pending_urls") or PendingUrls()
+        items = pending.page(since, limit)
+        total = len(pending)
+    cursor = max(0, since) + len(items)
+    return conditional(
+        jsonify({"ok": True, "items": items, "cursor": cursor, "total": total, "has_more": cursor < total})
+    )
 
 
-@app.route("/jobs/<job_id>/csv", methods=["GET"])
-def job_csv(job_id: str):
-    prune_jobs()
+def select_results(job: dict, since: int, limit: int, verdicts: list[str]) -> tuple[list[dict], int]:
+    """
+    До limit результатов с позиции since (с фильтром по вердиктам) и курсор
+    для следующего запроса. Вызывать под JOB_LOCK.
+    """
+    results = job["results"]
+    since = min(max(0, since), len(results))
+    if not verdicts:
+        items = results[since : since + limit]
+        return items, since + len(items)
+    index = job.get("verdict_index") or {}
+    positions: list[int] = []
+    for verdict in verdicts:
+        found = index.get(verdict) or []
+        start = bisect_left(found, since)
+        positions.extend(found[start : start + limit])
+    positions = sorted(positions)[:limit]
+    if len(positions) < limit:
+        # Дальше по выбранным вердиктам ничего нет — курсор в конец списка.
+        return [results[pos] for pos in positions], len(results)
+    return [results[pos] for pos in positions], positions[-1] + 1
+
+
+@app.route("/jobs/<job_id>/results", methods=["GET"])
+def job_results(job_id: str):
+    refresh_job(job_id)
+    try:
+        since = int(request.args.get("since") or 0)
+        limit = int(request.args.get("limit") or RESULTS_PAGE_LIMIT)
+    except ValueError:
+        return jsonify({"ok": False, "error": "since и limit должны быть числами."}), 400
+    limit = max(1, min(limit, RESULTS_MAX_LIMIT))
+    verdict_filter = request.args.get("verdict", "")
+    verdicts = [v.strip() for v in verdict_filter.split(",") if v.strip()]
     with JOB_LOCK:
         job = JOBS.get(job_id)
         if not job:
             return jsonify({"ok": False, "error": "Задача не найдена."}), 404
-        results = list(job["results"])
-
-    output = []
-    header = [
-        "url",
-        "verdict",
-        "verdict_reason",
-        "ok",
-        "has_label",
-        "seller_ok",
-        "seller_name",
-        "label_text",
-        "error",
-    ]
-    output.append(header)
-    rows = results
-    if not rows:
-        for url in job.get("pending_urls") or []:
-            rows.append({"url": url, "verdict": "pending"})
-    for item in rows:
-        output.append(
-            [
-                item.get("url", ""),
-                item.get("verdict", ""),
-                item.get("verdict_reason", ""),
-                item.get("ok", False),
-                item.get("has_label", False),
-                item.get("seller_ok", None),
-                item.get("seller_name", ""),
-                item.get("label_text", ""),
-                item.get("error", ""),
-            ]
+        items, cursor = select_results(job, since, limit, verdicts)
+        total = len(job["results"])
+        status = job["status"]
+    return conditional(
+        jsonify(
+            {
+                "ok": True,
+                "status": status,
+                "items": items,
+                "cursor": cursor,
+                "total": total,
+                "has_more": cursor < total,
+            }
         )
+    )
 
-    csv_lines = []
-    for row in output:
-        csv_lines.append(
-            ",".join(
-                [
-                    '"{}"'.format(str(val).replace('"', '""'))
-                    for val in row
-                ]
-            )
+
+def parse_history_time(value: Optional[str]) -> Optional[float]:
+    """
+    Граница периода для /history: unix-время или дата YYYY-MM-DD (локальная полночь).
+    """
+    value = (value or "").strip()
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return time.mktime(time.strptime(value, "%Y-%m-%d"))
+
+
+@app.route("/history", methods=["GET"])
+def history_list():
+    try:
+        limit = int(request.args.get("limit") or 50)
+        offset = int(request.args.get("offset") or 0)
+        created_from = parse_history_time(request.args.get("from"))
+        created_to = parse_history_time(request.args.get("to"))
+    except ValueError:
+        return jsonify({"ok": False, "error": "limit и offset — числа, from и to — unix-время или YYYY-MM-DD."}), 400
+    limit = max(1, min(limit, RESULTS_MAX_LIMIT))
+    items, total = JOB_HISTORY.list_jobs(
+        limit=limit,
+        offset=offset,
+        status=request.args.get("status") or None,
+        created_from=created_from,
+        created_to=created_to,
+    )
+    return conditional(jsonify({"ok": True, "jobs": items, "total": total}))
+
+
+def load_history_job(job_id: str) -> Optional[tuple[dict, dict]]:
+    """
+    Запись задачи из истории (без results) и её результаты с индексом вердиктов — в том же
+    виде, что у живой задачи, для select_results. Последние HISTORY_CACHE_JOBS задач
+    держим в памяти; если задачу перезаписали, место в индексе истории сменится и запись
+    прочитается заново. Записи из кэша только читаются.
+    """
+    location = JOB_HISTORY.locate(job_id)
+    if location is None:
+        return None
+    with HISTORY_CACHE_LOCK:
+        cached = HISTORY_CACHE.get(job_id)
+        if cached is not None and cached[0] == location:
+            HISTORY_CACHE.move_to_end(job_id)
+            return cached[1], cached[2]
+    record = JOB_HISTORY.read(location)
+    if record is None:
+        return None
+    results = record.pop("results", None) or []
+    # Запись из истории — та же задача, только без живых полей: индекс вердиктов строим один раз.
+    past = {"results": results, "verdict_index": {}}
+    for pos, item in enumerate(results):
+        past["verdict_index"].setdefault(item.get("verdict") or "unknown", []).append(pos)
+    if HISTORY_CACHE_JOBS > 0:
+        with HISTORY_CACHE_LOCK:
+            HISTORY_CACHE[job_id] = (location, record, past)
+            HISTORY_CACHE.move_to_end(job_id)
+            while len(HISTORY_CACHE) > HISTORY_CACHE_JOBS:
+                HISTORY_CACHE.popitem(last=False)
+    return record, past
+
+
+@app.route("/history/<job_id>", methods=["GET"])
+def history_job(job_id: str):
+    try:
+        since = int(request.args.get("since") or 0)
+        limit = int(request.args.get("limit") or RESULTS_PAGE_LIMIT)
+    except ValueError:
+        return jsonify({"ok": False, "error": "since и limit должны быть числами."}), 400
+    limit = max(1, min(limit, RESULTS_MAX_LIMIT))
+    verdict_filter = request.args.get("verdict", "")
+    verdicts = [v.strip() for v in verdict_filter.split(",") if v.strip()]
+    loaded = load_history_job(job_id)
+    if loaded is None:
+        return jsonify({"ok": False, "error": "Задача не найдена в истории."}), 404
+    record, past = loaded
+    items, cursor = select_results(past, since, limit, verdicts)
+    total = len(past["results"])
+    return conditional(
+        jsonify(
+            {
+                "ok": True,
+                "job": record,
+                "items": items,
+                "cursor": cursor,
+                "total": total,
+                "has_more": cursor < total,
+            }
         )
+    )
+
+
+def sse_message(event: str, data: dict, event_id: Optional[int] = None) -> str:
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
+
+
+@app.route("/jobs/<job_id>/events", methods=["GET"])
+def job_events(job_id: str):
+    """
+    Поток Server-Sent Events: state — счётчики (только при изменении),
+    results — новые результаты с позиции start, end — задача завершена.
+    Переподключение продолжает с Last-Event-ID (число уже отданных результатов).
+    """
+    prune_jobs()
+    refresh_job(job_id)
+    with JOB_LOCK:
+        if job_id not in JOBS:
+            return jsonify({"ok": False, "error": "Задача не найдена."}), 404
+    try:
+        since = int(request.headers.get("Last-Event-ID") or request.args.get("since") or 0)
+    except ValueError:
+        since = 0
+
+    def stream() -> Iterator[str]:
+        cursor = max(0, since)
+        last_state = None
+        last_sent = time.time()
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        while True:
+            refresh_job(job_id)
+            with JOB_LOCK:
+                job = JOBS.get(job_id)
+                if not job:
+                    yield sse_message("end", {"status": "gone"})
+                    return
+                summary = job_summary(job)
+                pending = job.get("pending_urls") or PendingUrls()
+                summary["pending_count"] = len(pending)
+                summary["pending_urls"] = pending.head(SSE_PENDING_LIMIT)
+                state = json.dumps(summary, ensure_ascii=False)
+                cursor = min(cursor, len(job["results"]))
+                fresh = job["results"][cursor:]
+            if fresh:
+                cursor += len(fresh)
+                yield sse_message("results", {"start": cursor - len(fresh), "items": fresh}, cursor)
+                last_sent = time.time()
+            if state != last_state:
+                last_state = state
+                yield f"event: state\ndata: {state}\n\n"
+                last_sent = time.time()
+            if summary["status"] in ("done", "stopped"):
+                yield sse_message("end", {"status": summary["status"]})
+                return
+            if time.time() - last_sent >= SSE_HEARTBEAT_SEC:
+                # Комментарий держит соединение живым через прокси.
+                yield ": ping\n\n"
+                last_sent = time.time()
+            time.sleep(SSE_POLL_SEC)
 
-    payload = "\n".join(csv_lines)
     return Response(
-        payload,
-        mimetype="text/csv",
-        headers={"Content-Disposition": f"attachment; filename=ozon_job_{job_id}.csv"},
+        stream(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
-@app.route("/jobs/<job_id>/xlsx", methods=["GET"])
-def job_xlsx(job_id: str):
+@app.route("/jobs/<job_id>/stop", methods=["POST"])
+def job_stop(job_id: str):
     prune_jobs()
+    refresh_job(job_id)
     with JOB_LOCK:
         job = JOBS.get(job_id)
         if not job:
             return jsonify({"ok": False, "error": "Задача не найдена."}), 404
-        results = list(job["results"])
+        mark_stopped(job)
+        # Копию задачи из хранилища в историю не пишем — это сделает планировщик.
+        if not job.get("_view"):
+            persist_job(job)
+    JOB_STORE.cancel(job_id)
+    return jsonify({"ok": True})
 
-    verdict_filter = request.args.get("verdict", "")
-    verdicts = [v.strip() for v in verdict_filter.split(",") if v.strip()] if verdict_filter else []
+
+EXPORT_HEADER = [
+    "url",
+    "sku",
+    "verdict",
+    "verdict_reason",
+    "ok",
+    "has_label",
+    "seller_ok",
+    "seller_name",
+    "label_text",
+    "error",
+]
+
+
+def export_rows(snapshot: dict, verdicts: Optional[list[str]] = None) -> list[list]:
+    results = snapshot["results"]
     if verdicts:
         results = [item for item in results if (item.get("verdict") or "unknown") in verdicts]
-
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Results"
-    headers = [
-        "url",
-        "verdict",
-        "verdict_reason",
-        "ok",
-        "has_label",
-        "seller_ok",
-        "seller_name",
-        "label_text",
-        "error",
-    ]
-    ws.append(headers)
     rows = results
     if not rows:
-        for url in job.get("pending_urls") or []:
-            rows.append({"url": url, "verdict": "pending"})
-    for item in rows:
-        ws.append(
-            [
-                item.get("url", ""),
-                item.get("verdict", ""),
-                item.get("verdict_reason", ""),
-                item.get("ok", False),
-                item.get("has_label", False),
-                item.get("seller_ok", None),
-                item.get("seller_name", ""),
-                item.get("label_text", ""),
-                item.get("error", ""),
-            ]
+        rows = [{"url": url, "verdict": "pending"} for url in snapshot["pending_urls"]]
+    return [
+        [
+            item.get("url", ""),
+            item.get("sku") or product_sku(item.get("url", "")) or "",
+            item.get("verdict", ""),
+            item.get("verdict_reason", ""),
+            item.get("ok", False),
+            item.get("has_label", False),
+            item.get("seller_ok", None),
+            item.get("seller_name", ""),
+            item.get("label_text", ""),
+            item.get("error", ""),
+        ]
+        for item in rows
+    ]
+
+
+def build_csv(snapshot: dict) -> bytes:
+    csv_lines = []
+    for row in [EXPORT_HEADER] + export_rows(snapshot):
+        csv_lines.append(
+            ",".join(
+                [
+                    '"{}"'.format(str(val).replace('"', '""'))
+                    for val in row
+                ]
+            )
         )
+    return "\n".join(csv_lines).encode("utf-8")
 
+
+def build_xlsx(title: str, header: list[str], rows: list[list]) -> bytes:
+    wb = Workbook()
+    ws = wb.active
+    ws.title = title
+    ws.append(header)
+    for row in rows:
+        ws.append(row)
     buffer = BytesIO()
     wb.save(buffer)
-    buffer.seek(0)
+    return buffer.getvalue()
+
+
+def xlsx_response(data: bytes, prefix: str, etag: str) -> Response:
     ts = time.localtime()
     suffix = f"{ts.tm_min:02d}{ts.tm_hour:02d}{ts.tm_mday:02d}{ts.tm_mon:02d}{ts.tm_year}"
-    return send_file(
-        buffer,
+    response = send_file(
+        BytesIO(data),
         as_attachment=True,
-        download_name=f"ozon_job_{suffix}.xlsx",
+        download_name=f"{prefix}_{suffix}.xlsx",
         mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
     )
+    return conditional(response, etag)
+
+
+@app.route("/jobs/<job_id>/csv", methods=["GET"])
+def job_csv(job_id: str):
+    prune_jobs()
+    export = job_export(job_id, "csv", build_csv)
+    if export is None:
+        return jsonify({"ok": False, "error": "Задача не найдена."}), 404
+    data, etag = export
+    response = Response(
+        data,
+        mimetype="text/csv",
+        headers={"Content-Disposition": f"attachment; filename=ozon_job_{job_id}.csv"},
+    )
+    return conditional(response, etag)
+
+
+@app.route("/jobs/<job_id>/xlsx", methods=["GET"])
+def job_xlsx(job_id: str):
+    prune_jobs()
+    verdict_filter = request.args.get("verdict", "")
+    verdicts = sorted({v.strip() for v in verdict_filter.split(",") if v.strip()}) if verdict_filter else []
+    export = job_export(
+        job_id,
+        "xlsx:" + ",".join(verdicts),
+        lambda snapshot: build_xlsx("Results", EXPORT_HEADER, export_rows(snapshot, verdicts)),
+    )
+    if export is None:
+        return jsonify({"ok": False, "error": "Задача не найдена."}), 404
+    data, etag = export
+    return xlsx_response(data, "ozon_job", etag)
 
 
 @app.route("/jobs/<job_id>/search-xlsx", methods=["GET"])
 def job_search_xlsx(job_id: str):
     prune_jobs()
-    with JOB_LOCK:
-        job = JOBS.get(job_id)
-        if not job:
-            return jsonify({"ok": False, "error": "Задача не найдена."}), 404
-        search_urls = list(job.get("search_urls") or [])
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Search"
-    ws.append(["url"])
-    for url in search_urls:
-        ws.append([url])
-    buffer = BytesIO()
-    wb.save(buffer)
-    buffer.seek(0)
-    ts = time.localtime()
-    suffix = f"{ts.tm_min:02d}{ts.tm_hour:02d}{ts.tm_mday:02d}{ts.tm_mon:02d}{ts.tm_year}"
-    return send_file(
-        buffer,
-        as_attachment=True,
-        download_name=f"ozon_search_{suffix}.xlsx",
-        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    export = job_export(
+        job_id,
+        "search-xlsx",
+        lambda snapshot: build_xlsx(
+            "Search",
+            ["url", "sku"],
+            [[url, product_sku(url) or ""] for url in snapshot["search_urls"]],
+        ),
     )
+    if export is None:
+        return jsonify({"ok": False, "error": "Задача не найдена."}), 404
+    data, etag = export
+    return xlsx_response(data, "ozon_search", etag)
+
+
+def build_search_csv(snapshot: dict) -> bytes:
+    output = ["url,sku"]
+    output += [f"{url},{product_sku(str(url)) or ''}" for url in snapshot["search_urls"]]
+    return "\n".join(output).encode("utf-8")
 
 
 @app.route("/jobs/<job_id>/search-csv", methods=["GET"])
 def job_search_csv(job_id: str):
     prune_jobs()
-    with JOB_LOCK:
-        job = JOBS.get(job_id)
-        if not job:
-            return jsonify({"ok": False, "error": "Задача не найдена."}), 404
-        search_urls = list(job.get("search_urls") or [])
-    output = ["url"]
-    output += [str(url) for url in search_urls]
-    payload = "\n".join(output)
-    return Response(
-        payload,
+    export = job_export(job_id, "search-csv", build_search_csv)
+    if export is None:
+        return jsonify({"ok": False, "error": "Задача не найдена."}), 404
+    data, etag = export
+    response = Response(
+        data,
         mimetype="text/csv",
         headers={"Content-Disposition": f"attachment; filename=ozon_search_{job_id}.csv"},
     )
+    return conditional(response, etag)
 
 
 if __name__ == "__main__":
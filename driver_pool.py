@@ -0,0 +1,180 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, Optional
+
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+
+from ozon_check import USER_DATA_DIR, create_driver, safe_get
+
+POOL_SIZE = int(os.getenv("OZON_POOL_SIZE", "1"))
+POOL_MAX_PAGES = int(os.getenv("OZON_POOL_MAX_PAGES", "50"))
+POOL_IDLE_SEC = float(os.getenv("OZON_POOL_IDLE_SEC", "300"))
+POOL_WARMUP_URL = os.getenv("OZON_POOL_WARMUP_URL", "https://www.ozon.ru/")
+
+
+@dataclass
+class PooledSession:
+    slot: int
+    user_data_dir: Path
+    driver: Optional[webdriver.Chrome] = None
+    busy: bool = False
+    last_used: float = 0.0
+
+
+def session_alive(driver: webdriver.Chrome) -> bool:
+    try:
+        return driver.execute_script("return document.readyState;") is not None
+    except Exception:
+        return False
+
+
+def quit_driver(driver: Optional[webdriver.Chrome]) -> None:
+    if driver is None:
+        return
+    try:
+        driver.quit()
+    except Exception:
+        pass
+
+
+class DriverPool:
+    """
+    Пул тёплых Chrome-сессий. Каждый слот владеет своим профилем (Chrome не даёт
+    двум процессам работать с одним user-data-dir), сессия пересоздаётся после
+    max_pages загрузок, при падении и после idle_sec простоя.
+    """
+
+    def __init__(
+        self,
+        size: int = POOL_SIZE,
+        max_pages: int = POOL_MAX_PAGES,
+        idle_sec: float = POOL_IDLE_SEC,
+        user_data_dir: Path = USER_DATA_DIR,
+        warmup_url: str = POOL_WARMUP_URL,
+    ):
+        self.size = max(1, int(size))
+        self.max_pages = max(0, int(max_pages))
+        self.idle_sec = float(idle_sec)
+        self.user_data_dir = Path(user_data_dir)
+        self.warmup_url = warmup_url
+        self._cond = threading.Condition()
+        self._sessions = [
+            PooledSession(slot=slot, user_data_dir=self.slot_profile(slot))
+            for slot in range(self.size)
+        ]
+        self._reaper: Optional[threading.Thread] = None
+        self._closed = False
+
+    def slot_profile(self, slot: int) -> Path:
+        if slot == 0:
+            return self.user_data_dir
+        return self.user_data_dir.with_name(f"{self.user_data_dir.name}_{slot}")
+
+    def _start_reaper(self) -> None:
+        if self._reaper is not None or self.idle_sec <= 0:
+            return
+        self._reaper = threading.Thread(target=self._reap_loop, daemon=True)
+        self._reaper.start()
+
+    def _reap_loop(self) -> None:
+        interval = max(1.0, min(self.idle_sec / 2, 30.0))
+        while not self._closed:
+            time.sleep(interval)
+            self.close_idle()
+
+    def close_idle(self, max_idle_sec: Optional[float] = None) -> int:
+        limit = self.idle_sec if max_idle_sec is None else max_idle_sec
+        now = time.time()
+        stale: list[webdriver.Chrome] = []
+        with self._cond:
+            for session in self._sessions:
+                if session.busy or session.driver is None:
+                    continue
+                if now - session.last_used >= limit:
+                    stale.append(session.driver)
+                    session.driver = None
+        for driver in stale:
+            quit_driver(driver)
+        return len(stale)
+
+    def _acquire(self) -> PooledSession:
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Пул браузеров остановлен.")
+            self._start_reaper()
+            while True:
+                free = [s for s in self._sessions if not s.busy]
+                if free:
+                    # Сначала отдаём уже запущенные сессии.
+                    free.sort(key=lambda s: (s.driver is None, -s.last_used))
+                    session = free[0]
+                    session.busy = True
+                    break
+                self._cond.wait()
+
+        try:
+            self._ensure_driver(session)
+        except Exception:
+            self._release(session, broken=True)
+            raise
+        return session
+
+    def _ensure_driver(self, session: PooledSession) -> None:
+        driver = session.driver
+        if driver is not None:
+            pages = getattr(driver, "_ozon_pages", 0)
+            if (self.max_pages and pages >= self.max_pages) or not session_alive(driver):
+                quit_driver(driver)
+                session.driver = None
+        if session.driver is None:
+            driver = create_driver(user_data_dir=session.user_data_dir)
+            if self.warmup_url:
+                safe_get(driver, self.warmup_url, retries=1)
+            session.driver = driver
+
+    def _release(self, session: PooledSession, broken: bool = False) -> None:
+        dead = None
+        with self._cond:
+            if broken or self._closed:
+                dead = session.driver
+                session.driver = None
+            session.busy = False
+            session.last_used = time.time()
+            self._cond.notify()
+        quit_driver(dead)
+
+    @contextmanager
+    def lease(self) -> Iterator[webdriver.Chrome]:
+        session = self._acquire()
+        broken = False
+        try:
+            yield session.driver
+        except WebDriverException:
+            broken = True
+            raise
+        finally:
+            self._release(session, broken=broken)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "size": self.size,
+                "busy": sum(1 for s in self._sessions if s.busy),
+                "alive": sum(1 for s in self._sessions if s.driver is not None),
+            }
+
+    def shutdown(self) -> None:
+        with self._cond:
+            self._closed = True
+            drivers = [s.driver for s in self._sessions if not s.busy]
+            for session in self._sessions:
+                if not session.busy:
+                    session.driver = None
+            self._cond.notify_all()
+        for driver in drivers:
+            quit_driver(driver)
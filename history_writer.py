@@ -0,0 +1,150 @@
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+from queue import Empty, Full, Queue
+from typing import Optional
+
+from job_history import JobHistory
+
+HISTORY_QUEUE_SIZE = int(os.getenv("OZON_HISTORY_QUEUE", "1000"))
+HISTORY_BATCH_SIZE = int(os.getenv("OZON_HISTORY_BATCH", "50"))
+HISTORY_FLUSH_SEC = float(os.getenv("OZON_HISTORY_FLUSH_SEC", "1"))
+# never — полагаемся на ОС, batch — fsync после каждой пачки, always — после каждой записи.
+HISTORY_FSYNC = os.getenv("OZON_HISTORY_FSYNC", "batch")
+HISTORY_FSYNC_MODES = ("never", "batch", "always")
+# Пауза перед повтором пачки, которую не удалось записать.
+HISTORY_RETRY_SEC = 5.0
+
+_STOP = object()
+
+
+@dataclass
+class WriterStats:
+    submitted: int = 0
+    written: int = 0
+    batches: int = 0
+    fsyncs: int = 0
+    dropped: int = 0
+    errors: int = 0
+    last_error: Optional[str] = None
+    last_error_at: Optional[float] = None
+    last_write_at: Optional[float] = None
+
+
+class HistoryWriter:
+    """
+    Запись истории задач в отдельном потоке. submit() не ждёт диска: запись
+    кладётся в ограниченную очередь, поток пишет пачками. Если очередь полна,
+    запись отбрасывается и учитывается в dropped; ошибки записи — в errors,
+    а пачка повторяется, пока не запишется. Пишет в сегменты JobHistory.
+    """
+
+    def __init__(
+        self,
+        history: JobHistory,
+        queue_size: int = HISTORY_QUEUE_SIZE,
+        batch_size: int = HISTORY_BATCH_SIZE,
+        flush_sec: float = HISTORY_FLUSH_SEC,
+        fsync: str = HISTORY_FSYNC,
+    ):
+        self.history = history
+        self.batch_size = max(1, int(batch_size))
+        self.flush_sec = max(0.05, float(flush_sec))
+        self.fsync = fsync if fsync in HISTORY_FSYNC_MODES else "batch"
+        self._queue: "Queue[object]" = Queue(maxsize=max(1, int(queue_size)))
+        self._lock = threading.Lock()
+        self._stats = WriterStats()
+        self._thread: Optional[threading.Thread] = None
+        self._retry: list[dict] = []
+
+    def _ensure_thread(self) -> None:
+        # Поток стартует при первой записи: процессы‑воркеры историю не пишут и потока не держат.
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def submit(self, record: dict) -> bool:
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(record)
+        except Full:
+            with self._lock:
+                self._stats.dropped += 1
+            return False
+        with self._lock:
+            self._stats.submitted += 1
+        return True
+
+    def _collect(self) -> tuple[list[dict], bool]:
+        batch = list(self._retry)
+        self._retry = []
+        stop = False
+        try:
+            item = self._queue.get(timeout=self.flush_sec)
+        except Empty:
+            return batch, stop
+        while True:
+            if item is _STOP:
+                stop = True
+                break
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                break
+            try:
+                item = self._queue.get_nowait()
+            except Empty:
+                break
+        return batch, stop
+
+    def _write(self, batch: list[dict]) -> None:
+        fsyncs = self.history.append(batch, self.fsync)
+        with self._lock:
+            self._stats.written += len(batch)
+            self._stats.batches += 1
+            self._stats.fsyncs += fsyncs
+            self._stats.last_write_at = time.time()
+
+    def _run(self) -> None:
+        while True:
+            batch, stop = self._collect()
+            if batch:
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    with self._lock:
+                        first = self._stats.last_error != str(e)
+                        self._stats.errors += 1
+                        self._stats.last_error = str(e)
+                        self._stats.last_error_at = time.time()
+                    if first:
+                        print(f"[WARN] Не удалось записать историю задач: {e}")
+                    self._retry = batch
+                    if stop:
+                        return
+                    time.sleep(HISTORY_RETRY_SEC)
+                    continue
+            if stop:
+                return
+
+    def stats(self) -> dict:
+        with self._lock:
+            payload = asdict(self._stats)
+        payload["queued"] = self._queue.qsize() + len(self._retry)
+        payload["fsync"] = self.fsync
+        return payload
+
+    def close(self, timeout: float = 5.0) -> None:
+        """
+        Дописывает очередь перед выходом (не дольше timeout секунд).
+        """
+        with self._lock:
+            thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except Full:
+            return
+        thread.join(timeout)
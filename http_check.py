@@ -0,0 +1,246 @@
+import html
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, Optional
+from urllib.parse import quote, urlsplit
+
+import urllib3
+
+from ozon_check import (
+    PRODUCT_WIDGETS,
+    CheckResult,
+    extract_seller_from_source,
+    filter_label_chunks,
+    is_ozon_seller,
+    label_present,
+    normalize_text,
+)
+
+CHECK_ENGINE = os.getenv("OZON_ENGINE", "browser")
+HTTP_BASE_URL = os.getenv("OZON_HTTP_BASE_URL", "https://www.ozon.ru").rstrip("/")
+HTTP_USE_API = os.getenv("OZON_HTTP_API", "1") == "1"
+HTTP_TIMEOUT_SEC = float(os.getenv("OZON_HTTP_TIMEOUT", "10"))
+HTTP_POOL_SIZE = int(os.getenv("OZON_HTTP_POOL_SIZE", "8"))
+HTTP_USER_AGENT = os.getenv(
+    "OZON_HTTP_USER_AGENT",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36",
+)
+
+ENGINES = ("browser", "http")
+LABEL_WIDGET = "webMarketingLabels"
+SELLER_WIDGETS = ("webCurrentSeller", "webProductSeller", "webOutOfStockSeller", "webSellerCard")
+TEXT_KEYS = ("text", "title", "label", "name", "content", "alt")
+ICON_KEYS = ("icon", "image", "img", "imageUrl", "iconUrl")
+
+_STATE_TAG_RE = re.compile(r"<div\b[^>]*\bid=\"state-[^\"]+\"[^>]*>", re.IGNORECASE)
+_STATE_ID_RE = re.compile(r"\bid=\"state-([^\"]+)\"")
+_STATE_ATTR_RE = re.compile(r"\bdata-state=(?:'([^']*)'|\"([^\"]*)\")", re.DOTALL)
+
+_HTTP: Optional[urllib3.PoolManager] = None
+_HTTP_LOCK = threading.Lock()
+
+
+def http_client() -> urllib3.PoolManager:
+    global _HTTP
+    with _HTTP_LOCK:
+        if _HTTP is None:
+            headers = urllib3.make_headers(accept_encoding=True, user_agent=HTTP_USER_AGENT)
+            headers["Accept-Language"] = "ru-RU,ru;q=0.9"
+            _HTTP = urllib3.PoolManager(
+                num_pools=4,
+                maxsize=HTTP_POOL_SIZE,
+                headers=headers,
+                timeout=urllib3.Timeout(total=HTTP_TIMEOUT_SEC),
+                retries=urllib3.Retry(total=1, redirect=3, raise_on_status=False),
+            )
+        return _HTTP
+
+
+def product_path(url: str) -> Optional[str]:
+    path = urlsplit(url).path if "://" in url else url.split("?")[0]
+    if "/product/" not in path:
+        return None
+    return path if path.endswith("/") else f"{path}/"
+
+
+def _widget_name(state_id: str) -> str:
+    return state_id.split("-", 1)[0]
+
+
+def _decode_state(raw: Any) -> Any:
+    if isinstance(raw, str):
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return None
+    return raw
+
+
+def widget_states_from_api(payload: dict) -> dict[str, list[Any]]:
+    states: dict[str, list[Any]] = {}
+    for state_id, raw in (payload.get("widgetStates") or {}).items():
+        state = _decode_state(raw)
+        if state is not None:
+            states.setdefault(_widget_name(state_id), []).append(state)
+    return states
+
+
+def widget_states_from_html(page: str) -> dict[str, list[Any]]:
+    states: dict[str, list[Any]] = {}
+    for tag in _STATE_TAG_RE.findall(page or ""):
+        id_match = _STATE_ID_RE.search(tag)
+        attr_match = _STATE_ATTR_RE.search(tag)
+        if not id_match or not attr_match:
+            continue
+        raw = html.unescape(attr_match.group(1) or attr_match.group(2) or "")
+        state = _decode_state(raw)
+        if state is not None:
+            states.setdefault(_widget_name(id_match.group(1)), []).append(state)
+    return states
+
+
+def _walk_strings(node: Any, keys: tuple[str, ...], out: list[str]) -> None:
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key in keys and isinstance(value, str):
+                out.append(value)
+            else:
+                _walk_strings(value, keys, out)
+    elif isinstance(node, list):
+        for item in node:
+            _walk_strings(item, keys, out)
+
+
+def _has_icon(node: Any) -> bool:
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key in ICON_KEYS and value:
+                return True
+            if _has_icon(value):
+                return True
+    elif isinstance(node, list):
+        return any(_has_icon(item) for item in node)
+    return False
+
+
+def labels_from_states(states: dict[str, list[Any]]) -> tuple[bool, str]:
+    """
+    (widget_present, label_text) — та же сборка текста, что и в collect_label_text.
+    """
+    label_states = states.get(LABEL_WIDGET) or []
+    if not label_states:
+        return False, ""
+    chunks: list[str] = []
+    _walk_strings(label_states, TEXT_KEYS, chunks)
+    has_icon = _has_icon(label_states)
+    filtered = filter_label_chunks(chunks, has_icon=has_icon)
+    if not filtered:
+        return True, ""
+    combined = " ".join(filtered)
+    if has_icon and "подарок" not in normalize_text(combined):
+        return True, f"{combined} 🎁"
+    return True, combined
+
+
+def seller_from_states(states: dict[str, list[Any]]) -> Optional[str]:
+    for widget in SELLER_WIDGETS:
+        for state in states.get(widget) or []:
+            # Шаблоны extract_seller_from_source рассчитаны на компактный JSON страницы ("key":"value").
+            found = extract_seller_from_source(json.dumps(state, ensure_ascii=False, separators=(",", ":")))
+            if found:
+                return found
+            names: list[str] = []
+            _walk_strings(state, ("name", "title"), names)
+            for name in names:
+                name = name.strip()
+                if name and normalize_text(name) not in ("перейти", "продавец"):
+                    return name
+    return None
+
+
+def _fetch(url: str) -> Optional[str]:
+    try:
+        resp = http_client().request("GET", url)
+    except Exception:
+        return None
+    if resp.status != 200:
+        return None
+    try:
+        return resp.data.decode("utf-8", errors="replace")
+    except Exception:
+        return None
+
+
+def fetch_widget_states(url: str) -> tuple[dict[str, list[Any]], str]:
+    """
+    Состояния виджетов карточки и «сырой» текст ответа (для regex-фолбэков).
+    Сначала JSON-эндпоинт страницы, затем сама HTML-страница.
+    """
+    path = product_path(url)
+    if not path:
+        return {}, ""
+    if HTTP_USE_API:
+        body = _fetch(f"{HTTP_BASE_URL}/api/entrypoint-api.bx/page/json/v2?url={quote(path)}")
+        if body:
+            try:
+                payload = json.loads(body)
+            except ValueError:
+                payload = None
+            if isinstance(payload, dict):
+                states = widget_states_from_api(payload)
+                if states:
+                    return states, body
+    body = _fetch(f"{HTTP_BASE_URL}{path}")
+    if not body:
+        return {}, ""
+    return widget_states_from_html(body), body
+
+
+def check_url_http(url: str) -> Optional[CheckResult]:
+    """
+    Проверка карточки без браузера. None — результат неоднозначен
+    (капча, нет данных страницы, не нашли продавца), нужен check_url.
+    """
+    states, raw = fetch_widget_states(url)
+    if not states:
+        return None
+    widget_present, label_text = labels_from_states(states)
+    if not widget_present and not any(states.get(w) for w in PRODUCT_WIDGETS):
+        # Отсутствие виджета можно утверждать, только если страница пришла целиком.
+        return None
+    seller_name = seller_from_states(states) or extract_seller_from_source(raw)
+    if not seller_name:
+        return None
+    return CheckResult(
+        url=url,
+        ok=True,
+        has_label=label_present(label_text),
+        seller_ok=is_ozon_seller(seller_name, ""),
+        seller_name=seller_name,
+        label_text=label_text,
+        error=None,
+    )
+
+
+def iter_http_checks(
+    urls: Iterable[str],
+    cancel_check: Optional[Callable[[], bool]] = None,
+    workers: int = HTTP_POOL_SIZE,
+) -> Iterator[tuple[str, Optional[CheckResult]]]:
+    """
+    Быстрый проход по списку: (url, result) в исходном порядке, result=None —
+    карточку нужно проверить браузером.
+    """
+    url_list = list(urls)
+    step = max(1, int(workers))
+    with ThreadPoolExecutor(max_workers=step) as executor:
+        for start in range(0, len(url_list), step):
+            if cancel_check and cancel_check():
+                return
+            chunk = url_list[start : start + step]
+            for url, result in zip(chunk, executor.map(check_url_http, chunk)):
+                yield url, result
@@ -0,0 +1,320 @@
+import gzip
+import json
+import mmap
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+BASE_DIR = Path(__file__).resolve().parent
+HISTORY_DIR = Path(os.getenv("OZON_HISTORY_DIR", str(BASE_DIR / "job_history")))
+HISTORY_SEGMENT_MB = float(os.getenv("OZON_HISTORY_SEGMENT_MB", "64"))
+HISTORY_SEGMENT_SEC = int(os.getenv("OZON_HISTORY_SEGMENT_SEC", "86400"))
+HISTORY_KEEP_DAYS = int(os.getenv("OZON_HISTORY_KEEP_DAYS", "90"))
+HISTORY_COMPRESS_LEVEL = 6
+# Старые сегменты удаляем не на каждой пачке, а раз в N секунд.
+HISTORY_PRUNE_SEC = 3600
+# Прежний файл истории переносим пачками по N записей; файл переноса, который не обновлялся
+# дольше HISTORY_IMPORT_STALE_SEC, считаем брошенным (процесс упал) и переносим заново.
+HISTORY_IMPORT_BATCH = 500
+HISTORY_IMPORT_STALE_SEC = 300
+
+_SEGMENT_PREFIX = "segment-"
+_SEGMENT_SUFFIX = ".jsonl.gz"
+
+
+def segment_started_at(name: str) -> int:
+    try:
+        return int(name[len(_SEGMENT_PREFIX) : -len(_SEGMENT_SUFFIX)].split("-")[0])
+    except ValueError:
+        return 0
+
+
+class JobHistory:
+    """
+    История задач в сегментах segment-<время>-<pid>-<n>.jsonl.gz. Каждая запись — отдельный
+    gzip-член (сегмент целиком читается обычным gzip -d), поэтому одну задачу
+    можно достать по смещению из индекса, не распаковывая остальной сегмент.
+    Индекс (index.sqlite3): задача -> сегмент, смещение, длина, даты и счётчики.
+    У задачи, сохранённой несколько раз, в индексе остаётся последняя запись.
+    """
+
+    def __init__(
+        self,
+        root: Path = HISTORY_DIR,
+        segment_mb: float = HISTORY_SEGMENT_MB,
+        segment_sec: int = HISTORY_SEGMENT_SEC,
+        keep_days: int = HISTORY_KEEP_DAYS,
+        legacy_file: Optional[Path] = None,
+    ):
+        self.root = Path(root)
+        self.segment_bytes = int(max(0.0, segment_mb) * 1024 * 1024)
+        self.segment_sec = max(0, int(segment_sec))
+        self.keep_sec = max(0, int(keep_days)) * 86400
+        self.legacy_file = Path(legacy_file) if legacy_file else None
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._segment: Optional[Path] = None
+        self._pruned_at = 0.0
+        self._rotations = 0
+        self._import_retry_at = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.root.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.root / "index.sqlite3"), timeout=10, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS history ("
+                "job_id TEXT PRIMARY KEY, segment TEXT NOT NULL, offset INTEGER NOT NULL, "
+                "length INTEGER NOT NULL, status TEXT, created_at REAL, finished_at REAL, "
+                "total INTEGER, results INTEGER, written_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS history_created_at ON history(created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS history_segment ON history(segment)")
+            self._conn = conn
+        return self._conn
+
+    def _segments(self) -> list[Path]:
+        if not self.root.exists():
+            return []
+        return sorted(
+            (p for p in self.root.glob(f"{_SEGMENT_PREFIX}*{_SEGMENT_SUFFIX}")),
+            key=lambda p: (segment_started_at(p.name), p.name),
+        )
+
+    def _active_segment(self) -> Path:
+        """
+        Текущий сегмент этого процесса или новый, если текущий перерос segment_mb или segment_sec.
+        """
+        segment = self._segment
+        if segment is None:
+            # Дописываем только в сегменты своего процесса: если историю пишут и веб-процесс,
+            # и планировщик, записи в общем файле перемешаются и смещения в индексе разойдутся.
+            own = f"-{os.getpid()}-"
+            segments = [p for p in self._segments() if own in p.name]
+            segment = segments[-1] if segments else None
+        now = time.time()
+        if segment is not None and segment.exists():
+            too_big = self.segment_bytes and segment.stat().st_size >= self.segment_bytes
+            too_old = self.segment_sec and now - segment_started_at(segment.name) >= self.segment_sec
+            if not too_big and not too_old:
+                self._segment = segment
+                return segment
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._rotations += 1
+        name = f"{_SEGMENT_PREFIX}{int(now)}-{os.getpid()}-{self._rotations}{_SEGMENT_SUFFIX}"
+        self._segment = self.root / name
+        return self._segment
+
+    def append(self, records: list[dict], fsync: str = "batch") -> int:
+        """
+        Дописывает записи в текущий сегмент и индекс. Возвращает число fsync.
+        Индекс обновляется после записи данных, так что он не ссылается на недописанное.
+        """
+        with self._lock:
+            self._import_legacy()
+            fsyncs = self._append(records, fsync)
+            if self.keep_sec and time.time() - self._pruned_at > HISTORY_PRUNE_SEC:
+                self._prune(self._connect())
+        return fsyncs
+
+    def _append(self, records: list[dict], fsync: str) -> int:
+        fsyncs = 0
+        rows = []
+        pending = list(records)
+        while pending:
+            segment = self._active_segment()
+            with segment.open("ab") as f:
+                while pending:
+                    record = pending.pop(0)
+                    data = gzip.compress(
+                        (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"),
+                        compresslevel=HISTORY_COMPRESS_LEVEL,
+                    )
+                    offset = f.tell()
+                    f.write(data)
+                    if fsync == "always":
+                        f.flush()
+                        os.fsync(f.fileno())
+                        fsyncs += 1
+                    rows.append(
+                        (
+                            str(record.get("id")),
+                            segment.name,
+                            offset,
+                            len(data),
+                            record.get("status"),
+                            record.get("created_at"),
+                            record.get("finished_at"),
+                            record.get("total"),
+                            len(record.get("results") or []),
+                            time.time(),
+                        )
+                    )
+                    if self.segment_bytes and f.tell() >= self.segment_bytes:
+                        # Сегмент заполнен: остаток пачки уходит в следующий.
+                        break
+                f.flush()
+                if fsync == "batch":
+                    os.fsync(f.fileno())
+                    fsyncs += 1
+        conn = self._connect()
+        conn.executemany(
+            "INSERT OR REPLACE INTO history (job_id, segment, offset, length, status, created_at, "
+            "finished_at, total, results, written_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        conn.commit()
+        return fsyncs
+
+    def _claim_legacy(self) -> Optional[Path]:
+        """
+        Забирает файл для переноса: сам прежний файл или брошенный <файл>.importing-<pid>
+        (процесс упал посреди переноса). Забранный файл переименовывается в свой
+        .importing-<pid>, так что переносит его только один процесс.
+        """
+        legacy = self.legacy_file
+        own = legacy.with_name(f"{legacy.name}.importing-{os.getpid()}")
+        now = time.time()
+        busy = False
+        for path in [legacy] + sorted(legacy.parent.glob(f"{legacy.name}.importing*")):
+            try:
+                if path not in (legacy, own) and now - path.stat().st_mtime < HISTORY_IMPORT_STALE_SEC:
+                    # Его сейчас переносит другой процесс; если тот упадёт, заберём позже.
+                    busy = True
+                    continue
+                os.replace(path, own)
+            except OSError:
+                continue
+            return own
+        if busy:
+            self._import_retry_at = now + HISTORY_IMPORT_STALE_SEC
+        else:
+            self.legacy_file = None
+        return None
+
+    def _import_legacy(self) -> None:
+        # Прежний job_history.jsonl переносим в сегменты; кто переименовал файл, тот и переносит.
+        # Если перенос оборвался, файл остаётся .importing-<pid> и переносится заново целиком:
+        # индекс ключуется по id задачи, так что повторные записи лишь заменяют прежние.
+        if self.legacy_file is None or time.time() < self._import_retry_at:
+            return
+        while self.legacy_file is not None:
+            importing = self._claim_legacy()
+            if importing is None:
+                return
+            batch: list[dict] = []
+            with importing.open("r", encoding="utf-8", errors="replace") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if not isinstance(record, dict) or not record.get("id"):
+                        continue
+                    batch.append(record)
+                    if len(batch) >= HISTORY_IMPORT_BATCH:
+                        self._append(batch, "batch")
+                        batch = []
+                        # Отмечаем, что перенос жив, чтобы другой процесс не счёл файл брошенным.
+                        os.utime(importing)
+            if batch:
+                self._append(batch, "batch")
+            os.replace(importing, importing.with_name(f"{self.legacy_file.name}.imported"))
+
+    def _prune(self, conn: sqlite3.Connection) -> None:
+        self._pruned_at = time.time()
+        cutoff = time.time() - self.keep_sec
+        for segment in self._segments():
+            if segment == self._segment:
+                continue
+            try:
+                if segment.stat().st_mtime >= cutoff:
+                    continue
+                segment.unlink()
+            except OSError:
+                # Сегмент сейчас читают (на Windows открытый файл не удалить) — попробуем позже.
+                continue
+            conn.execute("DELETE FROM history WHERE segment = ?", (segment.name,))
+        conn.commit()
+
+    def locate(self, job_id: str) -> Optional[tuple[str, int, int]]:
+        """
+        Где лежит последняя запись задачи: сегмент, смещение, длина. Пока запись не
+        перезаписана, место не меняется, поэтому по нему можно кэшировать прочитанное.
+        """
+        with self._lock:
+            self._import_legacy()
+            row = self._connect().execute(
+                "SELECT segment, offset, length FROM history WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        return tuple(row) if row else None
+
+    def read(self, location: tuple[str, int, int]) -> Optional[dict]:
+        """
+        Запись по месту из locate(): читается только её кусок сегмента через mmap.
+        """
+        segment, offset, length = location
+        try:
+            with (self.root / segment).open("rb") as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    data = mapped[offset : offset + length]
+            return json.loads(gzip.decompress(data).decode("utf-8"))
+        except (OSError, ValueError, EOFError):
+            return None
+
+    def load(self, job_id: str) -> Optional[dict]:
+        location = self.locate(job_id)
+        return self.read(location) if location else None
+
+    def list_jobs(
+        self,
+        limit: int = 50,
+        offset: int = 0,
+        status: Optional[str] = None,
+        created_from: Optional[float] = None,
+        created_to: Optional[float] = None,
+    ) -> tuple[list[dict], int]:
+        where = []
+        params: list = []
+        if status:
+            where.append("status = ?")
+            params.append(status)
+        if created_from is not None:
+            where.append("created_at >= ?")
+            params.append(created_from)
+        if created_to is not None:
+            where.append("created_at < ?")
+            params.append(created_to)
+        clause = f" WHERE {' AND '.join(where)}" if where else ""
+        with self._lock:
+            self._import_legacy()
+            conn = self._connect()
+            total = conn.execute(f"SELECT COUNT(*) FROM history{clause}", params).fetchone()[0]
+            rows = conn.execute(
+                "SELECT job_id, status, created_at, finished_at, total, results, segment "
+                f"FROM history{clause} ORDER BY created_at DESC LIMIT ? OFFSET ?",
+                params + [max(0, limit), max(0, offset)],
+            ).fetchall()
+        items = [
+            {
+                "id": row[0],
+                "status": row[1],
+                "created_at": row[2],
+                "finished_at": row[3],
+                "total": row[4],
+                "results": row[5],
+                "segment": row[6],
+            }
+            for row in rows
+        ]
+        return items, int(total)
+
+    def close(self) -> None:
+        with self._lock:
+            conn, self._conn = self._conn, None
+        if conn is not None:
+            conn.close()
@@ -0,0 +1,137 @@
+import heapq
+from itertools import islice
+from typing import Iterable, Iterator, Optional
+
+from ozon_check import product_key
+
+
+class PendingUrls:
+    """
+    Очередь непроверенных ссылок задачи. Порядок — как у списка, но удаление
+    по ссылке или по артикулу карточки за O(1), а не поиском по всему списку.
+    Добавления ещё и копятся в журнале: в хранилище очередь пишется только им,
+    а убыль видна по отметкам проверенных карточек.
+    """
+
+    __slots__ = ("_urls", "_by_key", "_added")
+
+    def __init__(self, urls: Iterable[str] = ()):
+        self._urls: dict[str, None] = {}
+        self._by_key: dict[str, str] = {}
+        self._added: list[str] = []
+        for url in urls:
+            self.add(url)
+
+    def add(self, url: str) -> None:
+        if url in self._urls:
+            return
+        self._urls[url] = None
+        self._added.append(url)
+        key = product_key(url)
+        if key:
+            self._by_key.setdefault(key, url)
+
+    def discard(self, url: str) -> bool:
+        """
+        Убирает ссылку; если такой нет — ссылку на ту же карточку (другой вид адреса).
+        """
+        if url not in self._urls:
+            key = product_key(url)
+            url = self._by_key.get(key, "") if key else ""
+            if url not in self._urls:
+                return False
+        del self._urls[url]
+        key = product_key(url)
+        if key and self._by_key.get(key) == url:
+            del self._by_key[key]
+        return True
+
+    @property
+    def added(self) -> int:
+        return len(self._added)
+
+    def added_since(self, start: int) -> list[str]:
+        return self._added[max(0, start) :]
+
+    def head(self, limit: int) -> list[str]:
+        return list(islice(self._urls, max(0, limit)))
+
+    def page(self, since: int, limit: int) -> list[str]:
+        # Позиция — по текущей очереди: пока задача идёт, очередь убывает и позиции сдвигаются.
+        since = max(0, since)
+        return list(islice(self._urls, since, since + max(0, limit)))
+
+    def __len__(self) -> int:
+        return len(self._urls)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._urls)
+
+    def __contains__(self, url: object) -> bool:
+        return url in self._urls
+
+
+class JobExpiry:
+    """
+    Очереди вытеснения задач из памяти: куча по времени завершения (для TTL)
+    и куча по времени создания (для лимита числа задач). Записи не удаляются
+    при замене задачи — устаревшие отбрасываются при выборке.
+    """
+
+    __slots__ = ("_finished", "_created")
+
+    def __init__(self):
+        self._finished: list[tuple[float, str]] = []
+        self._created: list[tuple[float, str]] = []
+
+    def created(self, job_id: str, created_at: float) -> None:
+        heapq.heappush(self._created, (created_at, job_id))
+
+    def finished(self, job_id: str, finished_at: Optional[float]) -> None:
+        if finished_at:
+            heapq.heappush(self._finished, (finished_at, job_id))
+
+    def expired(self, jobs: dict[str, dict], cutoff: float) -> list[str]:
+        """
+        Задачи, завершённые раньше cutoff. Смотрит только начало кучи.
+        """
+        found = []
+        while self._finished and self._finished[0][0] < cutoff:
+            finished_at, job_id = heapq.heappop(self._finished)
+            job = jobs.get(job_id)
+            if job is not None and job.get("finished_at") == finished_at:
+                found.append(job_id)
+        return found
+
+    def oldest(self, jobs: dict[str, dict], count: int) -> list[str]:
+        """
+        До count самых старых завершённых задач. Незавершённые не вытесняются:
+        их записи возвращаются в кучу и дождутся завершения задачи.
+        """
+        found: list[str] = []
+        waiting: list[tuple[float, str]] = []
+        while self._created and len(found) < count:
+            entry = heapq.heappop(self._created)
+            created_at, job_id = entry
+            job = jobs.get(job_id)
+            if job is None or job.get("created_at") != created_at or job_id in found:
+                continue
+            if job.get("finished_at"):
+                found.append(job_id)
+            else:
+                waiting.append(entry)
+        for entry in waiting:
+            heapq.heappush(self._created, entry)
+        return found
+
+    def compact(self, jobs: dict[str, dict]) -> None:
+        # Устаревшие записи копятся, пока не дойдут до вершины кучи; при заметном перекосе — пересобираем.
+        limit = 4 * len(jobs) + 64
+        if len(self._created) > limit:
+            self._created = [(job["created_at"], job_id) for job_id, job in jobs.items()]
+            heapq.heapify(self._created)
+        if len(self._finished) > limit:
+            self._finished = [
+                (job["finished_at"], job_id) for job_id, job in jobs.items() if job.get("finished_at")
+            ]
+            heapq.heapify(self._finished)
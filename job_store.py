@@ -0,0 +1,539 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from queue import Empty, Queue
+from typing import Optional
+
+BASE_DIR = Path(__file__).resolve().parent
+JOB_STORE_KIND = os.getenv("OZON_JOB_STORE", "sqlite")
+JOB_STORE_FILE = Path(os.getenv("OZON_JOB_STORE_FILE", str(BASE_DIR / "jobs.sqlite3")))
+# Планировщик продлевает аренду каждую секунду; просроченную забирает другой процесс.
+SCHEDULER_LEASE_SEC = int(os.getenv("OZON_SCHEDULER_LEASE_SEC", "30"))
+
+JOB_STORES = ("sqlite", "memory")
+
+# Новые ссылки списков задачи: {поле: (позиция, ссылки)}.
+UrlChanges = dict[str, tuple[int, list[str]]]
+
+
+class JobStore(ABC):
+    """
+    Задачи, очередь и результаты. shared=True — хранилище общее для всех
+    процессов (воркеры gunicorn видят задачи друг друга), иначе только своё.
+
+    Задача хранится как небольшая запись без результатов и списков ссылок
+    (job_record в app.py); результаты дописываются отдельно с позиции start,
+    списки ссылок — строками: urls = {поле: (позиция, ссылки)}, всё с позиции
+    заменяется. У записи своя версия, у результатов, ссылок и отметок — своя.
+    """
+
+    shared = False
+
+    def save(
+        self,
+        record: dict,
+        start: int = 0,
+        results: Optional[list[dict]] = None,
+        urls: Optional[UrlChanges] = None,
+    ) -> int:
+        return 0
+
+    def load(self, job_id: str) -> Optional[tuple[dict, int]]:
+        return None
+
+    def versions(self, job_id: str) -> Optional[tuple[int, int]]:
+        """
+        (версия записи, версия прогресса) — вторая растёт с каждой контрольной точкой.
+        """
+        return None
+
+    def results(self, job_id: str, since: int = 0) -> list[dict]:
+        return []
+
+    def urls(self, job_id: str, kind: str) -> list[str]:
+        return []
+
+    def url_rows(self, job_id: str, kinds: tuple[str, ...], after: int = 0) -> list[tuple[int, str, int, str]]:
+        """
+        Строки ссылок, записанные после after: (seq, поле, позиция, ссылка) по порядку записи.
+        """
+        return []
+
+    def checkpoint(
+        self,
+        job_id: str,
+        start: int,
+        results: list[dict],
+        marks: list[tuple[str, str, str]],
+        urls: Optional[UrlChanges] = None,
+    ) -> None:
+        pass
+
+    def marks(self, job_id: str) -> dict[str, dict[str, str]]:
+        return {}
+
+    def mark_rows(self, job_id: str, kind: str, after: int = 0) -> list[tuple[int, str]]:
+        """
+        Отметки вида kind, добавленные после after: (seq, ключ) по порядку записи.
+        """
+        return []
+
+    def recover(self, owner: str, lease_sec: int = SCHEDULER_LEASE_SEC) -> list[str]:
+        return []
+
+    def list_jobs(self, limit: int) -> list[dict]:
+        return []
+
+    def prune(self, ttl_sec: int, max_jobs: int) -> None:
+        pass
+
+    @abstractmethod
+    def enqueue(self, job_id: str) -> None:
+        ...
+
+    @abstractmethod
+    def claim(self, owner: str, timeout: float) -> Optional[str]:
+        ...
+
+    def release(self, job_id: str) -> None:
+        pass
+
+    def unclaim(self, job_id: str, owner: str) -> None:
+        pass
+
+    def cancel(self, job_id: str) -> None:
+        pass
+
+    def cancelled(self, job_ids: list[str]) -> set[str]:
+        return set()
+
+    def acquire_scheduler(self, owner: str, lease_sec: int = SCHEDULER_LEASE_SEC) -> bool:
+        return True
+
+    def release_scheduler(self, owner: str) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryJobStore(JobStore):
+    """
+    Прежнее поведение: очередь в памяти процесса, после перезапуска задач нет.
+    """
+
+    def __init__(self):
+        self._queue: "Queue[str]" = Queue()
+
+    def enqueue(self, job_id: str) -> None:
+        self._queue.put(job_id)
+
+    def claim(self, owner: str, timeout: float) -> Optional[str]:
+        try:
+            return self._queue.get(timeout=timeout)
+        except Empty:
+            return None
+
+
+class SqliteJobStore(JobStore):
+    shared = True
+
+    def __init__(self, path: Path = JOB_STORE_FILE):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        # Задачу, поставленную этим же процессом, планировщик берёт без ожидания опроса.
+        self._wakeup = threading.Event()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(
+                str(self.path), timeout=10, check_same_thread=False, isolation_level=None
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, status TEXT NOT NULL, created_at REAL NOT NULL, "
+                "finished_at REAL, total INTEGER NOT NULL DEFAULT 0, done INTEGER NOT NULL DEFAULT 0, "
+                "cancelled INTEGER NOT NULL DEFAULT 0, version INTEGER NOT NULL DEFAULT 0, "
+                "progress INTEGER NOT NULL DEFAULT 0, updated_at REAL NOT NULL, state TEXT NOT NULL)"
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "progress" not in columns:
+                # Файл хранилища прежней версии.
+                conn.execute("ALTER TABLE jobs ADD COLUMN progress INTEGER NOT NULL DEFAULT 0")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_created_at ON jobs(created_at)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS job_queue ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, job_id TEXT NOT NULL UNIQUE, "
+                "enqueued_at REAL NOT NULL, claimed_by TEXT, claimed_at REAL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS job_results ("
+                "job_id TEXT NOT NULL, pos INTEGER NOT NULL, verdict TEXT NOT NULL, "
+                "payload TEXT NOT NULL, PRIMARY KEY (job_id, pos))"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS job_results_verdict ON job_results(job_id, verdict, pos)"
+            )
+            # Отметки прогресса по ссылкам: проверена, решение фильтра продавца, страница выдачи.
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS job_marks ("
+                "job_id TEXT NOT NULL, kind TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+                "PRIMARY KEY (job_id, kind, key))"
+            )
+            # Индекс включает rowid: копии задачи дочитывают новые отметки по нему.
+            conn.execute("CREATE INDEX IF NOT EXISTS job_marks_seq ON job_marks(job_id, kind)")
+            # Списки ссылок задачи (urls, search_urls, pending_urls) по позициям; seq — порядок записи.
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS job_urls ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, job_id TEXT NOT NULL, kind TEXT NOT NULL, "
+                "pos INTEGER NOT NULL, url TEXT NOT NULL, UNIQUE (job_id, kind, pos))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS job_urls_seq ON job_urls(job_id, seq)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS scheduler ("
+                "id INTEGER PRIMARY KEY CHECK (id = 1), owner TEXT NOT NULL, heartbeat_at REAL NOT NULL)"
+            )
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def _result_rows(job_id: str, start: int, results: Optional[list[dict]]) -> list[tuple]:
+        return [
+            (job_id, start + offset, item.get("verdict") or "unknown", json.dumps(item, ensure_ascii=False))
+            for offset, item in enumerate(results or [])
+        ]
+
+    @staticmethod
+    def _write_urls(conn: sqlite3.Connection, job_id: str, urls: Optional[UrlChanges]) -> None:
+        for kind, (start, items) in (urls or {}).items():
+            conn.execute(
+                "DELETE FROM job_urls WHERE job_id = ? AND kind = ? AND pos >= ?", (job_id, kind, start)
+            )
+            conn.executemany(
+                "INSERT INTO job_urls (job_id, kind, pos, url) VALUES (?, ?, ?, ?)",
+                [(job_id, kind, start + offset, url) for offset, url in enumerate(items)],
+            )
+
+    def save(
+        self,
+        record: dict,
+        start: int = 0,
+        results: Optional[list[dict]] = None,
+        urls: Optional[UrlChanges] = None,
+    ) -> int:
+        state = json.dumps(record, ensure_ascii=False)
+        rows = self._result_rows(record["id"], start, results)
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT INTO jobs (id, status, created_at, finished_at, total, done, version, updated_at, state) "
+                    "VALUES (?, ?, ?, ?, ?, ?, 1, ?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET status = excluded.status, finished_at = excluded.finished_at, "
+                    "total = excluded.total, done = excluded.done, version = jobs.version + 1, "
+                    "updated_at = excluded.updated_at, state = excluded.state",
+                    (
+                        record["id"],
+                        record.get("status") or "queued",
+                        record.get("created_at") or time.time(),
+                        record.get("finished_at"),
+                        int(record.get("total") or 0),
+                        int(record.get("done") or 0),
+                        time.time(),
+                        state,
+                    ),
+                )
+                if rows:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO job_results (job_id, pos, verdict, payload) VALUES (?, ?, ?, ?)",
+                        rows,
+                    )
+                self._write_urls(conn, record["id"], urls)
+                if rows or urls:
+                    conn.execute("UPDATE jobs SET progress = progress + 1 WHERE id = ?", (record["id"],))
+                version = conn.execute("SELECT version FROM jobs WHERE id = ?", (record["id"],)).fetchone()[0]
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return int(version)
+
+    def load(self, job_id: str) -> Optional[tuple[dict, int]]:
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT state, cancelled, version FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if not row:
+            return None
+        record = json.loads(row[0])
+        record["cancelled"] = bool(record.get("cancelled") or row[1])
+        return record, int(row[2])
+
+    def versions(self, job_id: str) -> Optional[tuple[int, int]]:
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT version, progress FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return (int(row[0]), int(row[1])) if row else None
+
+    def results(self, job_id: str, since: int = 0) -> list[dict]:
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT payload FROM job_results WHERE job_id = ? AND pos >= ? ORDER BY pos",
+                (job_id, max(0, since)),
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def urls(self, job_id: str, kind: str) -> list[str]:
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT url FROM job_urls WHERE job_id = ? AND kind = ? ORDER BY pos", (job_id, kind)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def url_rows(self, job_id: str, kinds: tuple[str, ...], after: int = 0) -> list[tuple[int, str, int, str]]:
+        if not kinds:
+            return []
+        marks = ",".join("?" for _ in kinds)
+        with self._lock:
+            rows = self._connect().execute(
+                f"SELECT seq, kind, pos, url FROM job_urls WHERE job_id = ? AND seq > ? AND kind IN ({marks}) "
+                "ORDER BY seq",
+                (job_id, after, *kinds),
+            ).fetchall()
+        return [(int(row[0]), row[1], int(row[2]), row[3]) for row in rows]
+
+    def checkpoint(
+        self,
+        job_id: str,
+        start: int,
+        results: list[dict],
+        marks: list[tuple[str, str, str]],
+        urls: Optional[UrlChanges] = None,
+    ) -> None:
+        """
+        Новые результаты, ссылки и отметки одной транзакцией — без перезаписи всей задачи.
+        Версия записи задачи не меняется, растёт только версия прогресса.
+        """
+        rows = self._result_rows(job_id, start, results)
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if rows:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO job_results (job_id, pos, verdict, payload) VALUES (?, ?, ?, ?)",
+                        rows,
+                    )
+                if marks:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO job_marks (job_id, kind, key, value) VALUES (?, ?, ?, ?)",
+                        [(job_id, kind, key, value) for kind, key, value in marks],
+                    )
+                self._write_urls(conn, job_id, urls)
+                conn.execute("UPDATE jobs SET progress = progress + 1 WHERE id = ?", (job_id,))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def marks(self, job_id: str) -> dict[str, dict[str, str]]:
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT kind, key, value FROM job_marks WHERE job_id = ?", (job_id,)
+            ).fetchall()
+        found: dict[str, dict[str, str]] = {}
+        for kind, key, value in rows:
+            found.setdefault(kind, {})[key] = value
+        return found
+
+    def mark_rows(self, job_id: str, kind: str, after: int = 0) -> list[tuple[int, str]]:
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT rowid, key FROM job_marks WHERE job_id = ? AND kind = ? AND rowid > ? ORDER BY rowid",
+                (job_id, kind, after),
+            ).fetchall()
+        return [(int(row[0]), row[1]) for row in rows]
+
+    def recover(self, owner: str, lease_sec: int = SCHEDULER_LEASE_SEC) -> list[str]:
+        """
+        Новый планировщик забирает задачи прежнего: снимает его захваты очереди
+        и возвращает в очередь незавершённые задачи, которых в ней нет.
+        Владелец аренды обновляет claimed_at своих захватов вместе с арендой,
+        поэтому снимаются только захваты, не продлённые дольше lease_sec.
+        """
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "UPDATE job_queue SET claimed_by = NULL, claimed_at = NULL "
+                    "WHERE claimed_by IS NOT NULL AND claimed_by != ? AND claimed_at < ?",
+                    (owner, time.time() - lease_sec),
+                )
+                conn.execute(
+                    "INSERT OR IGNORE INTO job_queue (job_id, enqueued_at) "
+                    "SELECT id, ? FROM jobs WHERE status IN ('queued', 'running') ORDER BY created_at",
+                    (time.time(),),
+                )
+                rows = conn.execute(
+                    "SELECT job_id FROM job_queue WHERE claimed_by IS NULL ORDER BY seq"
+                ).fetchall()
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return [row[0] for row in rows]
+
+    def list_jobs(self, limit: int) -> list[dict]:
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT id, status, total, done, created_at FROM jobs ORDER BY created_at DESC LIMIT ?",
+                (max(0, limit),),
+            ).fetchall()
+        return [
+            {"id": row[0], "status": row[1], "total": row[2], "done": row[3], "created_at": row[4]}
+            for row in rows
+        ]
+
+    def prune(self, ttl_sec: int, max_jobs: int) -> None:
+        """
+        Удаляются только завершённые задачи: старше ttl_sec и сверх max_jobs самых новых.
+        """
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                expired = [
+                    row[0]
+                    for row in conn.execute(
+                        "SELECT id FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?",
+                        (time.time() - ttl_sec,),
+                    )
+                ]
+                expired += [
+                    row[0]
+                    for row in conn.execute(
+                        "SELECT id FROM jobs WHERE finished_at IS NOT NULL AND id NOT IN ("
+                        "SELECT id FROM jobs ORDER BY created_at DESC LIMIT ?)",
+                        (max(0, max_jobs),),
+                    )
+                ]
+                for job_id in set(expired):
+                    conn.execute("DELETE FROM job_results WHERE job_id = ?", (job_id,))
+                    conn.execute("DELETE FROM job_marks WHERE job_id = ?", (job_id,))
+                    conn.execute("DELETE FROM job_urls WHERE job_id = ?", (job_id,))
+                    conn.execute("DELETE FROM job_queue WHERE job_id = ?", (job_id,))
+                    conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def enqueue(self, job_id: str) -> None:
+        with self._lock:
+            self._connect().execute(
+                "INSERT OR IGNORE INTO job_queue (job_id, enqueued_at) VALUES (?, ?)",
+                (job_id, time.time()),
+            )
+        self._wakeup.set()
+
+    def claim(self, owner: str, timeout: float) -> Optional[str]:
+        deadline = time.time() + timeout
+        while True:
+            self._wakeup.clear()
+            with self._lock:
+                conn = self._connect()
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    row = conn.execute(
+                        "SELECT seq, job_id FROM job_queue WHERE claimed_by IS NULL ORDER BY seq LIMIT 1"
+                    ).fetchone()
+                    if row:
+                        conn.execute(
+                            "UPDATE job_queue SET claimed_by = ?, claimed_at = ? WHERE seq = ?",
+                            (owner, time.time(), row[0]),
+                        )
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+            if row:
+                return str(row[1])
+            left = deadline - time.time()
+            if left <= 0:
+                return None
+            self._wakeup.wait(min(left, 1.0))
+
+    def release(self, job_id: str) -> None:
+        with self._lock:
+            self._connect().execute("DELETE FROM job_queue WHERE job_id = ?", (job_id,))
+
+    def unclaim(self, job_id: str, owner: str) -> None:
+        """
+        Возвращает задачу в очередь, не снимая её: захват owner освобождается.
+        """
+        with self._lock:
+            self._connect().execute(
+                "UPDATE job_queue SET claimed_by = NULL, claimed_at = NULL WHERE job_id = ? AND claimed_by = ?",
+                (job_id, owner),
+            )
+
+    def cancel(self, job_id: str) -> None:
+        with self._lock:
+            self._connect().execute("UPDATE jobs SET cancelled = 1 WHERE id = ?", (job_id,))
+
+    def cancelled(self, job_ids: list[str]) -> set[str]:
+        if not job_ids:
+            return set()
+        marks = ",".join("?" for _ in job_ids)
+        with self._lock:
+            rows = self._connect().execute(
+                f"SELECT id FROM jobs WHERE cancelled = 1 AND id IN ({marks})", list(job_ids)
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def acquire_scheduler(self, owner: str, lease_sec: int = SCHEDULER_LEASE_SEC) -> bool:
+        """
+        Аренда планировщика: True — этот процесс ведёт очередь и держит браузеры.
+        Повторный вызов владельцем продлевает аренду.
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            cursor = conn.execute(
+                "INSERT INTO scheduler (id, owner, heartbeat_at) VALUES (1, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET owner = excluded.owner, heartbeat_at = excluded.heartbeat_at "
+                "WHERE scheduler.owner = excluded.owner OR scheduler.heartbeat_at < ?",
+                (owner, now, now - lease_sec),
+            )
+            acquired = cursor.rowcount > 0
+            if acquired:
+                # Захваты живого владельца не считаются брошенными (см. recover).
+                conn.execute("UPDATE job_queue SET claimed_at = ? WHERE claimed_by = ?", (now, owner))
+        return acquired
+
+    def release_scheduler(self, owner: str) -> None:
+        with self._lock:
+            self._connect().execute("DELETE FROM scheduler WHERE owner = ?", (owner,))
+
+    def close(self) -> None:
+        with self._lock:
+            conn, self._conn = self._conn, None
+        if conn is not None:
+            conn.close()
+
+
+def create_job_store(kind: str = JOB_STORE_KIND) -> JobStore:
+    if str(kind).strip().lower() == "memory":
+        return MemoryJobStore()
+    return SqliteJobStore()
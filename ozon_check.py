@@ -7,17 +7,17 @@ import shutil
 import subprocess
 import tempfile
 import time
+from collections import deque
 from urllib.parse import quote_plus
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass
 from pathlib import Path
-from typing import Callable, Optional
+from typing import Callable, Iterable, Iterator, Optional
 
 from selenium import webdriver
 from selenium.common.exceptions import TimeoutException, WebDriverException, SessionNotCreatedException
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
 from webdriver_manager.chrome import ChromeDriverManager
 
 DEFAULT_PAGE_TIMEOUT_SEC = int(os.getenv("OZON_PAGE_TIMEOUT", "90"))
@@ -40,6 +40,62 @@ DEFAULT_SEARCH_LOAD_WAIT_SEC = float(os.getenv("OZON_SEARCH_LOAD_WAIT", "1.0"))
 DEFAULT_SEARCH_SCROLL_WAIT_SEC = float(os.getenv("OZON_SEARCH_SCROLL_WAIT", "0.7"))
 DEFAULT_SEARCH_STABLE_HITS = int(os.getenv("OZON_SEARCH_STABLE_HITS", "1"))
 DEFAULT_SEARCH_STABLE_PAUSE_SEC = float(os.getenv("OZON_SEARCH_STABLE_PAUSE", "0.3"))
+SEARCH_CONVERGE_PAGES = int(os.getenv("OZON_SEARCH_CONVERGE_PAGES", "2"))
+DEFAULT_SEARCH_TABS = int(os.getenv("OZON_SEARCH_TABS", "1"))
+TILE_SELLER = os.getenv("OZON_TILE_SELLER", "1") == "1"
+# Такие «имена» в плитке — это подписи кнопок, а не продавец: карточку нужно открыть.
+AMBIGUOUS_SELLER_NAMES = {"", "продавец", "перейти", "в магазин", "магазин"}
+DEFAULT_TABS = int(os.getenv("OZON_TABS", "1"))
+LABEL_ABSENT_GRACE_SEC = float(os.getenv("OZON_LABEL_ABSENT_GRACE", "1.0"))
+READY_TIMEOUT_SEC = float(os.getenv("OZON_READY_TIMEOUT", "8"))
+READY_IDLE_SEC = float(os.getenv("OZON_READY_IDLE", "0.5"))
+READY_POLL_SEC = float(os.getenv("OZON_READY_POLL", "0.2"))
+READY_RESOURCE_TYPES = {"Document", "XHR", "Fetch", "Script"}
+# Сколько непрочитанных событий DevTools держать на вкладку: журнал общий для всех вкладок.
+READY_EVENT_BUFFER = 5000
+DEFAULT_BLOCK_PROFILE = os.getenv("OZON_BLOCK_PROFILE", "full")
+BLOCK_EXTRA = [p.strip() for p in os.getenv("OZON_BLOCK_EXTRA", "").split(",") if p.strip()]
+
+# Шаблоны для Network.setBlockedURLs (wildcard по всему URL).
+BLOCK_IMAGES = ["*.jpg*", "*.jpeg*", "*.png*", "*.gif*", "*.webp*", "*.avif*", "*.ico*"]
+BLOCK_FONTS = ["*.woff*", "*.ttf*", "*.otf*", "*.eot*"]
+BLOCK_MEDIA = ["*.mp4*", "*.webm*", "*.m3u8*", "*.mp3*"]
+BLOCK_TRACKERS = [
+    "*mc.yandex.ru*",
+    "*google-analytics.com*",
+    "*googletagmanager.com*",
+    "*doubleclick.net*",
+    "*top-fwz1.mail.ru*",
+    "*vk.com/rtrg*",
+    "*criteo.*",
+    "*adfox.ru*",
+]
+BLOCK_PROFILES: dict[str, list[str]] = {
+    "full": [],
+    "lite": BLOCK_MEDIA + BLOCK_TRACKERS,
+    "labels": BLOCK_IMAGES + BLOCK_FONTS + BLOCK_MEDIA + BLOCK_TRACKERS,
+}
+# Средний размер ответа по типу ресурса — для оценки сэкономленного трафика,
+# пока в этой сессии не накопилась своя статистика.
+BLOCKED_SIZE_DEFAULTS = {
+    "Image": 30_000,
+    "Font": 40_000,
+    "Media": 400_000,
+    "Script": 40_000,
+    "Stylesheet": 20_000,
+    "XHR": 3_000,
+    "Fetch": 3_000,
+    "Ping": 500,
+}
+
+
+SELLER_SELECTORS = [
+    "[data-widget='webProductSeller']",
+    "[data-widget='webOutOfStockSeller']",
+    "div[class*='b35_3_18-a9'] span[class*='b35_3_18-b6']",
+    "span[class*='b35_3_18-b6']",
+    "div[class*='pdp_a5m'] span[class*='b35_3_18-b6']",
+]
 
 
 @dataclass
@@ -51,6 +107,11 @@ class CheckResult:
     seller_name: Optional[str]
     label_text: str
     error: Optional[str]
+    webdriver_calls: Optional[int] = None
+    traffic: Optional[dict] = None
+    cached_at: Optional[float] = None
+    # Артикул открытой карточки: у коротких ссылок /t/ его нет в url, он есть в адресе после перехода.
+    sku: Optional[str] = None
 
 
 def normalize_text(s: str) -> str:
@@ -201,18 +262,240 @@ def find_chrome_binary() -> Optional[str]:
     return None
 
 
-def create_driver(clean_profile: bool = False) -> webdriver.Chrome:
+_DRIVER_PATH: Optional[str] = None
+
+
+def resolve_driver_path() -> str:
+    """
+    ChromeDriverManager().install() и `chromedriver --version` выполняем один раз на процесс,
+    а не при каждом запуске Chrome.
+    """
+    global _DRIVER_PATH
+    if _DRIVER_PATH is not None:
+        return _DRIVER_PATH
+    driver_path = ChromeDriverManager().install()
+    try:
+        result = subprocess.run(
+            [driver_path, "--version"],
+            capture_output=True,
+            text=True,
+            check=False,
+        )
+        if result.stdout.strip():
+            print(f"ChromeDriver: {result.stdout.strip()}")
+        elif result.stderr.strip():
+            print(f"ChromeDriver: {result.stderr.strip()}")
+        print(f"ChromeDriver path: {driver_path}")
+    except Exception:
+        pass
+    _DRIVER_PATH = driver_path
+    return driver_path
+
+
+def enable_performance_log(options: Options) -> None:
+    # События Network/Page из DevTools попадают в driver.get_log("performance").
+    options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+    options.add_experimental_option("perfLoggingPrefs", {"enableNetwork": True, "enablePage": True})
+
+
+def enable_lifecycle_events(driver: webdriver.Chrome) -> None:
+    # Для Page.lifecycleEvent (networkAlmostIdle и т.п.); действует на текущую вкладку.
+    try:
+        driver.execute_cdp_cmd("Page.setLifecycleEventsEnabled", {"enabled": True})
+    except Exception:
+        pass
+
+
+@dataclass
+class TrafficStats:
+    requests: int = 0
+    bytes_loaded: int = 0
+    blocked: int = 0
+    bytes_saved: int = 0
+
+
+def normalize_block_profile(value: Optional[str]) -> str:
+    name = str(value or "").strip().lower()
+    return name if name in BLOCK_PROFILES else DEFAULT_BLOCK_PROFILE
+
+
+def apply_block_profile(driver: webdriver.Chrome, profile: Optional[str] = None, force: bool = False) -> str:
+    """
+    Включает блокировку картинок/шрифтов/медиа/трекеров по профилю. Настройка
+    действует на текущую вкладку, поэтому новые вкладки вызывают её с force=True.
+    """
+    name = normalize_block_profile(profile)
+    if not force and getattr(driver, "_ozon_block_profile", None) == name:
+        return name
+    patterns = list(BLOCK_PROFILES[name])
+    if patterns:
+        patterns += BLOCK_EXTRA
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patterns})
+    except Exception:
+        pass
+    driver._ozon_block_profile = name
+    return name
+
+
+def traffic_snapshot(driver: webdriver.Chrome) -> TrafficStats:
+    stats = getattr(driver, "_ozon_traffic", None)
+    return TrafficStats(**asdict(stats)) if stats else TrafficStats()
+
+
+def traffic_delta(before: TrafficStats, after: TrafficStats) -> dict:
+    return {key: value - getattr(before, key) for key, value in asdict(after).items()}
+
+
+def _account_traffic(driver: webdriver.Chrome, method: str, params: dict) -> None:
+    stats = getattr(driver, "_ozon_traffic", None)
+    if stats is None:
+        stats = driver._ozon_traffic = TrafficStats()
+        driver._ozon_request_types = {}
+        driver._ozon_type_sizes = {}
+    types: dict = driver._ozon_request_types
+    sizes: dict = driver._ozon_type_sizes
+    if method == "Network.requestWillBeSent":
+        types[params.get("requestId")] = params.get("type") or "Other"
+    elif method == "Network.loadingFinished":
+        res_type = types.pop(params.get("requestId"), "Other")
+        size = int(params.get("encodedDataLength") or 0)
+        stats.requests += 1
+        stats.bytes_loaded += size
+        total, count = sizes.get(res_type, (0, 0))
+        sizes[res_type] = (total + size, count + 1)
+    elif method == "Network.loadingFailed":
+        res_type = params.get("type") or types.get(params.get("requestId")) or "Other"
+        types.pop(params.get("requestId"), None)
+        if params.get("blockedReason"):
+            stats.blocked += 1
+            total, count = sizes.get(res_type, (0, 0))
+            stats.bytes_saved += (
+                total // count if count else BLOCKED_SIZE_DEFAULTS.get(res_type, 5_000)
+            )
+
+
+def drain_devtools_log(driver: webdriver.Chrome) -> None:
+    """
+    Переносит журнал DevTools в очереди по вкладкам (driver._ozon_events) и попутно
+    считает трафик сессии: загруженные байты, заблокированные запросы и оценку экономии.
+    get_log("performance") опустошает общий буфер, поэтому события других вкладок
+    не выбрасываются, а ждут, пока их прочитает своя вкладка.
+    """
+    try:
+        entries = driver.get_log("performance")
+    except Exception:
+        return
+    buffers = getattr(driver, "_ozon_events", None)
+    if buffers is None:
+        buffers = driver._ozon_events = {}
+    for entry in entries:
+        try:
+            payload = json.loads(entry.get("message") or "{}")
+        except ValueError:
+            continue
+        message = payload.get("message") or {}
+        method = message.get("method") or ""
+        params = message.get("params") or {}
+        if method.startswith("Network.loading") or method == "Network.requestWillBeSent":
+            _account_traffic(driver, method, params)
+        webview = payload.get("webview")
+        if webview not in buffers:
+            buffers[webview] = deque(maxlen=READY_EVENT_BUFFER)
+        buffers[webview].append((method, params))
+
+
+def read_devtools_events(driver: webdriver.Chrome, webview: Optional[str] = None) -> list[tuple[str, dict]]:
+    """
+    Непрочитанные события DevTools (method, params) вкладки webview и события без
+    вкладки; webview=None — всех вкладок.
+    """
+    drain_devtools_log(driver)
+    buffers = getattr(driver, "_ozon_events", None) or {}
+    keys = list(buffers) if webview is None else [webview, None]
+    events: list[tuple[str, dict]] = []
+    for key in keys:
+        queue = buffers.get(key)
+        if queue:
+            events.extend(queue)
+            queue.clear()
+    return events
+
+
+def forget_devtools_events(driver: webdriver.Chrome, webview: str) -> None:
+    # Вкладка закрыта — её непрочитанные события больше не нужны.
+    buffers = getattr(driver, "_ozon_events", None)
+    if buffers:
+        buffers.pop(webview, None)
+
+
+def wait_until_ready(
+    driver: webdriver.Chrome,
+    timeout_sec: float = READY_TIMEOUT_SEC,
+    idle_sec: float = READY_IDLE_SEC,
+) -> float:
+    """
+    Ждёт, пока у текущей вкладки утихнет сеть: нет незавершённых XHR/fetch/скриптов
+    (или Chrome прислал networkAlmostIdle) и idle_sec без новых запросов.
+    Вместо фиксированных пауз: быстрые карточки отпускаются сразу, медленные
+    получают до timeout_sec. Возвращает, сколько секунд ждали.
+    """
+    started = time.time()
+    try:
+        handle = driver.current_window_handle
+    except Exception:
+        handle = None
+    in_flight: set[str] = set()
+    lifecycle: set[str] = set()
+    last_activity = started
+    while True:
+        events = read_devtools_events(driver, handle)
+        now = time.time()
+        for method, params in events:
+            if method == "Network.requestWillBeSent":
+                if params.get("type") in READY_RESOURCE_TYPES:
+                    in_flight.add(params.get("requestId"))
+                    last_activity = now
+            elif method in ("Network.loadingFinished", "Network.loadingFailed"):
+                if params.get("requestId") in in_flight:
+                    in_flight.discard(params.get("requestId"))
+                    last_activity = now
+            elif method == "Page.lifecycleEvent":
+                if params.get("name") == "init":
+                    # Новая навигация: всё, что было до неё, уже не важно.
+                    lifecycle.clear()
+                    in_flight.clear()
+                lifecycle.add(params.get("name"))
+        quiet = not in_flight or "networkAlmostIdle" in lifecycle
+        if quiet and now - last_activity >= idle_sec:
+            break
+        if now - started >= timeout_sec:
+            break
+        time.sleep(READY_POLL_SEC)
+    elapsed = time.time() - started
+    if DEBUG_MODE:
+        print(f"[DEBUG] ready after {elapsed:.2f}s, in flight: {len(in_flight)}")
+    return elapsed
+
+
+def create_driver(
+    clean_profile: bool = False,
+    user_data_dir: Optional[Path] = None,
+) -> webdriver.Chrome:
     options = Options()
     temp_profile = None
     if clean_profile:
         temp_profile = Path(tempfile.mkdtemp(prefix="ozon_profile_"))
         options.add_argument(f"--user-data-dir={temp_profile.resolve()}")
     else:
-        options.add_argument(f"--user-data-dir={USER_DATA_DIR.resolve()}")
+        profile_dir = user_data_dir or USER_DATA_DIR
+        options.add_argument(f"--user-data-dir={profile_dir.resolve()}")
     options.add_argument("--disable-blink-features=AutomationControlled")
     options.add_argument("--no-first-run")
     options.add_argument("--no-default-browser-check")
     options.page_load_strategy = "eager"
+    enable_performance_log(options)
 
     if DEFAULT_HEADLESS:
         options.add_argument("--headless=new")
@@ -222,21 +505,7 @@ def create_driver(clean_profile: bool = False) -> webdriver.Chrome:
     if chrome_binary:
         options.binary_location = chrome_binary
 
-    driver_path = ChromeDriverManager().install()
-    try:
-        result = subprocess.run(
-            [driver_path, "--version"],
-            capture_output=True,
-            text=True,
-            check=False,
-        )
-        if result.stdout.strip():
-            print(f"ChromeDriver: {result.stdout.strip()}")
-        elif result.stderr.strip():
-            print(f"ChromeDriver: {result.stderr.strip()}")
-        print(f"ChromeDriver path: {driver_path}")
-    except Exception:
-        pass
+    driver_path = resolve_driver_path()
 
     service = Service(driver_path, log_path=CHROMEDRIVER_LOG)
     try:
@@ -250,6 +519,7 @@ def create_driver(clean_profile: bool = False) -> webdriver.Chrome:
             options.add_argument("--no-first-run")
             options.add_argument("--no-default-browser-check")
             options.page_load_strategy = "eager"
+            enable_performance_log(options)
             if DEFAULT_HEADLESS:
                 options.add_argument("--headless=new")
                 options.add_argument("--window-size=1400,900")
@@ -260,7 +530,12 @@ def create_driver(clean_profile: bool = False) -> webdriver.Chrome:
             raise
 
     driver.set_page_load_timeout(DEFAULT_PAGE_TIMEOUT_SEC)
+    # Запас сверх собственного дедлайна EXTRACT_PAGE_JS.
+    driver.set_script_timeout(DEFAULT_LABEL_WAIT_SEC + 15)
     driver._ozon_temp_profile = temp_profile
+    _count_webdriver_calls(driver)
+    enable_lifecycle_events(driver)
+    apply_block_profile(driver)
     return driver
 
 
@@ -268,6 +543,7 @@ def safe_get(driver: webdriver.Chrome, url: str, retries: int = DEFAULT_GET_RETR
     last_err = None
     for attempt in range(1, retries + 1):
         try:
+            driver._ozon_pages = getattr(driver, "_ozon_pages", 0) + 1
             driver.get(url)
             return True
         except TimeoutException as e:
@@ -285,6 +561,144 @@ def safe_get(driver: webdriver.Chrome, url: str, retries: int = DEFAULT_GET_RETR
     return False
 
 
+def _tab_state(driver: webdriver.Chrome) -> str:
+    try:
+        return driver.execute_script(
+            """
+            if (window.__ozonNav) return "loading";
+            if (String(location.href).startsWith("chrome-error:")) return "error";
+            return document.readyState === "loading" ? "loading" : "ready";
+            """
+        ) or "loading"
+    except TimeoutException:
+        return "loading"
+    except WebDriverException:
+        # Процесс вкладки упал или окно закрыто — ссылка уходит как незагруженная.
+        return "error"
+
+
+def iter_tab_pages(
+    driver: webdriver.Chrome,
+    urls: Iterable[str],
+    width: Optional[int] = None,
+    cancel_check: Optional[Callable[[], bool]] = None,
+    timeout_sec: float = DEFAULT_PAGE_TIMEOUT_SEC,
+    ordered: bool = False,
+) -> Iterator[tuple[str, bool]]:
+    """
+    Грузит ссылки в нескольких вкладках одного Chrome.
+    Отдаёт (url, loaded), когда страница во вкладке готова, драйвер в этот момент
+    переключён на неё. Пока вызывающий код читает одну вкладку, остальные продолжают
+    грузиться; освободившаяся вкладка получает следующую ссылку.
+    ordered=True — отдаёт строго в порядке urls (остальные вкладки грузятся в фоне).
+    width <= 1 — обычный последовательный safe_get в текущей вкладке.
+    """
+    tabs = DEFAULT_TABS if width is None else int(width)
+    if tabs <= 1:
+        for url in urls:
+            if cancel_check and cancel_check():
+                return
+            yield url, safe_get(driver, url)
+        return
+
+    source = iter(urls)
+    origin = driver.current_window_handle
+    handles = [origin]
+    loading: dict[str, tuple[str, float]] = {}
+    # returned — ссылки, которые не смогла начать упавшая вкладка (их возьмёт живая);
+    # failed — ссылки, которые грузить уже негде: отдаются как незагруженные.
+    returned: list[str] = []
+    failed: list[str] = []
+
+    def start(handle: str) -> bool:
+        url = returned.pop(0) if returned else next(source, None)
+        if url is None:
+            return False
+        try:
+            driver.switch_to.window(handle)
+            driver._ozon_pages = getattr(driver, "_ozon_pages", 0) + 1
+            # Навигация из скрипта не блокирует драйвер, в отличие от driver.get.
+            driver.execute_script("window.__ozonNav = true; window.location.href = arguments[0];", url)
+        except WebDriverException:
+            # Вкладка больше не работает: ссылку отдаём другой вкладке, эту не перезапускаем.
+            returned.insert(0, url)
+            return False
+        loading[handle] = (url, time.time())
+        return True
+
+    try:
+        for idx in range(tabs):
+            if cancel_check and cancel_check():
+                return
+            if idx:
+                driver.switch_to.new_window("tab")
+                handles.append(driver.current_window_handle)
+                enable_lifecycle_events(driver)
+                apply_block_profile(driver, getattr(driver, "_ozon_block_profile", None), force=True)
+            if not start(handles[-1]):
+                break
+        if not loading:
+            failed.extend(returned)
+            returned.clear()
+            failed.extend(source)
+
+        while loading or failed:
+            if cancel_check and cancel_check():
+                return
+            if failed:
+                yield failed.pop(0), False
+                continue
+            ready = None
+            # Вкладки перезапускаются по очереди, поэтому первая в loading — самая ранняя ссылка.
+            candidates = list(loading.items())[:1] if ordered else list(loading.items())
+            for handle, (url, started) in candidates:
+                try:
+                    driver.switch_to.window(handle)
+                except WebDriverException:
+                    ready = (handle, url, False)
+                    break
+                state = _tab_state(driver)
+                if state == "ready":
+                    ready = (handle, url, True)
+                elif state == "error" or time.time() - started > timeout_sec:
+                    try:
+                        driver.execute_script("window.stop();")
+                    except Exception:
+                        pass
+                    ready = (handle, url, state != "error")
+                if ready:
+                    break
+            if ready is None:
+                time.sleep(0.1)
+                continue
+            handle, url, loaded = ready
+            loading.pop(handle, None)
+            try:
+                driver.switch_to.window(handle)
+            except WebDriverException:
+                loaded = False
+            yield url, loaded
+            if cancel_check and cancel_check():
+                return
+            if not start(handle) and not loading:
+                # Живых вкладок не осталось — остаток списка отдаём как незагруженный.
+                failed.extend(returned)
+                returned.clear()
+                failed.extend(source)
+    finally:
+        for handle in handles[1:]:
+            forget_devtools_events(driver, handle)
+            try:
+                driver.switch_to.window(handle)
+                driver.close()
+            except Exception:
+                pass
+        try:
+            driver.switch_to.window(origin)
+        except Exception:
+            pass
+
+
 def build_search_url(query: str, page: int) -> str:
     encoded = quote_plus(query)
     return f"https://www.ozon.ru/search/?text={encoded}&page={page}"
@@ -305,6 +719,205 @@ def normalize_product_url(url: str) -> Optional[str]:
     return clean
 
 
+_SKU_RE = re.compile(r"/product/(?:[^/?#]*-)?(\d+)/?(?:[?#]|$)")
+
+
+def product_sku(url: str) -> Optional[str]:
+    """
+    Артикул из ссылки /product/<slug>-<sku>/: одна и та же карточка приходит
+    с разными slug, параметрами и доменами, а артикул у неё один.
+    """
+    match = _SKU_RE.search(url or "")
+    return match.group(1) if match else None
+
+
+def product_key(url: str) -> str:
+    """
+    Ключ карточки для дедупликации и кэшей: артикул, а для ссылок без него
+    (короткие ozon.ru/t/...) — нормализованная ссылка. Артикул такой ссылки
+    становится известен после открытия карточки (CheckResult.sku).
+    """
+    return product_sku(url) or normalize_product_url(url) or (url or "").strip()
+
+
+def is_product_url(url: str) -> bool:
+    return bool(re.search(r"ozon\.ru/(?:product|t)/", url or ""))
+
+
+def sku_set(urls: Iterable[str]) -> set[str]:
+    return {product_key(url) for url in urls}
+
+
+SEARCH_LINKS_JS = """
+// Накопитель ссылок выдачи: ставится один раз на страницу, дальше MutationObserver
+// добавляет только новые ссылки основного грида, вызов скрипта забирает дельту.
+const withSellers = arguments[0];
+const withLabels = arguments[1];
+const PHRASE = "возможно, вам понравится";
+const LINK_SELECTOR = "a[href*='/product/']";
+
+let acc = window.__ozonLinks;
+if (!acc) {
+  const container = document.querySelector("#contentScrollPaginator") || document.body;
+  acc = window.__ozonLinks = { seen: new Set(), fresh: [], retry: [], cutoff: null, root: null };
+
+  const isHeading = (el) => {
+    const text = el.textContent || "";
+    return text.length < 80 && text.trim().toLowerCase().includes(PHRASE);
+  };
+  // Блок "Возможно, вам понравится" (рекомендации) — полный обход только по поддереву,
+  // где эта фраза вообще встречается.
+  const findHeading = (scope) => {
+    if (!(scope.textContent || "").toLowerCase().includes(PHRASE)) return null;
+    if (isHeading(scope)) return scope;
+    return Array.from(scope.querySelectorAll("h2, h3, h4, span, div")).find(isHeading) || null;
+  };
+  const pickRoot = () => {
+    const grids = container.querySelectorAll(
+      "[data-widget='tileGridDesktop'], [data-widget*='tileGrid']"
+    );
+    if (!grids.length) return null;
+    if (acc.cutoff) {
+      const above = Array.from(grids).find(
+        (grid) => acc.cutoff.compareDocumentPosition(grid) & Node.DOCUMENT_POSITION_PRECEDING
+      );
+      if (above) return above;
+    }
+    return grids[0];
+  };
+  const consider = (link) => {
+    const href = link.getAttribute("href");
+    if (!href || acc.seen.has(href)) return;
+    if (acc.root && !acc.root.contains(link)) return;
+    if (acc.cutoff && acc.cutoff.compareDocumentPosition(link) & Node.DOCUMENT_POSITION_FOLLOWING) {
+      return;
+    }
+    acc.seen.add(href);
+    acc.fresh.push(link);
+  };
+  const scan = (node) => {
+    if (node.matches && node.matches(LINK_SELECTOR)) consider(node);
+    if (node.querySelectorAll) node.querySelectorAll(LINK_SELECTOR).forEach(consider);
+  };
+  acc.cutoff = findHeading(container);
+  acc.root = pickRoot();
+  scan(acc.root || container);
+  new MutationObserver((records) => {
+    for (const record of records) {
+      for (const node of record.addedNodes) {
+        if (node.nodeType !== 1) continue;
+        if (!acc.cutoff) acc.cutoff = findHeading(node);
+        if (!acc.root) acc.root = pickRoot();
+        scan(node);
+      }
+    }
+  }).observe(container, { childList: true, subtree: true });
+}
+
+const skuOf = (href) => {
+  const m = String(href || "").match(/\\/product\\/(?:[^/?#]*-)?(\\d+)\\/?(?:[?#]|$)/);
+  return m ? m[1] : null;
+};
+const SELLER_KEY = /^(seller|sellerName|merchant|merchantName|shop|shopName)$/i;
+const sellerIn = (node, depth) => {
+  if (!node || typeof node !== "object" || depth > 6) return null;
+  for (const [key, value] of Object.entries(node)) {
+    if (SELLER_KEY.test(key)) {
+      if (typeof value === "string" && value.trim()) return value.trim();
+      if (value && typeof value === "object") {
+        const name = value.name || value.title || value.text;
+        if (typeof name === "string" && name.trim()) return name.trim();
+      }
+    }
+  }
+  for (const value of Object.values(node)) {
+    const found = sellerIn(value, depth + 1);
+    if (found) return found;
+  }
+  return null;
+};
+const stateSellers = {};
+if (withSellers && (acc.fresh.length || acc.retry.length)) {
+  document.querySelectorAll("[id^='state-searchResults'][data-state]").forEach((el) => {
+    let state = null;
+    try { state = JSON.parse(el.getAttribute("data-state")); } catch (e) { return; }
+    const items = (state && state.items) || [];
+    items.forEach((item) => {
+      const link = (item && (item.link || (item.action && item.action.link))) || "";
+      const sku = skuOf(link) || (item && item.sku ? String(item.sku) : null);
+      const seller = sku ? sellerIn(item, 0) : null;
+      if (sku && seller) stateSellers[sku] = seller;
+    });
+  });
+}
+const tileOf = (link) => {
+  const tile =
+    link.closest("[data-index], .tile-root, [class*='tile-root']") ||
+    (link.parentElement && link.parentElement.parentElement) ||
+    link.parentElement;
+  return tile && tile !== acc.root ? tile : null;
+};
+const BADGE_SELECTOR =
+  "[class*='badge'], [class*='Badge'], [class*='sticker'], [class*='Sticker'], " +
+  "[class*='label'], [class*='Label'], [data-widget*='abel']";
+const tileLabel = (link) => {
+  const tile = tileOf(link);
+  if (!tile) return "";
+  const parts = [];
+  tile.querySelectorAll(BADGE_SELECTOR).forEach((el) => {
+    if (el.querySelector(BADGE_SELECTOR)) return;
+    const text = (el.textContent || "").trim().replace(/\\s+/g, " ");
+    if (text && text.length <= 60 && !parts.includes(text)) parts.push(text);
+    if (!text && el.querySelector("img, svg") && !parts.includes("🎁")) parts.push("🎁");
+  });
+  return parts.join(" ");
+};
+const tileSeller = (link) => {
+  const tile = tileOf(link);
+  if (!tile) return null;
+  const sellerLink = tile.querySelector("a[href*='/seller/']");
+  if (sellerLink && (sellerLink.textContent || "").trim()) {
+    return sellerLink.textContent.trim();
+  }
+  const lines = (tile.innerText || "").split("\\n");
+  for (const line of lines) {
+    const m = line.trim().match(/^продавец[:\\s]+(.+)$/i);
+    if (m) return m[1].trim();
+  }
+  return null;
+};
+const details = (link) => {
+  const href = link.getAttribute("href");
+  let seller = null;
+  if (withSellers) {
+    const sku = skuOf(href);
+    seller = (sku && stateSellers[sku]) || tileSeller(link);
+  }
+  return [href, seller, withLabels ? tileLabel(link) : ""];
+};
+
+// Плитка могла дорисоваться позже ссылки: продавца/бейджи добираем ещё несколько раз.
+const out = [];
+const fresh = acc.fresh;
+const retry = acc.retry;
+acc.fresh = [];
+acc.retry = [];
+fresh.forEach((link) => {
+  const item = details(link);
+  out.push(item);
+  if ((withSellers && !item[1]) || (withLabels && !item[2])) acc.retry.push([link, 1]);
+});
+retry.forEach(([link, attempts]) => {
+  const item = details(link);
+  if (item[1] || item[2]) out.push(item);
+  if (((withSellers && !item[1]) || (withLabels && !item[2])) && attempts < 5) {
+    acc.retry.push([link, attempts + 1]);
+  }
+});
+return { items: out, count: acc.seen.size };
+"""
+
+
 def collect_search_urls(
     query: str,
     seller_filter: Optional[str] = None,
@@ -323,83 +936,167 @@ def collect_search_urls(
     match_result_cb: Optional[Callable[[CheckResult], None]] = None,
     phase_cb: Optional[Callable[[str], None]] = None,
     cancel_check: Optional[Callable[[], bool]] = None,
+    driver: Optional[webdriver.Chrome] = None,
+    tabs: Optional[int] = None,
+    block_profile: Optional[str] = None,
+    traffic_cb: Optional[Callable[[dict], None]] = None,
+    stored_pages: Optional[dict[int, list[str]]] = None,
+    page_cb: Optional[Callable[[int, list[str], bool], None]] = None,
+    converge_pages: int = SEARCH_CONVERGE_PAGES,
+    page_tabs: Optional[int] = None,
+    tile_label_cb: Optional[Callable[[str, str, Optional[str]], None]] = None,
+    resume_pages: Optional[dict[int, list[str]]] = None,
+    seller_known: Optional[dict[str, bool]] = None,
+    seller_cb: Optional[Callable[[str, bool], None]] = None,
+    tile_seller_cb: Optional[Callable[[str, str], None]] = None,
 ) -> list[str]:
-    driver = create_driver(clean_profile=clean_profile)
+    """
+    resume_pages — страницы прерванного обхода этой же задачи: берутся без загрузки,
+    обход продолжается со следующей. seller_known — уже известные решения фильтра
+    продавца (артикул -> подходит); seller_cb(url, matched) сообщает каждое новое решение.
+    tile_label_cb(url, label_text, seller) — текст бейджей с плитки выдачи и продавец
+    из плитки; вызывается один раз на ссылку, после разбора её страницы выдачи.
+    tile_seller_cb(url, seller) — продавец из плитки, как только он прочитан (до того,
+    как ссылка уйдёт в progress_cb): так фильтр продавца можно применить без seller_filter.
+    page_tabs > 1 — страницы выдачи грузятся параллельно в нескольких вкладках,
+    но разбираются строго по порядку; вкладки дальше первой пустой страницы закрываются.
+    stored_pages — ссылки прошлого обхода того же запроса по номерам страниц.
+    Если converge_pages страниц подряд совпали с ними по набору артикулов, остальные
+    страницы берутся из прошлого обхода без загрузки. page_cb(page, links, reused)
+    вызывается для каждой пройденной страницы.
+    """
+    # Сессию из пула не закрываем — её вернёт тот, кто её арендовал.
+    own_driver = driver is None
+    if own_driver:
+        driver = create_driver(clean_profile=clean_profile)
+    if block_profile is not None:
+        apply_block_profile(driver, block_profile)
+    traffic_mark = traffic_snapshot(driver)
+
+    def report_traffic() -> None:
+        nonlocal traffic_mark
+        if not traffic_cb:
+            return
+        drain_devtools_log(driver)
+        current = traffic_snapshot(driver)
+        traffic_cb(traffic_delta(traffic_mark, current))
+        traffic_mark = current
 
     urls: list[str] = []
     seen: set[str] = set()
-    page = 1
+    page = 0
     page_times: list[float] = []
+    page_of_url: dict[str, int] = {}
 
-    def grab_all_links_from_results() -> list[str]:
-        """
-        Берём ВСЕ product-ссылки из основного грида результатов (без рекомендаций ниже).
-        Не фильтруем по viewport — иначе результат будет плавать.
-        """
-        try:
-            return driver.execute_script(
-                """
-                const container = document.querySelector("#contentScrollPaginator") || document;
+    first_page = max(resume_pages) + 1 if resume_pages else 1
 
-                // Пытаемся отрезать блок "Возможно, вам понравится" (рекомендации)
-                const heading = Array.from(container.querySelectorAll("h2, h3, h4, span, div"))
-                  .find((el) =>
-                    (el.textContent || "").trim().toLowerCase().includes("возможно, вам понравится")
-                  );
+    def search_targets() -> Iterator[str]:
+        next_page = first_page
+        while not (max_pages and next_page > max_pages):
+            target = build_search_url(query, next_page)
+            page_of_url[target] = next_page
+            yield target
+            next_page += 1
 
-                const grids = container.querySelectorAll(
-                  "[data-widget='tileGridDesktop'], [data-widget*='tileGrid']"
-                );
+    # Продавец из плиток/состояния выдачи: ссылка -> имя. Нужен только для seller_filter.
+    tile_sellers: dict[str, str] = {}
+    tile_labels: dict[str, str] = {}
+    tile_reported: set[str] = set()
+    # Сколько ссылок из urls уже ушло в progress_cb.
+    emitted = 0
+    want_labels = tile_label_cb is not None
+    want_sellers = (bool(seller_filter or tile_seller_cb) and TILE_SELLER) or want_labels
 
-                let root = null;
-                if (grids.length) {
-                  if (heading) {
-                    const headTop = heading.getBoundingClientRect().top + window.scrollY;
-                    root = Array.from(grids).find((grid) => {
-                      const gridTop = grid.getBoundingClientRect().top + window.scrollY;
-                      return gridTop < headTop;
-                    });
-                  }
-                  root = root || grids[0];
-                }
-                if (!root) root = container;
+    link_count = 0
 
-                const out = [];
-                const links = root.querySelectorAll("a[href*='/product/']");
-                links.forEach((link) => {
-                  const href = link.getAttribute("href");
-                  if (href) out.push(href);
-                });
-                return out;
-                """
-            )
+    def grab_all_links_from_results() -> list[str]:
+        """
+        Новые product-ссылки основного грида результатов (без рекомендаций ниже) с прошлого
+        вызова — их копит SEARCH_LINKS_JS на странице. Не фильтруем по viewport — иначе
+        результат будет плавать. При фильтре по продавцу тем же проходом читаем продавца
+        из плитки и из состояния виджета выдачи, для предварительной проверки — бейджи плитки.
+        """
+        nonlocal link_count
+        try:
+            data = driver.execute_script(SEARCH_LINKS_JS, want_sellers, want_labels) or {}
         except Exception:
             return []
-
-    def collect_new(hrefs: list[str]) -> int:
+        link_count = int(data.get("count") or 0)
+        hrefs: list[str] = []
+        for href, seller, label in data.get("items") or []:
+            hrefs.append(href)
+            if not seller and not label:
+                continue
+            key = product_key(str(href))
+            if seller and key not in tile_sellers:
+                tile_sellers[key] = str(seller)
+                if tile_seller_cb:
+                    tile_seller_cb(str(href), str(seller))
+            if label:
+                # У ссылки на картинку и ссылки-заголовка одна плитка — берём самый полный текст.
+                if len(str(label)) > len(tile_labels.get(key, "")):
+                    tile_labels[key] = str(label)
+        return hrefs
+
+    def emit_progress() -> None:
+        nonlocal emitted
+        if progress_cb and len(urls) > emitted:
+            progress_cb(list(urls))
+            emitted = len(urls)
+
+    def collect_new(hrefs: list[str], page_links: Optional[list[str]] = None) -> int:
         new_count = 0
+        page_seen = sku_set(page_links or ())
         for href in hrefs or []:
             norm = normalize_product_url(str(href))
-            if not norm or norm in seen:
+            if not norm:
                 continue
-            seen.add(norm)
+            # Одна карточка под разными slug — один ключ; в списке остаётся первая ссылка.
+            key = product_key(norm)
+            if page_links is not None and key not in page_seen:
+                page_seen.add(key)
+                page_links.append(norm)
+            if key in seen:
+                continue
+            seen.add(key)
             urls.append(norm)
             new_count += 1
-            if progress_cb:
-                progress_cb(list(urls))
+        # Одно событие прогресса на пачку, а не копия списка на каждую ссылку.
+        # Ссылки страницы с разбором плиток придерживаем до вердикта по плитке:
+        # иначе подтверждённую по бейджу карточку успеют поставить на проверку и открыть.
+        if new_count and not (tile_label_cb and page_links is not None):
+            emit_progress()
         return new_count
 
+    def reuse_stored_pages(after_page: int) -> None:
+        for stored_page in sorted(p for p in stored_pages or {} if p > after_page):
+            if max_pages and stored_page > max_pages:
+                break
+            links = list(stored_pages[stored_page])
+            collect_new(links)
+            if page_cb:
+                page_cb(stored_page, links, True)
+
+    converged_hits = 0
     try:
         if phase_cb:
             phase_cb("search")
-        while True:
+        for resumed_page in sorted(resume_pages or {}):
+            links = list(resume_pages[resumed_page])
+            collect_new(links)
+            if page_cb:
+                page_cb(resumed_page, links, True)
+            page = resumed_page
+        width = DEFAULT_SEARCH_TABS if page_tabs is None else int(page_tabs)
+        page_started = time.time()
+        for target, loaded in iter_tab_pages(
+            driver, search_targets(), width=width, cancel_check=cancel_check, ordered=True
+        ):
             if cancel_check and cancel_check():
                 break
-
-            target = build_search_url(query, page)
-            page_started = time.time()
-            if not safe_get(driver, target):
+            if not loaded:
                 break
+            page = page_of_url.pop(target, page + 1)
 
             wait_after_load = (
                 DEFAULT_SEARCH_LOAD_WAIT_SEC if load_wait_sec is None else float(load_wait_sec)
@@ -412,9 +1109,10 @@ def collect_search_urls(
             )
 
             page_new_count = 0
+            page_links: list[str] = []
 
             # 1) сбор сразу после загрузки
-            page_new_count += collect_new(grab_all_links_from_results())
+            page_new_count += collect_new(grab_all_links_from_results(), page_links)
 
             # 2) скроллы + сбор после каждого скролла (без viewport-фильтра)
             for _ in range(total_scrolls):
@@ -425,7 +1123,7 @@ def collect_search_urls(
                 except Exception:
                     pass
                 time.sleep(wait_after_scroll)
-                page_new_count += collect_new(grab_all_links_from_results())
+                page_new_count += collect_new(grab_all_links_from_results(), page_links)
 
             # 3) стабилизация: ждём, пока количество product-ссылок перестанет расти
             target_hits = DEFAULT_SEARCH_STABLE_HITS if stable_hits is None else max(0, int(stable_hits))
@@ -438,10 +1136,8 @@ def collect_search_urls(
                 while stable_hits_count < target_hits:
                     if cancel_check and cancel_check():
                         break
-                    try:
-                        count = len(grab_all_links_from_results())
-                    except Exception:
-                        count = -1
+                    page_new_count += collect_new(grab_all_links_from_results(), page_links)
+                    count = link_count
                     if count == last_count and count > 0:
                         stable_hits_count += 1
                     else:
@@ -450,7 +1146,27 @@ def collect_search_urls(
                     time.sleep(pause_sec)
 
                 # после стабилизации — ещё раз финальный сбор
-                page_new_count += collect_new(grab_all_links_from_results())
+                page_new_count += collect_new(grab_all_links_from_results(), page_links)
+
+            if page_cb:
+                page_cb(page, page_links, False)
+            if tile_label_cb:
+                for link in page_links:
+                    key = product_key(link)
+                    if key not in tile_reported:
+                        tile_reported.add(key)
+                        tile_label_cb(link, tile_labels.get(key, ""), tile_sellers.get(key))
+                emit_progress()
+
+            # выдача совпала с прошлым обходом — дальше она, скорее всего, тоже не менялась
+            if stored_pages and page in stored_pages and page_links:
+                if sku_set(page_links) == sku_set(stored_pages[page]):
+                    converged_hits += 1
+                else:
+                    converged_hits = 0
+                if converged_hits >= max(1, converge_pages):
+                    reuse_stored_pages(page)
+                    break
 
             # если совсем ничего нового — заканчиваем
             if page_new_count == 0:
@@ -459,8 +1175,9 @@ def collect_search_urls(
             if max_pages and page >= max_pages:
                 break
 
-            page += 1
+            report_traffic()
             page_times.append(time.time() - page_started)
+            page_started = time.time()
             if max_pages and eta_cb and page_times:
                 avg_page = sum(page_times[-5:]) / len(page_times[-5:])
                 remaining = max(0, max_pages - page)
@@ -475,10 +1192,37 @@ def collect_search_urls(
             filtered: list[str] = []
             total = len(urls)
             checked = 0
+            # Продавец уже известен из выдачи — карточку не открываем.
+            to_visit: list[str] = []
             for url in urls:
-                if cancel_check and cancel_check():
-                    break
-                if not safe_get(driver, url):
+                key = product_key(url)
+                if seller_known and key in seller_known:
+                    checked += 1
+                    if seller_known[key]:
+                        filtered.append(url)
+                    continue
+                tile_name = (tile_sellers.get(key) or "").strip()
+                if normalize_text(tile_name) in AMBIGUOUS_SELLER_NAMES:
+                    to_visit.append(url)
+                    continue
+                checked += 1
+                matched = seller_matches_filter(seller_filter, tile_name, is_ozon_seller(tile_name, ""), "")
+                if seller_cb:
+                    seller_cb(url, matched)
+                if matched:
+                    filtered.append(url)
+            # Плитки разбираются без загрузки страниц — прогресс одним событием на весь проход.
+            if filtered and progress_cb:
+                progress_cb(list(filtered))
+            reported = len(filtered)
+            # Дальше — событие на пачку из стольких совпадений, сколько вкладок грузится разом.
+            batch = max(1, DEFAULT_TABS if tabs is None else int(tabs))
+            if DEBUG_MODE:
+                print(f"[DEBUG] seller from tiles: {checked}/{total}, to visit: {len(to_visit)}")
+            if seller_progress_cb:
+                seller_progress_cb(checked, total, len(filtered))
+            for url, loaded in iter_tab_pages(driver, to_visit, width=tabs, cancel_check=cancel_check):
+                if not loaded:
                     continue
                 time.sleep(random.uniform(0.1, 0.25))
                 try:
@@ -494,10 +1238,12 @@ def collect_search_urls(
                     seller_name = extract_seller_from_text(body_text_raw)
                 seller_ok = is_ozon_seller(seller_name, body_text)
                 checked += 1
-                if seller_matches_filter(seller_filter, seller_name, seller_ok, body_text):
+                matched = seller_matches_filter(seller_filter, seller_name, seller_ok, body_text)
+                if matched:
                     filtered.append(url)
-                    if progress_cb:
+                    if progress_cb and len(filtered) - reported >= batch:
                         progress_cb(list(filtered))
+                        reported = len(filtered)
                     if match_test_cb and match_result_cb:
                         try:
                             res = match_test_cb(driver, url)
@@ -505,8 +1251,16 @@ def collect_search_urls(
                             res = None
                         if res:
                             match_result_cb(res)
+                # Решение фиксируем после проверки карточки: при возобновлении она уже будет в результатах.
+                if seller_cb:
+                    seller_cb(url, matched)
                 if seller_progress_cb:
                     seller_progress_cb(checked, total, len(filtered))
+                report_traffic()
+            if progress_cb and len(filtered) > reported:
+                progress_cb(list(filtered))
+            order = {url: idx for idx, url in enumerate(urls)}
+            filtered.sort(key=lambda url: order.get(url, len(order)))
             return filtered
 
         if raw_cb:
@@ -514,10 +1268,12 @@ def collect_search_urls(
         return urls
 
     finally:
-        try:
-            driver.quit()
-        except Exception:
-            pass
+        report_traffic()
+        if own_driver:
+            try:
+                driver.quit()
+            except Exception:
+                pass
 
 
 def count_listing_cards(
@@ -569,8 +1325,8 @@ def count_listing_cards(
         seen = set()
         for h in hrefs or []:
             u = normalize_product_url(str(h))
-            if u and u not in seen:
-                seen.add(u)
+            if u and product_key(u) not in seen:
+                seen.add(product_key(u))
                 norm.append(u)
         return norm
 
@@ -618,35 +1374,128 @@ def count_listing_cards(
 
 
 
-def collect_label_text(driver: webdriver.Chrome) -> str:
-    try:
-        WebDriverWait(driver, DEFAULT_LABEL_WAIT_SEC).until(
-            lambda d: d.find_elements(By.CSS_SELECTOR, "[data-widget='webMarketingLabels']")
-        )
-    except Exception:
-        pass
+LABEL_SELECTORS = ["[data-widget='webMarketingLabels']", ".b5_5_1-a5"]
+# Виджеты основного контента карточки: если они отрисованы, а в разметке и в
+# состояниях виджетов нет webMarketingLabels, — виджета на карточке нет.
+PRODUCT_WIDGETS = ("webProductHeading", "webPrice", "webSale", "webGallery", "webAddToCart")
+PRODUCT_SELECTORS = [f"[data-widget='{name}']" for name in PRODUCT_WIDGETS]
+LABELS_ABSENT = "absent"
+
+# Общий примитив ожидания: резолвится, как только любой из селекторов появился
+# с содержимым, или по дедлайну. Без поллинга — на MutationObserver.
+# С options.absentOf (селекторы основного контента) резолвится в "absent", если
+# контент отрисован, а ни селекторов, ни их state-узлов нет options.graceMs подряд.
+WAIT_FOR_ANY_JS = """
+const hasContent = (el) => {
+  const text = (el.innerText || el.textContent || "").trim();
+  if (text && text.toLowerCase() !== "перейти") return true;
+  if (el.getAttribute && el.getAttribute("title")) return true;
+  return Boolean(el.querySelector && el.querySelector("[title],[aria-label],img[alt]"));
+};
+const widgetStateSelector = (selectors) =>
+  selectors
+    .map((s) => (s.match(/data-widget='([^']+)'/) || [])[1])
+    .filter(Boolean)
+    .map((name) => `[id^='state-${name}']`);
+const waitForAny = (selectors, deadline, options = {}) => new Promise((resolve) => {
+  const absentOf = options.absentOf || null;
+  const graceMs = options.graceMs || 0;
+  const traces = selectors.concat(widgetStateSelector(selectors)).join(",");
+  let absentSince = null;
+  let graceTimer = null;
+  const isAbsent = () => {
+    if (!absentOf) return false;
+    if (!document.querySelector(absentOf.join(","))) return false;
+    return !document.querySelector(traces);
+  };
+  const check = () => {
+    for (const selector of selectors) {
+      for (const el of document.querySelectorAll(selector)) {
+        if (hasContent(el)) return selector;
+      }
+    }
+    if (isAbsent()) {
+      if (absentSince === null) {
+        absentSince = Date.now();
+        graceTimer = setTimeout(() => {
+          const found = check();
+          if (found) finish(found);
+        }, graceMs);
+      }
+      if (Date.now() - absentSince >= graceMs) return "absent";
+    } else {
+      absentSince = null;
+      clearTimeout(graceTimer);
+    }
+    return null;
+  };
+  let timer = null;
+  let observer = null;
+  const finish = (value) => {
+    if (observer) observer.disconnect();
+    clearTimeout(timer);
+    clearTimeout(graceTimer);
+    resolve(value);
+  };
+  const first = check();
+  if (first || Date.now() >= deadline) {
+    finish(first);
+    return;
+  }
+  observer = new MutationObserver(() => {
+    const found = check();
+    if (found) finish(found);
+  });
+  observer.observe(document.documentElement, {
+    childList: true,
+    subtree: true,
+    characterData: true,
+    attributes: true,
+    attributeFilter: ["title", "aria-label", "alt"],
+  });
+  timer = setTimeout(() => finish(check()), Math.max(0, deadline - Date.now()));
+});
+"""
+
+
+def card_deadline(wait_sec: float = DEFAULT_LABEL_WAIT_SEC) -> float:
+    return time.time() + wait_sec
+
+
+def wait_for_any(
+    driver: webdriver.Chrome,
+    selectors: list[str],
+    deadline: Optional[float] = None,
+    absent_of: Optional[list[str]] = None,
+) -> Optional[str]:
+    """
+    Ждёт первый из селекторов с содержимым. deadline — абсолютное время (time.time()),
+    общее для всех ожиданий одной карточки. Возвращает сработавший селектор,
+    LABELS_ABSENT (если задан absent_of и виджета на странице точно нет) или None.
+    """
+    if deadline is None:
+        deadline = card_deadline()
+    remaining_ms = max(0, int((deadline - time.time()) * 1000))
+    options = {"absentOf": absent_of, "graceMs": int(LABEL_ABSENT_GRACE_SEC * 1000)}
     try:
-        WebDriverWait(driver, DEFAULT_LABEL_WAIT_SEC).until(
-            lambda d: d.find_elements(By.CSS_SELECTOR, ".b5_5_1-a5[title], .b5_5_1-a5")
+        return driver.execute_async_script(
+            WAIT_FOR_ANY_JS
+            + """
+            const done = arguments[arguments.length - 1];
+            waitForAny(arguments[0], Date.now() + arguments[1], arguments[2]).then(done, () => done(null));
+            """,
+            selectors,
+            remaining_ms,
+            options,
         )
     except Exception:
-        pass
-    try:
-        WebDriverWait(driver, DEFAULT_LABEL_WAIT_SEC).until(
-            lambda d: d.execute_script(
-                """
-                const root = document.querySelectorAll("[data-widget='webMarketingLabels']");
-                for (const node of root) {
-                  if (node.innerText && node.innerText.trim()) return true;
-                  const titled = node.querySelector("[title],[aria-label],img[alt]");
-                  if (titled) return true;
-                }
-                return false;
-                """
-            )
-        )
-    except Exception:
-        pass
+        return None
+
+
+def collect_label_text(driver: webdriver.Chrome, deadline: Optional[float] = None) -> str:
+    if wait_for_any(driver, LABEL_SELECTORS, deadline, absent_of=PRODUCT_SELECTORS) == LABELS_ABSENT:
+        # Карточка отрисована без виджета — обходы DOM ничего не найдут.
+        return ""
 
     try:
         chunks = driver.execute_script(
@@ -697,11 +1546,8 @@ def collect_label_text(driver: webdriver.Chrome) -> str:
         #     except Exception as e:
         #         print("[DEBUG] webMarketingLabels outerHTML error:", e)
         if chunks:
-            filtered = filter_label_chunks([str(x) for x in chunks if x], has_icon=has_icon)
-            if filtered:
-                combined = " ".join(filtered)
-                if has_icon and "подарок" not in normalize_text(combined):
-                    return f"{combined} 🎁"
+            combined = label_text_from_chunks(chunks, has_icon=has_icon)
+            if combined:
                 return combined
     except Exception:
         pass
@@ -798,8 +1644,11 @@ def extract_label_from_text(text: str) -> Optional[str]:
     return None
 
 
-def check_current_page(driver: webdriver.Chrome, url: str) -> CheckResult:
-    time.sleep(random.uniform(0.4, 0.8))
+def read_card_legacy(driver: webdriver.Chrome, url: str) -> CheckResult:
+    """
+    Старый пошаговый разбор карточки отдельными вызовами WebDriver.
+    Используется, если скрипт извлечения не отработал.
+    """
     try:
         driver.execute_script("window.scrollTo(0, Math.floor(document.body.scrollHeight * 0.3));")
         time.sleep(0.2)
@@ -812,7 +1661,8 @@ def check_current_page(driver: webdriver.Chrome, url: str) -> CheckResult:
     except Exception:
         pass
 
-    label_text = collect_label_text(driver)
+    deadline = card_deadline()
+    label_text = collect_label_text(driver, deadline)
     has_label = label_present(label_text)
 
     try:
@@ -834,7 +1684,7 @@ def check_current_page(driver: webdriver.Chrome, url: str) -> CheckResult:
                 label_text = label_from_body
                 has_label = True
 
-    seller_name = extract_seller_name(driver)
+    seller_name = extract_seller_name(driver, deadline)
     if not seller_name:
         seller_name = extract_seller_from_source(page_source)
     if not seller_name:
@@ -858,6 +1708,231 @@ def check_current_page(driver: webdriver.Chrome, url: str) -> CheckResult:
 
 
 
+EXTRACT_PAGE_JS = WAIT_FOR_ANY_JS + """
+const done = arguments[arguments.length - 1];
+const deadline = Date.now() + arguments[0];
+const sellerSelectors = arguments[1];
+const labelSelectors = arguments[2];
+const waitOptions = arguments[3];
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+const labelRoots = () => document.querySelectorAll("[data-widget='webMarketingLabels']");
+const sellerText = () => {
+  for (const selector of sellerSelectors) {
+    for (const el of document.querySelectorAll(selector)) {
+      const text = (el.innerText || el.textContent || "").trim();
+      if (text && text.toLowerCase() !== "перейти") return text;
+    }
+  }
+  return "";
+};
+const hasSim = (list) => list.some((t) => String(t).toLowerCase().includes("sim"));
+(async () => {
+  try {
+    // Лейблы и продавец ждутся параллельно с одним общим дедлайном. Сначала без
+    // прокрутки: обычно оба виджета уже в первом экране.
+    const firstPass = Math.min(deadline, Date.now() + 1500);
+    let [labelHit, sellerHit] = await Promise.all([
+      waitForAny(labelSelectors, firstPass, waitOptions),
+      waitForAny(sellerSelectors, firstPass),
+    ]);
+    if (!labelHit || !sellerHit) {
+      // Прокручиваем только к тем виджетам, что ещё не отрисовались: к их
+      // заглушке, если она есть, иначе — ступенями по странице.
+      const missing = (labelHit ? [] : labelSelectors).concat(sellerHit ? [] : sellerSelectors);
+      const placeholder = document.querySelector(missing.join(","));
+      if (placeholder) {
+        placeholder.scrollIntoView({ block: "center" });
+      } else {
+        for (const part of [0.3, 0.6, 1]) {
+          window.scrollTo(0, Math.floor(document.body.scrollHeight * part));
+          await sleep(150);
+          if (document.querySelector(missing.join(","))) break;
+        }
+      }
+      [labelHit, sellerHit] = await Promise.all([
+        labelHit || waitForAny(labelSelectors, deadline, waitOptions),
+        sellerHit || waitForAny(sellerSelectors, deadline),
+      ]);
+      window.scrollTo(0, 0);
+    }
+
+    const out = { chunks: [], has_icon: false, widget_present: false, widget_absent: labelHit === "absent",
+                  walk_hits: [], label_sources: [], seller: "", seller_source: "", body_text: "" };
+    labelRoots().forEach((node) => {
+      out.widget_present = true;
+      if (node.innerText) out.chunks.push(node.innerText);
+      node.querySelectorAll("[title],[aria-label],img[alt]").forEach((el) => {
+        const t = el.getAttribute("title") || el.getAttribute("aria-label") || el.getAttribute("alt");
+        if (t) out.chunks.push(t);
+      });
+      if (node.querySelector("img,svg")) out.has_icon = true;
+    });
+    document.querySelectorAll(".b5_5_1-a5").forEach((node) => {
+      if (node.innerText) out.chunks.push(node.innerText);
+      const t = node.getAttribute("title");
+      if (t) out.chunks.push(t);
+    });
+
+    if (!out.widget_absent && !hasSim(out.chunks)) {
+      const isHit = (t) => {
+        if (!t) return false;
+        const s = String(t).toLowerCase();
+        return s.includes("sim") && s.includes("tecno") && (s.includes("🎁") || s.includes("подар"));
+      };
+      const walk = (node) => {
+        if (!node) return;
+        if (node.nodeType === Node.ELEMENT_NODE) {
+          const el = node;
+          if (!el.children || el.children.length === 0) {
+            if (isHit(el.textContent)) out.walk_hits.push(el.textContent);
+          }
+          for (const attr of ["title", "aria-label", "alt"]) {
+            const v = el.getAttribute && el.getAttribute(attr);
+            if (isHit(v)) out.walk_hits.push(v);
+          }
+          if (el.shadowRoot) walk(el.shadowRoot);
+        }
+        if (node.childNodes) node.childNodes.forEach(walk);
+      };
+      walk(document.body);
+    }
+
+    out.seller = sellerText();
+    let html = null;
+    const source = () => (html === null ? (html = document.documentElement.outerHTML) : html);
+    if (!out.widget_absent && !hasSim(out.chunks) && !hasSim(out.walk_hits)) {
+      for (const re of [
+        /class="[^"]*b5_5_1-a5[^"]*"[^>]*title="([^"]+)"/g,
+        /class="[^"]*b5_5_1-a5[^"]*"[^>]*>([^<]+)<\\//g,
+      ]) {
+        for (const m of source().matchAll(re)) out.label_sources.push(m[1]);
+      }
+    }
+    if (!out.seller) {
+      for (const re of [/"sellerName":"([^"]+)"/, /"merchantName":"([^"]+)"/, /"seller":"([^"]+)"/, /"companyName":"([^"]+)"/]) {
+        const m = source().match(re);
+        if (m) { out.seller_source = m[1]; break; }
+      }
+      out.body_text = document.body ? document.body.innerText || "" : "";
+    }
+    done(out);
+  } catch (e) {
+    done(null);
+  }
+})();
+"""
+
+
+def webdriver_calls(driver: webdriver.Chrome) -> int:
+    return getattr(driver, "_ozon_calls", 0)
+
+
+def _count_webdriver_calls(driver: webdriver.Chrome) -> None:
+    # Все команды Selenium проходят через driver.execute — считаем их для отладки.
+    execute = driver.execute
+
+    def counted(driver_command, params=None):
+        driver._ozon_calls = getattr(driver, "_ozon_calls", 0) + 1
+        return execute(driver_command, params)
+
+    driver._ozon_calls = 0
+    driver.execute = counted
+
+
+def extract_page_data(driver: webdriver.Chrome, wait_sec: float = DEFAULT_LABEL_WAIT_SEC) -> Optional[dict]:
+    """
+    Один асинхронный скрипт вместо цепочки WebDriverWait/find_elements/page_source:
+    сам ждёт виджеты (не дольше wait_sec) и возвращает всё, что нужно для CheckResult.
+    """
+    try:
+        data = driver.execute_async_script(
+            EXTRACT_PAGE_JS,
+            int(wait_sec * 1000),
+            SELLER_SELECTORS,
+            LABEL_SELECTORS,
+            {"absentOf": PRODUCT_SELECTORS, "graceMs": int(LABEL_ABSENT_GRACE_SEC * 1000)},
+        )
+    except Exception:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def label_text_from_chunks(chunks: list, has_icon: bool = False) -> str:
+    filtered = filter_label_chunks([str(x) for x in chunks if x], has_icon=has_icon)
+    if not filtered:
+        return ""
+    combined = " ".join(filtered)
+    if has_icon and "подарок" not in normalize_text(combined):
+        return f"{combined} 🎁"
+    return combined
+
+
+def card_result_from_data(url: str, data: dict) -> CheckResult:
+    label_text = label_text_from_chunks(data.get("chunks") or [], has_icon=bool(data.get("has_icon")))
+    if not label_text:
+        label_text = label_text_from_chunks(data.get("walk_hits") or [])
+    has_label = label_present(label_text)
+    if not has_label:
+        for cand in data.get("label_sources") or []:
+            if is_label_candidate(normalize_text(cand)):
+                label_text = cand
+                has_label = True
+                break
+
+    body_text_raw = data.get("body_text") or ""
+    seller_name = (data.get("seller") or "").strip() or None
+    if seller_name and normalize_text(seller_name) == "перейти":
+        seller_name = None
+    if not seller_name:
+        seller_name = data.get("seller_source") or None
+    if not seller_name:
+        seller_name = extract_seller_from_text(body_text_raw)
+    return CheckResult(
+        url=url,
+        ok=True,
+        has_label=has_label,
+        seller_ok=is_ozon_seller(seller_name, normalize_text(body_text_raw)),
+        seller_name=seller_name,
+        label_text=label_text,
+        error=None,
+    )
+
+
+def read_card(
+    driver: webdriver.Chrome,
+    url: str,
+    calls_before: Optional[int] = None,
+) -> CheckResult:
+    if calls_before is None:
+        calls_before = webdriver_calls(driver)
+    traffic_before = traffic_snapshot(driver)
+    wait_until_ready(driver)
+    data = extract_page_data(driver)
+    if data is None:
+        result = read_card_legacy(driver, url)
+    else:
+        result = card_result_from_data(url, data)
+        if result.has_label and CLICK_LABEL:
+            _clicked = click_label_by_text(driver)
+            if _clicked:
+                time.sleep(0.5)
+    result.sku = product_sku(url)
+    if not result.sku:
+        try:
+            result.sku = product_sku(driver.current_url)
+        except Exception:
+            pass
+    result.webdriver_calls = webdriver_calls(driver) - calls_before
+    result.traffic = traffic_delta(traffic_before, traffic_snapshot(driver))
+    if DEBUG_MODE:
+        print(f"[DEBUG] {url} webdriver calls: {result.webdriver_calls}")
+    return result
+
+
+def check_current_page(driver: webdriver.Chrome, url: str) -> CheckResult:
+    return read_card(driver, url)
+
+
 def extract_seller_from_source(page_source: str) -> Optional[str]:
     if not page_source:
         return None
@@ -891,21 +1966,9 @@ def label_present(label_text: str) -> bool:
     return is_label_candidate(norm, has_icon="🎁" in (label_text or ""))
 
 
-def extract_seller_name(driver: webdriver.Chrome) -> Optional[str]:
-    selectors = [
-        "[data-widget='webProductSeller']",
-        "[data-widget='webOutOfStockSeller']",
-        "div[class*='b35_3_18-a9'] span[class*='b35_3_18-b6']",
-        "span[class*='b35_3_18-b6']",
-        "div[class*='pdp_a5m'] span[class*='b35_3_18-b6']",
-    ]
-    for selector in selectors:
-        try:
-            WebDriverWait(driver, DEFAULT_LABEL_WAIT_SEC).until(
-                lambda d: d.find_elements(By.CSS_SELECTOR, selector)
-            )
-        except Exception:
-            continue
+def extract_seller_name(driver: webdriver.Chrome, deadline: Optional[float] = None) -> Optional[str]:
+    selectors = SELLER_SELECTORS
+    wait_for_any(driver, selectors, deadline)
     for selector in selectors:
         try:
             elems = driver.find_elements(By.CSS_SELECTOR, selector)
@@ -1006,9 +2069,56 @@ def seller_matches_filter(
     return any(seller_norm == val for val in values)
 
 
-def check_url(url: str) -> CheckResult:
-    driver = create_driver()
+def check_urls_in_tabs(
+    driver: webdriver.Chrome,
+    urls: Iterable[str],
+    width: Optional[int] = None,
+    cancel_check: Optional[Callable[[], bool]] = None,
+    on_start: Optional[Callable[[str], None]] = None,
+    block_profile: Optional[str] = None,
+) -> Iterator[CheckResult]:
+    if block_profile is not None:
+        apply_block_profile(driver, block_profile)
+    for url, loaded in iter_tab_pages(driver, urls, width=width, cancel_check=cancel_check):
+        if on_start:
+            on_start(url)
+        if not loaded:
+            yield CheckResult(
+                url=url,
+                ok=False,
+                has_label=False,
+                seller_ok=None,
+                seller_name=None,
+                label_text="",
+                error="Не удалось открыть страницу после повторов.",
+            )
+            continue
+        try:
+            yield check_current_page(driver, url)
+        except Exception as e:
+            yield CheckResult(
+                url=url,
+                ok=False,
+                has_label=False,
+                seller_ok=None,
+                seller_name=None,
+                label_text="",
+                error=str(e),
+            )
+
+
+def check_url(
+    url: str,
+    driver: Optional[webdriver.Chrome] = None,
+    block_profile: Optional[str] = None,
+) -> CheckResult:
+    own_driver = driver is None
+    if own_driver:
+        driver = create_driver()
     try:
+        if block_profile is not None:
+            apply_block_profile(driver, block_profile)
+        calls_before = webdriver_calls(driver)
         ok = safe_get(driver, url)
         if not ok:
             return CheckResult(
@@ -1020,73 +2130,17 @@ def check_url(url: str) -> CheckResult:
                 label_text="",
                 error="Не удалось открыть страницу после повторов.",
             )
-
-        time.sleep(random.uniform(0.5, 1.0))
-        try:
-            driver.execute_script("window.scrollTo(0, Math.floor(document.body.scrollHeight * 0.3));")
-            time.sleep(0.25)
-            driver.execute_script("window.scrollTo(0, Math.floor(document.body.scrollHeight * 0.6));")
-            time.sleep(0.25)
-            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            time.sleep(0.25)
-            driver.execute_script("window.scrollTo(0, 0);")
-            time.sleep(0.2)
-        except Exception:
-            pass
-
-        label_text = collect_label_text(driver)
-        has_label = label_present(label_text)
-
-        try:
-            body_text_raw = driver.find_element(By.TAG_NAME, "body").text
-        except Exception:
-            body_text_raw = ""
-        body_text = normalize_text(body_text_raw)
-
-        page_source = driver.page_source or ""
         # DEBUG BLOCK (enable if needed)
         # if DEBUG_MODE:
         #     try:
         #         print("[DEBUG] current_url:", driver.current_url)
         #         print("[DEBUG] title:", driver.title)
-        #         Path("debug_page.html").write_text(page_source, encoding="utf-8")
-        #         Path("debug_body.txt").write_text(body_text_raw, encoding="utf-8")
+        #         Path("debug_page.html").write_text(driver.page_source, encoding="utf-8")
         #         driver.save_screenshot("debug_page.png")
-        #         print("[DEBUG] wrote debug_page.html, debug_body.txt, debug_page.png")
+        #         print("[DEBUG] wrote debug_page.html, debug_page.png")
         #     except Exception as e:
         #         print("[DEBUG] debug dump error:", e)
-
-        if not has_label:
-            label_from_source = extract_label_from_source(page_source)
-            if label_from_source:
-                label_text = label_from_source
-                has_label = True
-            else:
-                label_from_body = extract_label_from_text(body_text_raw)
-                if label_from_body:
-                    label_text = label_from_body
-                    has_label = True
-
-        seller_name = extract_seller_name(driver)
-        if not seller_name:
-            seller_name = extract_seller_from_source(page_source)
-        if not seller_name:
-            seller_name = extract_seller_from_text(body_text_raw)
-
-        if has_label and CLICK_LABEL:
-            _clicked = click_label_by_text(driver)
-            if _clicked:
-                time.sleep(0.5)
-        seller_ok = is_ozon_seller(seller_name, body_text)
-        return CheckResult(
-            url=url,
-            ok=True,
-            has_label=has_label,
-            seller_ok=seller_ok,
-            seller_name=seller_name,
-            label_text=label_text,
-            error=None,
-        )
+        return read_card(driver, url, calls_before=calls_before)
     except Exception as e:
         return CheckResult(
             url=url,
@@ -1098,7 +2152,8 @@ def check_url(url: str) -> CheckResult:
             error=str(e),
         )
     finally:
-        try:
-            driver.quit()
-        except Exception:
-            pass
+        if own_driver:
+            try:
+                driver.quit()
+            except Exception:
+                pass
@@ -0,0 +1,134 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import asdict, fields
+from pathlib import Path
+from typing import Optional
+
+from ozon_check import CheckResult, product_key
+
+BASE_DIR = Path(__file__).resolve().parent
+CACHE_FILE = Path(os.getenv("OZON_CACHE_FILE", str(BASE_DIR / "result_cache.sqlite3")))
+CACHE_TTL_SEC = int(os.getenv("OZON_CACHE_TTL_SEC", "86400"))
+CACHE_MAX_ROWS = int(os.getenv("OZON_CACHE_MAX_ROWS", "50000"))
+CACHE_MAX_AGE_SEC = int(os.getenv("OZON_CACHE_MAX_AGE", "0"))
+# Чистим устаревшие записи не на каждую запись, а раз в N вставок.
+CACHE_EVICT_EVERY = 200
+
+# Счётчики конкретного прогона в кэш не пишем.
+_VOLATILE_FIELDS = ("webdriver_calls", "traffic", "cached_at")
+_RESULT_FIELDS = {f.name for f in fields(CheckResult)}
+
+
+def normalize_max_age(value) -> int:
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return CACHE_MAX_AGE_SEC
+
+
+class ResultCache:
+    """
+    Результаты проверки карточек по артикулу. Запись живёт не дольше ttl_sec,
+    таблица не растёт больше max_rows строк (вытесняются самые старые).
+    """
+
+    def __init__(
+        self,
+        path: Path = CACHE_FILE,
+        ttl_sec: int = CACHE_TTL_SEC,
+        max_rows: int = CACHE_MAX_ROWS,
+    ):
+        self.path = Path(path)
+        self.ttl_sec = max(0, int(ttl_sec))
+        self.max_rows = max(0, int(max_rows))
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._writes = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "sku TEXT PRIMARY KEY, url TEXT NOT NULL, result TEXT NOT NULL, checked_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS results_checked_at ON results(checked_at)")
+            self._conn = conn
+            self._evict(conn)
+        return self._conn
+
+    def get(self, url: str, max_age_sec: int) -> Optional[CheckResult]:
+        """
+        Результат не старше max_age_sec (и не старше TTL кэша) или None.
+        """
+        key = product_key(url)
+        if not key or max_age_sec <= 0:
+            return None
+        limit = min(max_age_sec, self.ttl_sec) if self.ttl_sec else max_age_sec
+        try:
+            with self._lock:
+                row = self._connect().execute(
+                    "SELECT result, checked_at FROM results WHERE sku = ? AND checked_at >= ?",
+                    (key, time.time() - limit),
+                ).fetchone()
+        except sqlite3.Error:
+            return None
+        if not row:
+            return None
+        try:
+            data = json.loads(row[0])
+        except ValueError:
+            return None
+        data = {k: v for k, v in data.items() if k in _RESULT_FIELDS}
+        data["url"] = url
+        data["cached_at"] = row[1]
+        try:
+            return CheckResult(**data)
+        except TypeError:
+            return None
+
+    def put(self, result: CheckResult) -> None:
+        # Ошибки и недочитанные карточки не кэшируем — их нужно перепроверить.
+        if not result.ok or result.error or result.cached_at is not None:
+            return
+        # Короткую ссылку кэшируем под артикулом карточки, куда она привела.
+        key = result.sku or product_key(result.url)
+        if not key:
+            return
+        data = {k: v for k, v in asdict(result).items() if k not in _VOLATILE_FIELDS}
+        try:
+            with self._lock:
+                conn = self._connect()
+                conn.execute(
+                    "INSERT OR REPLACE INTO results (sku, url, result, checked_at) VALUES (?, ?, ?, ?)",
+                    (key, result.url, json.dumps(data, ensure_ascii=False), time.time()),
+                )
+                conn.commit()
+                self._writes += 1
+                if self._writes % CACHE_EVICT_EVERY == 0:
+                    self._evict(conn)
+        except sqlite3.Error:
+            pass
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        if self.ttl_sec:
+            conn.execute("DELETE FROM results WHERE checked_at < ?", (time.time() - self.ttl_sec,))
+        if self.max_rows:
+            conn.execute(
+                "DELETE FROM results WHERE sku IN ("
+                "SELECT sku FROM results ORDER BY checked_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_rows,),
+            )
+        conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            conn, self._conn = self._conn, None
+        if conn is not None:
+            conn.close()
@@ -0,0 +1,21 @@
+"""
+Отдельный процесс планировщика: ведёт очередь задач и держит браузеры.
+Веб‑воркеры при этом запускаются с OZON_SCHEDULER=0 и только принимают запросы.
+
+    OZON_SCHEDULER=0 gunicorn -w 4 app:app
+    python scheduler.py
+"""
+import os
+import time
+
+os.environ["OZON_SCHEDULER"] = "1"
+
+import app  # noqa: E402  — очередь запускается при импорте
+
+if __name__ == "__main__":
+    while True:
+        time.sleep(60)
+        if not app.store_thread.is_alive():
+            raise SystemExit("Поток планировщика остановился.")
+        # store_loop перезапускает поток очереди и сам; здесь — на случай, если он завис.
+        app.ensure_worker()
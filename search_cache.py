@@ -0,0 +1,150 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from ozon_check import normalize_text, sku_set
+from result_cache import CACHE_FILE
+
+SEARCH_REUSE_SEC = int(os.getenv("OZON_SEARCH_REUSE_SEC", "21600"))
+# Сколько артикулов отдавать в отчёте о разнице между обходами.
+SEARCH_DIFF_LIMIT = int(os.getenv("OZON_SEARCH_DIFF_LIMIT", "500"))
+
+
+def query_key(query: str) -> str:
+    return normalize_text(query)
+
+
+class SearchCache:
+    """
+    Последний обход поисковой выдачи: ссылки по (запрос, страница) и время загрузки страницы.
+    """
+
+    def __init__(self, path: Path = CACHE_FILE):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS search_pages ("
+                "query TEXT NOT NULL, page INTEGER NOT NULL, urls TEXT NOT NULL, "
+                "fetched_at REAL NOT NULL, PRIMARY KEY (query, page))"
+            )
+            self._conn = conn
+        return self._conn
+
+    def load(self, query: str) -> dict[int, tuple[list[str], float]]:
+        try:
+            with self._lock:
+                rows = self._connect().execute(
+                    "SELECT page, urls, fetched_at FROM search_pages WHERE query = ? ORDER BY page",
+                    (query_key(query),),
+                ).fetchall()
+        except sqlite3.Error:
+            return {}
+        pages: dict[int, tuple[list[str], float]] = {}
+        for page, urls, fetched_at in rows:
+            try:
+                pages[int(page)] = (list(json.loads(urls)), float(fetched_at))
+            except ValueError:
+                continue
+        return pages
+
+    def save_page(self, query: str, page: int, urls: list[str]) -> None:
+        try:
+            with self._lock:
+                conn = self._connect()
+                conn.execute(
+                    "INSERT OR REPLACE INTO search_pages (query, page, urls, fetched_at) VALUES (?, ?, ?, ?)",
+                    (query_key(query), int(page), json.dumps(urls, ensure_ascii=False), time.time()),
+                )
+                conn.commit()
+        except sqlite3.Error:
+            pass
+
+    def trim(self, query: str, last_page: int) -> None:
+        """
+        Выдача закончилась на last_page — страницы прошлого обхода дальше неё больше не актуальны.
+        """
+        try:
+            with self._lock:
+                conn = self._connect()
+                conn.execute(
+                    "DELETE FROM search_pages WHERE query = ? AND page > ?",
+                    (query_key(query), int(last_page)),
+                )
+                conn.commit()
+        except sqlite3.Error:
+            pass
+
+    def close(self) -> None:
+        with self._lock:
+            conn, self._conn = self._conn, None
+        if conn is not None:
+            conn.close()
+
+
+class SearchCrawl:
+    """
+    Один инкрементальный обход: отдаёт collect_search_urls страницы прошлого обхода
+    в пределах окна reuse_sec, сохраняет новые и считает разницу по артикулам.
+    """
+
+    def __init__(self, cache: SearchCache, query: str, reuse_sec: int = SEARCH_REUSE_SEC):
+        self.cache = cache
+        self.query = query
+        self.previous = cache.load(query)
+        now = time.time()
+        self.stored_pages = {
+            page: urls
+            for page, (urls, fetched_at) in self.previous.items()
+            if reuse_sec > 0 and now - fetched_at <= reuse_sec
+        }
+        self.pages_fetched = 0
+        self.pages_reused = 0
+        self.last_page = 0
+
+    def on_page(self, page: int, links: list[str], reused: bool) -> None:
+        if reused:
+            self.pages_reused += 1
+        else:
+            self.pages_fetched += 1
+            self.cache.save_page(self.query, page, links)
+        self.last_page = max(self.last_page, page)
+
+    def finish(self, urls: list[str], complete: bool, max_pages: int = 0) -> dict:
+        """
+        complete=False — обход прерван, хвост прошлого обхода не трогаем.
+        """
+        if complete and self.last_page and (not max_pages or self.last_page < max_pages):
+            self.cache.trim(self.query, self.last_page)
+        summary = {"pages_fetched": self.pages_fetched, "pages_reused": self.pages_reused}
+        previous_pages = {
+            page: item for page, item in self.previous.items() if not max_pages or page <= max_pages
+        }
+        if not previous_pages or not complete:
+            return summary
+        before: set[str] = set()
+        for links, _ in previous_pages.values():
+            before |= sku_set(links)
+        after = sku_set(urls)
+        added = sorted(after - before)
+        removed = sorted(before - after)
+        summary.update(
+            {
+                "previous_at": max(fetched_at for _, fetched_at in previous_pages.values()),
+                "added_count": len(added),
+                "removed_count": len(removed),
+                "added": added[:SEARCH_DIFF_LIMIT],
+                "removed": removed[:SEARCH_DIFF_LIMIT],
+            }
+        )
+        return summary
@@ -0,0 +1,246 @@
+import os
+import threading
+import time
+from dataclasses import dataclass
+from queue import Empty, Full, Queue
+from typing import Callable, Iterator, Optional
+
+from ozon_check import CheckResult
+
+PIPELINE_ENABLED = os.getenv("OZON_PIPELINE", "0") == "1"
+PIPELINE_SELLER_WORKERS = int(os.getenv("OZON_PIPELINE_SELLER_WORKERS", "1"))
+PIPELINE_LABEL_WORKERS = int(os.getenv("OZON_PIPELINE_LABEL_WORKERS", "1"))
+PIPELINE_QUEUE_SIZE = int(os.getenv("OZON_PIPELINE_QUEUE", "20"))
+
+_DONE = object()
+
+
+@dataclass
+class StageStats:
+    workers: int
+    done: int = 0
+    dropped: int = 0
+    busy: int = 0
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    def as_dict(self, depth: int) -> dict:
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        return {
+            "workers": self.workers,
+            "depth": depth,
+            "busy": self.busy,
+            "done": self.done,
+            "dropped": self.dropped,
+            "per_min": round(self.done * 60 / elapsed, 1) if elapsed > 0 else None,
+            "finished": self.finished_at is not None,
+        }
+
+
+class SearchPipeline:
+    """
+    Поиск → продавец → проверка карточки как три стадии со своими потоками.
+    Между стадиями — ограниченные очереди: если следующая стадия не успевает,
+    предыдущая ждёт (поиск перестаёт листать выдачу, пока очередь продавцов полна).
+
+    search_fn(emit) — обход выдачи, emit(urls) вызывается с накопленным списком ссылок.
+    resolve_seller(url) -> (подходит ли продавец, результат, если карточка уже прочитана);
+    None — фильтра по продавцу нет, ссылки идут сразу на проверку.
+    check_card(url) -> CheckResult для ссылок, которые ещё не прочитаны.
+    skip(url) -> True — ссылка уже обработана (например, по плитке выдачи), дальше не идёт.
+    """
+
+    def __init__(
+        self,
+        search_fn: Callable[[Callable[[list[str]], None]], list[str]],
+        resolve_seller: Optional[Callable[[str], tuple[bool, Optional[CheckResult]]]],
+        check_card: Callable[[str], CheckResult],
+        is_cancelled: Callable[[], bool],
+        seller_workers: int = PIPELINE_SELLER_WORKERS,
+        label_workers: int = PIPELINE_LABEL_WORKERS,
+        queue_size: int = PIPELINE_QUEUE_SIZE,
+        skip: Optional[Callable[[str], bool]] = None,
+    ):
+        self.search_fn = search_fn
+        self.resolve_seller = resolve_seller
+        self.check_card = check_card
+        self.is_cancelled = is_cancelled
+        self.skip = skip
+        self.seller_workers = max(1, int(seller_workers)) if resolve_seller else 1
+        self.label_workers = max(1, int(label_workers))
+        self._seller_queue: "Queue[object]" = Queue(maxsize=max(1, int(queue_size)))
+        self._label_queue: "Queue[object]" = Queue(maxsize=max(1, int(queue_size)))
+        self._out_queue: "Queue[object]" = Queue()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._emitted = 0
+        self._sellers_left = self.seller_workers
+        self._labels_left = self.label_workers
+        self.stages = {
+            "search": StageStats(workers=1),
+            "seller": StageStats(workers=self.seller_workers),
+            "label": StageStats(workers=self.label_workers),
+        }
+        self.search_urls: list[str] = []
+        self.kept_urls: list[str] = []
+        self.search_error: Optional[str] = None
+
+    def _halted(self) -> bool:
+        return self._stopped.is_set() or self.is_cancelled()
+
+    def _put(self, queue: "Queue[object]", item: object) -> bool:
+        # Блокирующая запись — это и есть backpressure, но стоп должен её прерывать.
+        while not self._halted():
+            try:
+                queue.put(item, timeout=0.5)
+                return True
+            except Full:
+                continue
+        return False
+
+    def _get(self, queue: "Queue[object]") -> object:
+        while not self._halted():
+            try:
+                return queue.get(timeout=0.5)
+            except Empty:
+                continue
+        return _DONE
+
+    def _emit(self, urls: list[str]) -> None:
+        for url in urls[self._emitted :]:
+            if not self._put(self._seller_queue, url):
+                # Исключение останавливает обход выдачи внутри collect_search_urls.
+                raise InterruptedError("Задача остановлена.")
+            self._emitted += 1
+            with self._lock:
+                self.stages["search"].done += 1
+
+    def _run_search(self) -> None:
+        self.stages["search"].started_at = time.time()
+        try:
+            self.search_urls = list(self.search_fn(self._emit) or [])
+            self._emit(self.search_urls)
+        except InterruptedError:
+            pass
+        except Exception as e:
+            self.search_error = str(e)
+        finally:
+            self.stages["search"].finished_at = time.time()
+            for _ in range(self.seller_workers):
+                self._put(self._seller_queue, _DONE)
+
+    def _run_seller(self) -> None:
+        stats = self.stages["seller"]
+        with self._lock:
+            stats.started_at = stats.started_at or time.time()
+        try:
+            while True:
+                item = self._get(self._seller_queue)
+                if item is _DONE:
+                    break
+                url = str(item)
+                if self.skip and self.skip(url):
+                    continue
+                with self._lock:
+                    stats.busy += 1
+                matched, result, error = True, None, None
+                try:
+                    if self.resolve_seller:
+                        matched, result = self.resolve_seller(url)
+                except Exception as e:
+                    # Продавца не узнали — это не «не подошёл»: карточка уходит в результаты с ошибкой.
+                    matched, error = False, f"Не удалось определить продавца: {e}"
+                with self._lock:
+                    stats.busy -= 1
+                    stats.done += 1
+                    if matched:
+                        self.kept_urls.append(url)
+                    elif error is None:
+                        stats.dropped += 1
+                if error is not None:
+                    self._out_queue.put((url, None, error))
+                    continue
+                if matched and not self._put(self._label_queue, (url, result)):
+                    break
+        finally:
+            with self._lock:
+                self._sellers_left -= 1
+                last = self._sellers_left == 0
+                if last:
+                    stats.finished_at = time.time()
+            if last:
+                for _ in range(self.label_workers):
+                    self._put(self._label_queue, _DONE)
+
+    def _run_label(self) -> None:
+        stats = self.stages["label"]
+        with self._lock:
+            stats.started_at = stats.started_at or time.time()
+        try:
+            while True:
+                item = self._get(self._label_queue)
+                if item is _DONE:
+                    break
+                url, result = item
+                error = None
+                with self._lock:
+                    stats.busy += 1
+                if result is None:
+                    try:
+                        result = self.check_card(url)
+                    except Exception as e:
+                        error = str(e)
+                with self._lock:
+                    stats.busy -= 1
+                    stats.done += 1
+                self._out_queue.put((url, result, error))
+        finally:
+            with self._lock:
+                self._labels_left -= 1
+                last = self._labels_left == 0
+                if last:
+                    stats.finished_at = time.time()
+            if last:
+                self._out_queue.put(_DONE)
+
+    def stats(self) -> dict:
+        depths = {
+            "search": 0,
+            "seller": self._seller_queue.qsize(),
+            "label": self._label_queue.qsize(),
+        }
+        with self._lock:
+            return {name: stage.as_dict(depths[name]) for name, stage in self.stages.items()}
+
+    def run(
+        self, on_stats: Optional[Callable[[dict], None]] = None
+    ) -> Iterator[tuple[str, Optional[CheckResult], Optional[str]]]:
+        """
+        Отдаёт (url, result, error) по мере готовности, порядок не гарантирован.
+        """
+        threads = [threading.Thread(target=self._run_search, daemon=True)]
+        threads += [
+            threading.Thread(target=self._run_seller, daemon=True) for _ in range(self.seller_workers)
+        ]
+        threads += [
+            threading.Thread(target=self._run_label, daemon=True) for _ in range(self.label_workers)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                if self.is_cancelled():
+                    return
+                try:
+                    item = self._out_queue.get(timeout=0.5)
+                except Empty:
+                    item = None
+                if on_stats:
+                    on_stats(self.stats())
+                if item is _DONE:
+                    return
+                if item is not None:
+                    yield item
+        finally:
+            self._stopped.set()
@@ -73,6 +73,7 @@ const formLockEls = [
 let currentTsId = config.default_ts_id || "";
 let presets = config.presets || {};
 let pollingTimer = null;
+let jobEvents = null;
 let currentJobId = null;
 let currentSearchJobId = null;
 let jobStartedAt = null;
@@ -580,7 +581,7 @@ const updateXlsxLinkWithFilter = (jobId) => {
   xlsxLink.href = `/jobs/${jobId}/xlsx${query}`;
 };
 
-const renderPending = (pendingUrls) => {
+const renderPending = (pendingUrls, pendingCount) => {
   if (!pendingList) return;
   pendingList.textContent = "";
   if (!pendingUrls || pendingUrls.length === 0) {
@@ -596,220 +597,358 @@ const renderPending = (pendingUrls) => {
     row.innerHTML = `<span class="result-label">PENDING</span><a href="${url}" target="_blank" rel="noopener">${url}</a>`;
     pendingList.appendChild(row);
   });
+  // Статус приносит только голову очереди.
+  const rest = (pendingCount || 0) - pendingUrls.length;
+  if (rest > 0) {
+    const more = document.createElement("div");
+    more.className = "result-empty";
+    more.textContent = `…и ещё ${rest}`;
+    pendingList.appendChild(more);
+  }
 };
 
-const pollJob = async (jobId, options = {}) => {
-  const { isSearchOnly = false } = options;
+const stopJobUpdates = () => {
   if (pollingTimer) {
     clearInterval(pollingTimer);
+    pollingTimer = null;
+  }
+  if (jobEvents) {
+    jobEvents.close();
+    jobEvents = null;
   }
+};
 
-  const tick = async () => {
-    try {
-      const res = await fetch(`/jobs/${jobId}`);
-      const data = await res.json();
-      if (!res.ok || !data.ok) {
-        updateQueueInfo("Очередь: ошибка получения статуса");
-        xlsxLink.classList.remove("active");
-        return;
-      }
+const pollJob = async (jobId, options = {}) => {
+  const { isSearchOnly = false } = options;
+  stopJobUpdates();
+  let finished = false;
+
+  const applyJobState = (data) => {
+    if (data.status === "done" || data.status === "stopped") {
+      finished = true;
+    }
+    if (isSearchOnly && searchInfo) {
+      searchInfo.textContent = `Поиск: ${data.status} (${data.done}/${data.total})`;
+    } else {
+      updateQueueInfo(`Очередь: ${data.status} (${data.done}/${data.total})`);
+    }
+    if (data.error) {
       if (isSearchOnly && searchInfo) {
-        searchInfo.textContent = `Поиск: ${data.status} (${data.done}/${data.total})`;
+        searchInfo.textContent = data.error;
       } else {
-        updateQueueInfo(`Очередь: ${data.status} (${data.done}/${data.total})`);
+        updateQueueInfo(data.error);
       }
-      if (data.error) {
-        if (isSearchOnly && searchInfo) {
-          searchInfo.textContent = data.error;
-        } else {
-          updateQueueInfo(data.error);
-        }
-      }
-      if (stopBtn) {
-        stopBtn.disabled = data.status !== "running" && data.status !== "queued";
-      }
-      if (!isSearchOnly) {
-        setFormLocked(data.status === "running" || data.status === "queued");
-      }
-      if (collectInfo) {
-        const collected = data.collected_count != null ? data.collected_count : data.total;
-        collectInfo.textContent = `Собрано ссылок: ${collected}`;
+    }
+    if (stopBtn) {
+      stopBtn.disabled = data.status !== "running" && data.status !== "queued";
+    }
+    if (!isSearchOnly) {
+      setFormLocked(data.status === "running" || data.status === "queued");
+    }
+    if (collectInfo) {
+      const collected = data.collected_count != null ? data.collected_count : data.total;
+      collectInfo.textContent = `Собрано ссылок: ${collected}`;
+    }
+    if (phaseInfo) {
+      const phase = data.phase;
+      const phaseCount = typeof data.phase_count === "number" ? data.phase_count : null;
+      const countSuffix = phaseCount !== null ? ` (${phaseCount})` : "";
+      if (phase === "search") {
+        phaseInfo.textContent = `Сбор карточек поиска${countSuffix}`;
+        phaseInfo.classList.remove("phase-highlight");
+      } else if (phase === "seller") {
+        phaseInfo.textContent = `Прохождение ТС${countSuffix}`;
+        phaseInfo.classList.remove("phase-highlight");
+      } else if (phase === "pipeline") {
+        const stages = data.pipeline || {};
+        const depth = (name) => (stages[name] ? stages[name].depth : 0);
+        phaseInfo.textContent =
+          `Поиск, продавцы и тестирование параллельно${countSuffix}` +
+          ` · очередь продавцов: ${depth("seller")}, тестов: ${depth("label")}`;
+        phaseInfo.classList.add("phase-highlight");
+      } else if (phase === "testing") {
+        phaseInfo.textContent = "ТС Идет тестирование";
+        phaseInfo.classList.add("phase-highlight");
+      } else if (data.search_done && data.status === "running") {
+        phaseInfo.textContent = "ТС Идет тестирование";
+        phaseInfo.classList.add("phase-highlight");
+      } else if (data.search_done) {
+        phaseInfo.textContent = "Фаза: сбор завершён";
+        phaseInfo.classList.remove("phase-highlight");
+      } else {
+        phaseInfo.textContent = "Сбор карточек поиска";
+        phaseInfo.classList.remove("phase-highlight");
       }
-      if (phaseInfo) {
-        const phase = data.phase;
-        const phaseCount = typeof data.phase_count === "number" ? data.phase_count : null;
-        const countSuffix = phaseCount !== null ? ` (${phaseCount})` : "";
-        if (phase === "search") {
-          phaseInfo.textContent = `Сбор карточек поиска${countSuffix}`;
-          phaseInfo.classList.remove("phase-highlight");
-        } else if (phase === "seller") {
-          phaseInfo.textContent = `Прохождение ТС${countSuffix}`;
-          phaseInfo.classList.remove("phase-highlight");
-        } else if (phase === "testing") {
-          phaseInfo.textContent = "ТС Идет тестирование";
-          phaseInfo.classList.add("phase-highlight");
-        } else if (data.search_done && data.status === "running") {
-          phaseInfo.textContent = "ТС Идет тестирование";
-          phaseInfo.classList.add("phase-highlight");
-        } else if (data.search_done) {
-          phaseInfo.textContent = "Фаза: сбор завершён";
-          phaseInfo.classList.remove("phase-highlight");
-        } else {
-          phaseInfo.textContent = "Сбор карточек поиска";
-          phaseInfo.classList.remove("phase-highlight");
-        }
+    }
+    if (etaInfo) {
+      if (jobStartedAt === null && data.started_at) {
+        jobStartedAt = data.started_at;
       }
-      if (etaInfo) {
-        if (jobStartedAt === null && data.started_at) {
-          jobStartedAt = data.started_at;
-        }
-        const elapsedSec = jobStartedAt ? Math.max(Date.now() / 1000 - jobStartedAt, 0) : 0;
-        const elapsedMin = elapsedSec ? Math.ceil(elapsedSec / 60) : 0;
-        if (data.done > lastDoneCount) {
-          const now = Date.now();
-          const delta = data.done - lastDoneCount;
-          if (lastDoneTs) {
-            const elapsedSec = (now - lastDoneTs) / 1000;
-            const perItem = elapsedSec / delta;
-            for (let i = 0; i < delta; i += 1) {
-              etaSamples.push(perItem);
-            }
-            if (etaSamples.length > 10) {
-              etaSamples = etaSamples.slice(-10);
-            }
-          }
-          lastDoneCount = data.done;
-          lastDoneTs = now;
-        }
-        if (data.status === "running" && data.total && data.done) {
-          let perItem = null;
-          if (etaSamples.length > 0) {
-            const sum = etaSamples.reduce((acc, val) => acc + val, 0);
-            perItem = sum / etaSamples.length;
+      const elapsedSec = jobStartedAt ? Math.max(Date.now() / 1000 - jobStartedAt, 0) : 0;
+      const elapsedMin = elapsedSec ? Math.ceil(elapsedSec / 60) : 0;
+      if (data.done > lastDoneCount) {
+        const now = Date.now();
+        const delta = data.done - lastDoneCount;
+        if (lastDoneTs) {
+          const elapsedSec = (now - lastDoneTs) / 1000;
+          const perItem = elapsedSec / delta;
+          for (let i = 0; i < delta; i += 1) {
+            etaSamples.push(perItem);
           }
-          if (!perItem || !Number.isFinite(perItem)) {
-            perItem = 12;
+          if (etaSamples.length > 10) {
+            etaSamples = etaSamples.slice(-10);
           }
-          const remaining = Math.max(data.total - data.done, 0);
-          const etaSec = Math.round(remaining * perItem);
-          etaInfo.textContent = `Ожидаемое время теста: ~${Math.ceil(
-            etaSec / 60
-          )} мин • Прошло: ${elapsedMin} мин`;
-        } else if (data.status === "done") {
-          etaInfo.textContent = `Ожидаемое время теста: завершено • Прошло: ${elapsedMin} мин`;
-        } else {
-          etaInfo.textContent = `Ожидаемое время теста: — • Прошло: ${elapsedMin} мин`;
         }
+        lastDoneCount = data.done;
+        lastDoneTs = now;
       }
-      if (phaseCounts) {
-        if (typeof data.search_total === "number" && data.search_total > 0) {
-          const sellerKept = typeof data.seller_kept === "number" ? data.seller_kept : 0;
-          if (sellerKept > 0 || data.phase === "seller" || data.search_done) {
-            phaseCounts.textContent = `Продавец/Поиск: ${sellerKept}/${data.search_total}`;
-          } else {
-            phaseCounts.textContent = `Поиск: ${data.search_total}`;
-          }
-        } else {
-          phaseCounts.textContent = "Продавец/Поиск: —";
+      if (data.status === "running" && data.total && data.done) {
+        let perItem = null;
+        if (etaSamples.length > 0) {
+          const sum = etaSamples.reduce((acc, val) => acc + val, 0);
+          perItem = sum / etaSamples.length;
         }
+        if (!perItem || !Number.isFinite(perItem)) {
+          perItem = 12;
+        }
+        const remaining = Math.max(data.total - data.done, 0);
+        const etaSec = Math.round(remaining * perItem);
+        etaInfo.textContent = `Ожидаемое время теста: ~${Math.ceil(
+          etaSec / 60
+        )} мин • Прошло: ${elapsedMin} мин`;
+      } else if (data.status === "done") {
+        etaInfo.textContent = `Ожидаемое время теста: завершено • Прошло: ${elapsedMin} мин`;
+      } else {
+        etaInfo.textContent = `Ожидаемое время теста: — • Прошло: ${elapsedMin} мин`;
       }
-      if (checkedCounts) {
-        if (typeof data.search_total === "number" && data.search_total > 0) {
-          const checked =
-            typeof data.seller_checked === "number" && data.seller_checked > 0
-              ? data.seller_checked
-              : data.done || 0;
-          checkedCounts.textContent = `Проверено карточек: ${checked}/${data.search_total}`;
+    }
+    if (phaseCounts) {
+      if (typeof data.search_total === "number" && data.search_total > 0) {
+        const sellerKept = typeof data.seller_kept === "number" ? data.seller_kept : 0;
+        if (sellerKept > 0 || data.phase === "seller" || data.search_done) {
+          phaseCounts.textContent = `Продавец/Поиск: ${sellerKept}/${data.search_total}`;
         } else {
-          checkedCounts.textContent = "Проверено карточек: —";
+          phaseCounts.textContent = `Поиск: ${data.search_total}`;
         }
+      } else {
+        phaseCounts.textContent = "Продавец/Поиск: —";
+      }
+    }
+    if (checkedCounts) {
+      if (typeof data.search_total === "number" && data.search_total > 0) {
+        const checked =
+          typeof data.seller_checked === "number" && data.seller_checked > 0
+            ? data.seller_checked
+            : data.done || 0;
+        checkedCounts.textContent = `Проверено карточек: ${checked}/${data.search_total}`;
+      } else {
+        checkedCounts.textContent = "Проверено карточек: —";
       }
-      lastResults = data.results || [];
-      renderPending(data.pending_urls || []);
-      renderResults(lastResults, data.current_url);
-      updateResultStats(lastResults);
-
-      if (data.search_done) {
-        const collected = [];
-        (data.pending_urls || []).forEach((url) => collected.push(url));
-        (data.results || []).forEach((item) => {
-          if (item && item.url) collected.push(item.url);
+    }
+    lastResults = data.results || [];
+    renderPending(data.pending_urls || [], data.pending_count);
+    renderResults(lastResults, data.current_url);
+    updateResultStats(lastResults);
+
+    if (data.search_done && Array.isArray(data.all_pending_urls)) {
+      const collected = [];
+      data.all_pending_urls.forEach((url) => collected.push(url));
+      (data.results || []).forEach((item) => {
+        if (item && item.url) collected.push(item.url);
+      });
+      if (collected.length > 0) {
+        const unique = [];
+        const seen = new Set();
+        collected.forEach((url) => {
+          if (!seen.has(url)) {
+            seen.add(url);
+            unique.push(url);
+          }
         });
-        if (collected.length > 0) {
-          const unique = [];
-          const seen = new Set();
-          collected.forEach((url) => {
-            if (!seen.has(url)) {
-              seen.add(url);
-              unique.push(url);
-            }
-          });
-          lastSearchUrls = unique;
-        }
+        lastSearchUrls = unique;
       }
+    }
 
-      if (resultStatus && !isSearchOnly) {
-        resultStatus.textContent =
-          data.status === "done"
-            ? "Done"
-            : data.status === "stopped"
-            ? "Error"
-            : "Running";
-        resultStatus.classList.toggle("status-ok", data.status === "done");
-        resultStatus.classList.toggle("status-error", data.status === "stopped");
-        resultStatus.classList.toggle("status-warn", data.status !== "done" && data.status !== "stopped");
+    if (resultStatus && !isSearchOnly) {
+      resultStatus.textContent =
+        data.status === "done"
+          ? "Done"
+          : data.status === "stopped"
+          ? "Error"
+          : "Running";
+      resultStatus.classList.toggle("status-ok", data.status === "done");
+      resultStatus.classList.toggle("status-error", data.status === "stopped");
+      resultStatus.classList.toggle("status-warn", data.status !== "done" && data.status !== "stopped");
+    }
+    if (resultProgress && !isSearchOnly) {
+      resultProgress.textContent = `${data.done}/${data.total}`;
+    }
+    if (data.status === "done") {
+      stopJobUpdates();
+      if (isSearchOnly && searchInfo) {
+        searchInfo.textContent = "Поиск: завершено";
+      } else {
+        updateQueueInfo("Очередь: завершено");
       }
-      if (resultProgress && !isSearchOnly) {
-        resultProgress.textContent = `${data.done}/${data.total}`;
+      setFormLocked(false);
+      updateXlsxLinkWithFilter(jobId);
+      xlsxLink.classList.add("active");
+      if (searchXlsxLinkTop) {
+        searchXlsxLinkTop.href = `/jobs/${jobId}/search-xlsx`;
+        searchXlsxLinkTop.classList.add("active");
       }
-      if (data.status === "done") {
-        clearInterval(pollingTimer);
-        pollingTimer = null;
-        if (isSearchOnly && searchInfo) {
-          searchInfo.textContent = "Поиск: завершено";
-        } else {
-          updateQueueInfo("Очередь: завершено");
-        }
-        setFormLocked(false);
-        updateXlsxLinkWithFilter(jobId);
-        xlsxLink.classList.add("active");
-        if (searchXlsxLinkTop) {
-          searchXlsxLinkTop.href = `/jobs/${jobId}/search-xlsx`;
-          searchXlsxLinkTop.classList.add("active");
-        }
-        if (stopBtn) {
-          stopBtn.disabled = true;
-        }
+      if (stopBtn) {
+        stopBtn.disabled = true;
       }
-      if (data.status === "stopped") {
-        clearInterval(pollingTimer);
-        pollingTimer = null;
-        if (isSearchOnly && searchInfo) {
-          searchInfo.textContent = "Поиск: остановлено";
-        } else {
-          updateQueueInfo("Очередь: остановлено");
-        }
-        setFormLocked(false);
-        if (stopBtn) {
-          stopBtn.disabled = true;
-        }
+    }
+    if (data.status === "stopped") {
+      stopJobUpdates();
+      if (isSearchOnly && searchInfo) {
+        searchInfo.textContent = "Поиск: остановлено";
+      } else {
+        updateQueueInfo("Очередь: остановлено");
       }
-      if (data.search_done && jobId) {
-        updateXlsxLinkWithFilter(jobId);
-        xlsxLink.classList.add("active");
-        if (searchXlsxLinkTop) {
-          searchXlsxLinkTop.href = `/jobs/${jobId}/search-xlsx`;
-          searchXlsxLinkTop.classList.add("active");
-        }
+      setFormLocked(false);
+      if (stopBtn) {
+        stopBtn.disabled = true;
+      }
+    }
+    if (data.search_done && jobId) {
+      updateXlsxLinkWithFilter(jobId);
+      xlsxLink.classList.add("active");
+      if (searchXlsxLinkTop) {
+        searchXlsxLinkTop.href = `/jobs/${jobId}/search-xlsx`;
+        searchXlsxLinkTop.classList.add("active");
+      }
+    }
+  };
+
+  // Статус задачи — только счётчики и курсор, результаты догружаются с курсора.
+  let jobResults = [];
+  let ticking = false;
+
+  const fetchNewResults = async (cursor) => {
+    while (jobResults.length < cursor) {
+      const res = await fetch(`/jobs/${jobId}/results?since=${jobResults.length}`);
+      const page = await res.json();
+      if (!res.ok || !page.ok) {
+        return false;
+      }
+      jobResults = jobResults.concat(page.items || []);
+      if (!page.has_more) {
+        break;
+      }
+    }
+    return true;
+  };
+
+  // Очередь целиком — постранично; нужна только для списка ссылок после завершения задачи.
+  const fetchAllPending = async () => {
+    let items = [];
+    for (;;) {
+      const res = await fetch(`/jobs/${jobId}/pending?since=${items.length}&limit=5000`);
+      const page = await res.json();
+      if (!res.ok || !page.ok) {
+        return null;
+      }
+      items = items.concat(page.items || []);
+      if (!page.has_more) {
+        return items;
+      }
+    }
+  };
+
+  const tick = async () => {
+    if (ticking) {
+      return;
+    }
+    ticking = true;
+    try {
+      const res = await fetch(`/jobs/${jobId}`);
+      const data = await res.json();
+      if (!res.ok || !data.ok || !(await fetchNewResults(data.cursor || 0))) {
+        updateQueueInfo("Очередь: ошибка получения статуса");
+        xlsxLink.classList.remove("active");
+        return;
       }
+      const ended = data.status === "done" || data.status === "stopped";
+      const allPending = data.search_done && ended ? await fetchAllPending() : null;
+      applyJobState({ ...data, results: jobResults, all_pending_urls: allPending });
     } catch (err) {
       updateQueueInfo("Очередь: ошибка сети");
       xlsxLink.classList.remove("active");
+    } finally {
+      ticking = false;
+    }
+  };
+
+  const startPolling = () => {
+    if (!finished && !pollingTimer) {
+      pollingTimer = setInterval(tick, 2500);
     }
   };
 
+  // Полное состояние — один раз в начале и в конце (в конце — с очередью ссылок
+  // целиком), между ними изменения приходят потоком событий.
   await tick();
-  pollingTimer = setInterval(tick, 2500);
+  if (finished) {
+    return;
+  }
+  if (!window.EventSource) {
+    startPolling();
+    return;
+  }
+
+  const state = { results: jobResults.slice() };
+  let received = false;
+  let renderQueued = false;
+  const renderState = () => {
+    if (renderQueued) {
+      return;
+    }
+    renderQueued = true;
+    requestAnimationFrame(() => {
+      renderQueued = false;
+      // Итоговое состояние рисует tick() по событию end.
+      const ended = state.status === "done" || state.status === "stopped";
+      if (jobEvents === source && !finished && !ended) {
+        applyJobState(state);
+      }
+    });
+  };
+
+  const source = new EventSource(`/jobs/${jobId}/events?since=${state.results.length}`);
+  jobEvents = source;
+  source.addEventListener("state", (event) => {
+    received = true;
+    Object.assign(state, JSON.parse(event.data));
+    renderState();
+  });
+  source.addEventListener("results", (event) => {
+    received = true;
+    const chunk = JSON.parse(event.data);
+    state.results = state.results.slice(0, chunk.start).concat(chunk.items || []);
+    jobResults = state.results;
+    renderState();
+  });
+  source.addEventListener("end", () => {
+    source.close();
+    if (jobEvents === source) {
+      jobEvents = null;
+      tick();
+    }
+  });
+  source.onerror = () => {
+    // До первого события поток, скорее всего, недоступен (прокси, старый сервер) —
+    // возвращаемся к опросу. После — браузер переподключится сам с Last-Event-ID.
+    if (!received || source.readyState === EventSource.CLOSED) {
+      source.close();
+      if (jobEvents === source) {
+        jobEvents = null;
+        startPolling();
+      }
+    }
+  };
 };
 
 const runBatch = async () => {
@@ -0,0 +1,220 @@
+import gzip
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+from urllib.parse import quote
+
+import pytest
+
+import http_check
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures" / "http"
+PRODUCT_PATH = "/product/smartfon-tecno-spark-20-1234567890/"
+PRODUCT_URL = f"https://www.ozon.ru{PRODUCT_PATH}"
+API_PATH = f"/api/entrypoint-api.bx/page/json/v2?url={quote(PRODUCT_PATH)}"
+
+
+def fixture(name: str) -> str:
+    return (FIXTURES / name).read_text(encoding="utf-8")
+
+
+class RecordedOzon(ThreadingHTTPServer):
+    """
+    Локальная подмена Ozon: отдаёт записанные ответы по тем же путям, что и сайт.
+    """
+
+    daemon_threads = True
+
+    def reset(self) -> None:
+        self.routes: dict[str, tuple[int, str]] = {}  # путь с запросом → (статус, файл фикстуры)
+        self.requested: list[str] = []
+        self.encodings: list[str] = []
+        self.drops = 0  # столько первых запросов обрывается без ответа
+        self.delay = 0.0
+
+
+class RecordedHandler(BaseHTTPRequestHandler):
+    server: RecordedOzon
+
+    def do_GET(self) -> None:
+        server = self.server
+        server.requested.append(self.path)
+        if server.drops:
+            server.drops -= 1
+            self.close_connection = True
+            return
+        if server.delay:
+            time.sleep(server.delay)
+        status, name = server.routes.get(self.path, (404, ""))
+        body = fixture(name).encode("utf-8") if name else b""
+        encoding = "gzip" if "gzip" in (self.headers.get("Accept-Encoding") or "") else "identity"
+        if encoding == "gzip":
+            body = gzip.compress(body)
+        server.encodings.append(encoding)
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json" if name.endswith(".json") else "text/html")
+            if encoding == "gzip":
+                self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # Клиент уже ушёл по таймауту.
+            pass
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+@pytest.fixture(scope="module")
+def server():
+    server = RecordedOzon(("127.0.0.1", 0), RecordedHandler)
+    server.reset()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def ozon(server, monkeypatch):
+    """
+    HTTP-движок смотрит на локальный сервер; пул соединений создаётся заново.
+    """
+    server.reset()
+    monkeypatch.setattr(http_check, "HTTP_BASE_URL", f"http://127.0.0.1:{server.server_address[1]}")
+    monkeypatch.setattr(http_check, "HTTP_USE_API", True)
+    monkeypatch.setattr(http_check, "_HTTP", None)
+    return server
+
+
+def serve(
+    server: RecordedOzon,
+    api: Optional[str] = None,
+    page: Optional[str] = None,
+    api_status: int = 200,
+    page_status: int = 200,
+) -> None:
+    if api:
+        server.routes[API_PATH] = (api_status, api)
+    if page:
+        server.routes[PRODUCT_PATH] = (page_status, page)
+
+
+def test_widget_states_from_api():
+    states = http_check.widget_states_from_api(json.loads(fixture("api_label.json")))
+    assert set(states) == {"webMarketingLabels", "webCurrentSeller", "webProductHeading"}
+    assert states["webCurrentSeller"][0]["name"] == "Ozon"
+
+
+def test_widget_states_from_html():
+    states = http_check.widget_states_from_html(fixture("html_label.html"))
+    assert set(states) == {"webMarketingLabels", "webCurrentSeller", "webProductHeading"}
+    assert states["webMarketingLabels"][0]["items"][0]["text"] == "sim-карта TECNO в"
+
+
+def test_widget_states_from_captcha_is_empty():
+    assert http_check.widget_states_from_html(fixture("captcha.html")) == {}
+
+
+def test_labels_from_states():
+    states = http_check.widget_states_from_api(json.loads(fixture("api_label.json")))
+    present, text = http_check.labels_from_states(states)
+    assert present
+    # Иконка подарка без слова «подарок» в тексте дописывается как 🎁.
+    assert text == "sim-карта TECNO в 🎁"
+
+
+def test_labels_from_states_without_widget():
+    states = http_check.widget_states_from_api(json.loads(fixture("api_no_label.json")))
+    assert http_check.labels_from_states(states) == (False, "")
+
+
+def test_seller_from_states():
+    api_states = http_check.widget_states_from_api(json.loads(fixture("api_label.json")))
+    html_states = http_check.widget_states_from_html(fixture("html_label.html"))
+    assert http_check.seller_from_states(api_states) == "Ozon"
+    assert http_check.seller_from_states(html_states) == "Ozon"
+    no_seller = http_check.widget_states_from_api(json.loads(fixture("api_no_seller.json")))
+    assert http_check.seller_from_states(no_seller) is None
+
+
+def test_check_url_http_label_from_api(ozon):
+    serve(ozon, api="api_label.json")
+    result = http_check.check_url_http(PRODUCT_URL)
+    assert result is not None
+    assert result.ok and result.has_label
+    assert result.seller_name == "Ozon" and result.seller_ok is True
+    # Ответа API хватило — HTML-страница не запрашивалась.
+    assert ozon.requested == [API_PATH]
+
+
+def test_check_url_http_decodes_gzip(ozon):
+    serve(ozon, api="api_label.json")
+    assert http_check.check_url_http(PRODUCT_URL) is not None
+    assert ozon.encodings == ["gzip"]
+
+
+def test_check_url_http_no_label(ozon):
+    serve(ozon, api="api_no_label.json")
+    result = http_check.check_url_http(PRODUCT_URL)
+    assert result is not None
+    assert result.ok and not result.has_label
+    assert result.label_text == ""
+    assert result.seller_name == "ТехноМаркет" and result.seller_ok is False
+
+
+def test_check_url_http_falls_back_to_html(ozon):
+    serve(ozon, page="html_label.html")
+    result = http_check.check_url_http(PRODUCT_URL)
+    assert result is not None
+    assert result.has_label and result.seller_name == "Ozon"
+    assert ozon.requested == [API_PATH, PRODUCT_PATH]
+
+
+def test_check_url_http_falls_back_to_html_after_api_error(ozon):
+    serve(ozon, api="api_label.json", api_status=500, page="html_label.html")
+    result = http_check.check_url_http(PRODUCT_URL)
+    assert result is not None and result.has_label
+    assert ozon.requested == [API_PATH, PRODUCT_PATH]
+
+
+@pytest.mark.parametrize(
+    "api, page, page_status",
+    [
+        (None, "captcha.html", 200),  # капча вместо карточки
+        (None, "captcha.html", 403),  # капча с кодом 403
+        (None, "partial.html", 200),  # страница оборвалась: ни лейблов, ни основного контента
+        ("api_no_seller.json", None, 200),  # продавца в ответе нет
+        (None, None, 200),  # ни API, ни страницы (404)
+    ],
+)
+def test_check_url_http_ambiguous_returns_none(ozon, api, page, page_status):
+    serve(ozon, api=api, page=page, page_status=page_status)
+    assert http_check.check_url_http(PRODUCT_URL) is None
+
+
+def test_check_url_http_retries_dropped_connection(ozon):
+    serve(ozon, api="api_label.json")
+    ozon.drops = 1
+    result = http_check.check_url_http(PRODUCT_URL)
+    assert result is not None and result.has_label
+    assert ozon.requested == [API_PATH, API_PATH]
+
+
+def test_check_url_http_timeout_returns_none(ozon, monkeypatch):
+    monkeypatch.setattr(http_check, "HTTP_TIMEOUT_SEC", 0.2)
+    serve(ozon, api="api_label.json", page="html_label.html")
+    ozon.delay = 0.5
+    assert http_check.check_url_http(PRODUCT_URL) is None
+
+
+def test_check_url_http_rejects_non_product_url(ozon):
+    serve(ozon, api="api_label.json")
+    assert http_check.check_url_http("https://www.ozon.ru/category/smartfony-15502/") is None
+    assert ozon.requested == []
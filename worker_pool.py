@@ -0,0 +1,169 @@
+import multiprocessing
+import os
+import shutil
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.util import Finalize
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+
+from driver_pool import DriverPool
+from ozon_check import USER_DATA_DIR, CheckResult, check_url
+
+WORKERS = int(os.getenv("OZON_WORKERS", "1"))
+WORKER_PROFILE_ROOT = Path(
+    os.getenv("OZON_WORKER_PROFILE_ROOT", str(USER_DATA_DIR.with_name(f"{USER_DATA_DIR.name}_workers")))
+)
+WORKER_PROFILE_REFRESH = os.getenv("OZON_WORKER_PROFILE_REFRESH", "0") == "1"
+
+# Файлы блокировок и кэши Chrome не копируем: с ними клон не запустится или будет весить гигабайты.
+PROFILE_SKIP = (
+    "SingletonLock",
+    "SingletonSocket",
+    "SingletonCookie",
+    "lockfile",
+    "Cache",
+    "Code Cache",
+    "GPUCache",
+    "GrShaderCache",
+    "ShaderCache",
+    "Crashpad",
+)
+
+
+def worker_profile_dir(slot: int) -> Path:
+    return WORKER_PROFILE_ROOT / f"worker_{slot}"
+
+
+def clone_profile(master: Path, target: Path, refresh: bool = WORKER_PROFILE_REFRESH) -> Path:
+    """
+    Копия мастер-профиля (cookies, локальное хранилище) для отдельного воркера.
+    Существующий клон переиспользуется, пока не попросили обновить.
+    """
+    if target.exists():
+        if not refresh:
+            return target
+        shutil.rmtree(target, ignore_errors=True)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    if master.exists():
+        shutil.copytree(
+            master,
+            target,
+            ignore=shutil.ignore_patterns(*PROFILE_SKIP),
+            symlinks=True,
+            ignore_dangling_symlinks=True,
+        )
+    else:
+        target.mkdir(parents=True, exist_ok=True)
+    return target
+
+
+# ----- состояние внутри процесса-воркера -----
+_WORKER_POOL: Optional[DriverPool] = None
+
+
+def _init_worker(slots: "multiprocessing.Queue[int]") -> None:
+    global _WORKER_POOL
+    slot = slots.get()
+    _WORKER_POOL = DriverPool(size=1, user_data_dir=worker_profile_dir(slot))
+    # atexit в дочерних процессах multiprocessing не вызывается, Finalize — вызывается.
+    Finalize(_WORKER_POOL, _WORKER_POOL.shutdown, exitpriority=10)
+
+
+def _check_in_worker(url: str, block_profile: Optional[str] = None) -> CheckResult:
+    if _WORKER_POOL is None:
+        return check_url(url, block_profile=block_profile)
+    with _WORKER_POOL.lease() as driver:
+        return check_url(url, driver=driver, block_profile=block_profile)
+
+
+class CheckWorkers:
+    """
+    Процессы-воркеры для параллельной проверки карточек. Каждый процесс держит свой
+    Chrome на своём клоне профиля, поэтому конфликтов user-data-dir нет.
+    """
+
+    def __init__(self, workers: int = WORKERS, master_profile: Path = USER_DATA_DIR):
+        self.workers = max(1, int(workers))
+        self.master_profile = Path(master_profile)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 1
+
+    def _ensure_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is not None:
+                return self._executor
+            for slot in range(self.workers):
+                clone_profile(self.master_profile, worker_profile_dir(slot))
+            ctx = multiprocessing.get_context()
+            slots = ctx.Queue()
+            for slot in range(self.workers):
+                slots.put(slot)
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=ctx,
+                initializer=_init_worker,
+                initargs=(slots,),
+            )
+            return self._executor
+
+    def _reset(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def imap(
+        self,
+        urls: list[str],
+        is_cancelled: Callable[[], bool],
+        on_start: Optional[Callable[[str], None]] = None,
+        block_profile: Optional[str] = None,
+    ) -> Iterator[tuple[str, Optional[CheckResult], Optional[str]]]:
+        executor = self._ensure_executor()
+        pending = iter(urls)
+        in_flight: dict[Future, str] = {}
+        # Небольшой запас задач, чтобы воркеры не простаивали, но стоп срабатывал быстро.
+        window = self.workers * 2
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(in_flight) < window and not is_cancelled():
+                    url = next(pending, None)
+                    if url is None:
+                        exhausted = True
+                        break
+                    if on_start:
+                        on_start(url)
+                    in_flight[executor.submit(_check_in_worker, url, block_profile)] = url
+                if not in_flight or is_cancelled():
+                    return
+                done, _ = wait(list(in_flight), timeout=1.0, return_when=FIRST_COMPLETED)
+                broken = False
+                for future in done:
+                    url = in_flight.pop(future)
+                    try:
+                        yield url, future.result(), None
+                    except BrokenProcessPool as e:
+                        broken = True
+                        yield url, None, str(e)
+                    except Exception as e:
+                        yield url, None, str(e)
+                if broken:
+                    # Процесс с Chrome упал — поднимаем пул заново для оставшихся ссылок.
+                    self._reset()
+                    executor = self._ensure_executor()
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)